@@ -28,4 +28,11 @@ for ref in index_tables_guide sql_patterns use_cases clinical_data_guide cloud_s
     fi
 done
 
+# Optionally build derived dataset artifacts (columnar copies, indexes, ...) next to the local datasets.
+# Runs in the background so it never delays startup; builders skip anything whose sources are unchanged.
+if [ "${BIOME_BUILD_DATASETS:-false}" = "true" ]; then
+    echo "Building derived dataset artifacts in the background (log: /tmp/biome-datasets-build.log)..."
+    python -m biome.datasets build > /tmp/biome-datasets-build.log 2>&1 &
+fi
+
 exec python -m beaker_kernel.service.server --ip 0.0.0.0
@@ -1,25 +1,89 @@
+import importlib.metadata
 import logging
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable, Optional, TypedDict
 
+import yaml
 from adhoc_api.loader import load_yaml_api
-from adhoc_api.tool import AdhocApi, ensure_name_slug_compatibility
+from adhoc_api.tool import AdhocApi, QueryType, ensure_name_slug_compatibility
 from adhoc_api.uaii import gpt_41, o3_mini
+from jinja2 import Environment, nodes
+from jinja2.ext import Extension
+
+from .shared.openapi import COMPACT_VERSION, compact_attachments
+from .shared.profiles import profiles_section, referenced_summaries, summaries_of
+from .shared.ranking import ExampleIndex, example_limits
+from .shared.retrieval import DocumentIndex, RetrievingDrafter, retrieval_top_k, split_attachments
+from .shared.semantic_cache import SemanticCache, annotate, integration_words
+from .shared.spec_cache import load_cached, load_summary
 
 logger = logging.getLogger(__name__)
 DATASOURCES_FOLDER = os.environ.get("BIOME_INTEGRATIONS_DIR", "../src/biome/datasources/")
+DEFAULT_LOAD_WORKERS = 8
+# Part of the spec cache key; bump it when `load_spec` changes what it produces for the same files.
+LOADER_VERSION = 2
+
+
+class LoadTiming(TypedDict, total=False):
+    """How one integration loaded: in `total` seconds, from the spec cache or not, or failing with `error`."""
+    integration: str
+    cached: bool
+    error: str
+    total: float
+
+
+# Per-integration timings of the last `fetch_spec_handles` call, in directory order.
+LOAD_TIMINGS: list[LoadTiming] = []
+
+
+@dataclass
+class SpecHandle:
+    """An integration whose spec (documentation, attachments, examples) is only loaded the first time it is needed."""
+    directory: Path
+    data_dir: Path | str
+    salt: str
+    summary: dict
+    key: str = ""
+    _spec: Optional[dict] = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def slug(self) -> str:
+        return self.summary["slug"]
 
+    def stub(self) -> dict:
+        """What the `AdhocApi` holds until the integration is consulted: enough to list it."""
+        return {**self.summary, "documentation": ""}
 
-def fetch_specs():
+    def load(self) -> dict:
+        with self._lock:
+            if self._spec is None:
+                api_spec, _ = load_cached(self.directory, lambda path: load_spec(path, self.data_dir), salt=self.salt)
+                if self.data_dir:
+                    api_spec["documentation"] += profile_documentation(api_spec["documentation"], self.data_dir)
+                self._spec = api_spec
+            return self._spec
+
+
+def datasource_root() -> Path:
     if DATASOURCES_FOLDER == "":
         raise ValueError(
             "No BIOME_INTEGRATION_DIR set. "
             "Please set the environment variable of where the integrations reside."
         )
+    return (Path(__file__).resolve().parent.parent / DATASOURCES_FOLDER).resolve()
 
-    datasource_root = (Path(__file__).resolve().parent.parent / DATASOURCES_FOLDER).resolve()
 
+def get_data_dir() -> Path | str:
     data_dir_raw = os.environ.get("BIOME_DATA_DIR", "../data")
+    # "" when the folder doesn't exist, so data file paths in the specifications stay relative
+    data_dir: Path | str
     try:
         data_dir = Path(data_dir_raw).resolve(strict=True)
         logger.info("Using data_dir", extra={"data_dir": data_dir})
@@ -29,11 +93,26 @@ def fetch_specs():
             "Failed to set biome data dir",
             extra={"data_dir_raw": data_dir_raw, "exception": e}
         )
+    return data_dir
+
+
+def load_handle(datasource_full_path: Path, data_dir: Path | str) -> tuple[SpecHandle, bool]:
+    """
+    The handle of one integration folder, and whether its spec was already cached. A changed integration is
+    parsed (and cached) here, so errors in it surface when it is (re)loaded rather than on first use.
+    """
+    salt = f"{loader_version()}|{LOADER_VERSION}|{COMPACT_VERSION}|{data_dir}"
+    summary, key, cached = load_summary(datasource_full_path, lambda path: load_spec(path, data_dir), salt=salt)
+    return SpecHandle(directory=datasource_full_path, data_dir=data_dir, salt=salt, summary=summary, key=key), cached
 
-    api_specs = []
 
-    for datasource_dir in os.listdir(datasource_root):
-        datasource_full_path = datasource_root / datasource_dir
+def fetch_spec_handles() -> list[SpecHandle]:
+    root = datasource_root()
+    data_dir = get_data_dir()
+
+    datasource_dirs = []
+    for datasource_dir in sorted(os.listdir(root)):
+        datasource_full_path = root / datasource_dir
         if datasource_dir == ".ipynb_checkpoints":
             Path.rmdir(datasource_full_path)
 
@@ -42,40 +121,352 @@ def fetch_specs():
             if not api_yaml.is_file():
                 logger.warning("Ignoring malformed API:", extra={"API": api_yaml})
                 continue
-            api_spec = load_yaml_api(api_yaml)
-            ensure_name_slug_compatibility(api_spec)
-            api_spec["documentation"] = api_spec["documentation"].replace(
-                "{DATASET_FILES_BASE_PATH}",
-                str(data_dir)
-            )
-            api_spec["documentation"] = api_spec["documentation"].replace(
-                "{{DATASET_FILES_BASE_PATH}}",
-                str(data_dir)
-            )
-            if "examples" in api_spec and isinstance(api_spec["examples"], list):
-                for example in api_spec["examples"]:
-                    if "code" in example and isinstance(example["code"], str):
-                        example["code"] = example["code"].replace(
-                            "{{DATASET_FILES_BASE_PATH}}",
-                            str(data_dir)
-                        )
-                        example["code"] = example["code"].replace(
-                            "{DATASET_FILES_BASE_PATH}",
-                            str(data_dir)
-                        )
-            api_specs.append(api_spec)
-    return api_specs
+            datasource_dirs.append(datasource_full_path)
+
+    def load(datasource_full_path: Path) -> tuple[Optional[SpecHandle], LoadTiming]:
+        timing: LoadTiming = {"integration": datasource_full_path.name}
+        started = time.perf_counter()
+        try:
+            handle, timing["cached"] = load_handle(datasource_full_path, data_dir)
+        except Exception as e:
+            # one broken integration should not keep the others from being served
+            logger.error(f"Failed to load integration `{datasource_full_path.name}`: {e.__class__.__name__}: {e}")
+            handle, timing["error"] = None, str(e)
+        timing["total"] = time.perf_counter() - started
+        return handle, timing
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=load_workers()) as executor:
+        # map() keeps the directory order, whichever integration finishes first
+        results = list(executor.map(load, datasource_dirs))
+    LOAD_TIMINGS[:] = [timing for _, timing in results]
+    log_load_timings(LOAD_TIMINGS, time.perf_counter() - started)
+    return [handle for handle, _ in results if handle is not None]
+
+
+def fetch_specs() -> list[dict]:
+    """Every integration's spec, fully loaded."""
+    handles = fetch_spec_handles()
+    with ThreadPoolExecutor(max_workers=load_workers()) as executor:
+        return list(executor.map(SpecHandle.load, handles))
+
+
+def load_workers() -> int:
+    return max(1, int(os.environ.get("BIOME_SPEC_LOAD_WORKERS", DEFAULT_LOAD_WORKERS)))
+
+
+def log_load_timings(timings: list[LoadTiming], elapsed: float) -> None:
+    """Log how long each integration took to load, slowest first."""
+    lines = [f"Loaded {sum('error' not in timing for timing in timings)}/{len(timings)} integrations in {elapsed:.2f}s"]
+    for timing in sorted(timings, key=lambda timing: timing["total"], reverse=True):
+        if "error" in timing:
+            status = f"failed: {timing['error']}"
+        else:
+            status = "cached" if timing["cached"] else "parsed"
+        lines.append(f"  {timing['integration']:<40} {timing['total']:8.3f}s  ({status})")
+    logger.info("\n".join(lines))
+
+
+def loader_version() -> str:
+    try:
+        return importlib.metadata.version("adhoc-api")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class DatafileExtension(Extension):
+    """`{% file <path> %}`: the path of a data file under the environment's `data_dir`, like the kernel's tag."""
+    tags = {"file"}
+
+    def __init__(self, environment: Environment):
+        super().__init__(environment)
+        environment.extend(data_dir="")
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = []
+        while parser.stream.current.type != "block_end":
+            parts.append(str(next(parser.stream).value))
+        relative = "".join(parts)
+        data_dir = self.environment.data_dir  # type: ignore[attr-defined]
+        return nodes.Output([nodes.Const(str(Path(data_dir) / relative) if data_dir else relative)]).set_lineno(lineno)
 
-def initialize_adhoc():
-    specs = fetch_specs()
 
+def load_resource_spec(datasource_dir: Path, raw: dict, data_dir) -> dict:
+    """
+    An `api.yaml` in the kernel's format, rendered the way the kernel renders it: the documentation is the Jinja
+    `source`, with file resources (read from `attachments/`) substituted by name, and the examples are resources.
+    With `compact_openapi: true`, OpenAPI attachments are substituted by their compact summary (see `shared/openapi.py`),
+    and with `retrieval`, large attachments by a placeholder, their chunks going under `retrieval` for `LazyAdhocApi`
+    to attach to each request (see `shared/retrieval.py`).
+    """
+    filepaths = {
+        resource["name"]: resource["filepath"]
+        for resource in (raw.get("resources") or {}).values()
+        if resource.get("resource_type") == "file" and resource.get("filepath") is not None
+    }
+    attachments = {name: datasource_dir / "attachments" / filepath for name, filepath in filepaths.items()}
+    substitutions = {name: path.read_text() for name, path in attachments.items()}
+    if raw.get("compact_openapi"):
+        substitutions.update(compact_attachments(attachments, raw.get("slug") or datasource_dir.name))
+    retrieval = None
+    if raw.get("retrieval"):
+        placeholders, chunks = split_attachments({name: (filepaths[name], text) for name, text in substitutions.items()})
+        substitutions.update(placeholders)
+        if chunks:
+            retrieval = {"chunks": chunks, "top_k": retrieval_top_k(raw["retrieval"])}
+    environment = Environment(extensions=[DatafileExtension])
+    environment.data_dir = str(data_dir)  # type: ignore[attr-defined]
+    examples = [
+        {
+            "query": resource["query"],
+            "code": environment.from_string(resource["code"]).render(substitutions),
+            "notes": resource.get("notes") or "",
+        }
+        for resource in (raw.get("resources") or {}).values()
+        if resource.get("resource_type") == "example"
+    ]
+    api_spec = {
+        "name": raw["name"],
+        "slug": raw.get("slug"),
+        "cache_key": f"biome_{raw.get('slug') or datasource_dir.name}",
+        "description": raw.get("description") or "",
+        "documentation": environment.from_string(raw["source"]).render(substitutions),
+        "examples": examples,
+    }
+    if retrieval is not None:
+        api_spec["retrieval"] = retrieval
+    return api_spec
+
+
+def load_spec(datasource_dir: Path, data_dir) -> dict:
+    """
+    Parse an integration's `api.yaml` with its attachments and fill in the dataset paths. Both adhoc-api's format (a
+    `documentation` field) and the kernel's (a `source` template over resources) are read.
+    """
+    raw = yaml.safe_load((datasource_dir / "api.yaml").read_text())
+    if isinstance(raw, dict) and "documentation" not in raw and "source" in raw:
+        api_spec = load_resource_spec(datasource_dir, raw, data_dir)
+    else:
+        api_spec = load_yaml_api(datasource_dir / "api.yaml")
+    ensure_name_slug_compatibility(api_spec)
+    api_spec["documentation"] = api_spec["documentation"].replace(
+        "{DATASET_FILES_BASE_PATH}",
+        str(data_dir)
+    )
+    api_spec["documentation"] = api_spec["documentation"].replace(
+        "{{DATASET_FILES_BASE_PATH}}",
+        str(data_dir)
+    )
+    if "examples" in api_spec and isinstance(api_spec["examples"], list):
+        for example in api_spec["examples"]:
+            if "code" in example and isinstance(example["code"], str):
+                example["code"] = example["code"].replace(
+                    "{{DATASET_FILES_BASE_PATH}}",
+                    str(data_dir)
+                )
+                example["code"] = example["code"].replace(
+                    "{DATASET_FILES_BASE_PATH}",
+                    str(data_dir)
+                )
+    return api_spec
+
+
+def profile_documentation(documentation: str, data_dir: Path | str) -> str:
+    """
+    Profile summaries (`<file>.profile.md`, written by `python -m biome.datasets build profiles`)
+    of the data files or folders the documentation references, with `{% file %}` like the kernel or by their path.
+    """
+    data_dir = Path(data_dir)
+    summaries = referenced_summaries(documentation, resolve=lambda relative: data_dir / relative)
+    # specifications that spell out `{DATASET_FILES_BASE_PATH}/...` instead
+    for match in re.finditer(re.escape(str(data_dir)) + r"/([\w./-]+)", documentation):
+        summaries.extend(path for path in summaries_of(data_dir / match.group(1).rstrip("./")) if path not in summaries)
+    return profiles_section(summaries)
+
+class LazyAdhocApi(AdhocApi):
+    """
+    `AdhocApi` over spec handles. Integrations are listed from their summaries, and an integration's
+    documentation and examples are loaded the first time it is consulted, then kept.
+
+    Handles can be swapped in and out while requests are being served (see `reload.py`): a request that already
+    holds a drafter agent finishes with it, and the next request gets an agent for the new spec.
+
+    The curator only picks from the examples most relevant to the request (see `shared/ranking.py`), integrations with
+    `retrieval` get the documentation sections relevant to each request (see `shared/retrieval.py`), and rephrasings of
+    earlier requests are answered from the `SemanticCache`.
+    """
+    def __init__(self, *, handles: list[SpecHandle], **kwargs):
+        self.handles = {handle.slug: handle for handle in handles}
+        self.loaded: set[str] = set()
+        self.agents: dict = {}
+        self.indexes: dict[str, DocumentIndex] = {}
+        self.example_indexes: dict[str, ExampleIndex] = {}
+        # the request the examples of this thread's current curator step are ranked against
+        self.curating = threading.local()
+        self.semantic_cache = SemanticCache.from_env()
+        # the type, request, context-free form and cache match of the request this thread is answering
+        self.answering = threading.local()
+        self.lock = threading.RLock()
+        super().__init__(apis=[handle.stub() for handle in handles], **kwargs)
+
+    def _get_api(self, api: str):
+        handle = self.handles.get(api)
+        if handle is not None and api not in self.loaded:
+            # loaded outside the lock, so a slow integration does not hold up the others
+            spec = dict(handle.load())
+            # adhoc-api does not accept extra fields
+            retrieval = spec.pop("retrieval", None)
+            index = DocumentIndex(**retrieval) if retrieval else None
+            example_index = ExampleIndex(spec["examples"]) if spec.get("examples") else None
+            with self.lock:
+                if self.handles.get(api) is handle and api not in self.loaded:
+                    # add_api also picks the drafter model again, now that the documentation size is known
+                    self.add_api({**spec, "slug": api})
+                    if index is not None:
+                        self.indexes[api] = index
+                    if example_index is not None:
+                        self.example_indexes[api] = example_index
+                    self.loaded.add(api)
+        spec, config = super()._get_api(api)
+        query = getattr(self.curating, "query", None)
+        if query is not None and (example_index := self.example_indexes.get(api)) is not None:
+            spec = {**spec, "examples": example_index.select(query, *example_limits())}
+        return spec, config
+
+    def _curate(self, find, api: str, query: str):
+        """Run a curator step over only the examples most relevant to the query."""
+        self.curating.query = query
+        try:
+            return find(api, query)
+        finally:
+            self.curating.query = None
+
+    def _ignored_words(self, api: str) -> frozenset:
+        spec, _ = self.apis.get(api, ({}, None))
+        return integration_words(api, spec)
+
+    def answer(
+        self, call, api: str, query: str, read_cache: bool = True, store_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> tuple[str, Optional[str]]:
+        """
+        The result of `call(api, query)` (`ask_api` or `use_api`), and the earlier request whose cached answer it is,
+        if it came from the semantic cache. `on_token` is called with each piece of the drafter's output as it is
+        generated.
+        """
+        self.answering.read_cache, self.answering.store_cache, self.answering.on_token = read_cache, store_cache, on_token
+        try:
+            return call(api, query), getattr(self.answering, "matched", None)
+        finally:
+            self.answering.read_cache, self.answering.store_cache, self.answering.on_token = True, True, None
+
+    def _api_draft_helper(self, api: str, query: str, type: QueryType) -> str:
+        self.answering.type, self.answering.context_free, self.answering.matched = type, None, None
+        self.answering.request = query
+        try:
+            response = super()._api_draft_helper(api, query, type)
+            if self.answering.matched is not None:
+                return annotate(response, self.answering.matched, code=type == QueryType.WRITE_CODE)
+            if self.semantic_cache is not None and self.answering.context_free is not None and getattr(self.answering, "store_cache", True):
+                self.semantic_cache.store(api, type.value, self.answering.context_free, response, self._ignored_words(api))
+            return response
+        finally:
+            self.answering.type = self.answering.request = self.answering.context_free = None
+
+    def _answered_request(self) -> Optional[str]:
+        """The request this thread is answering, context-free once the contextualizer has run."""
+        return getattr(self.answering, "context_free", None) or getattr(self.answering, "request", None)
+
+    def _find_perfect_example(self, api: str, query: str):
+        # the first step given the context-free request; a cached answer is returned the way a perfect example is
+        self.answering.context_free = query
+        type = getattr(self.answering, "type", None)
+        if self.semantic_cache is not None and type is not None and getattr(self.answering, "read_cache", True):
+            if (cached := self.semantic_cache.lookup(api, type.value, query, self._ignored_words(api))) is not None:
+                self.answering.matched = cached.query
+                self.logger.info(f'Reusing the answer to the similar request "{cached.query}" for "{query}"')
+                return cached.response
+        return self._curate(super()._find_perfect_example, api, query)
+
+    def _find_relevant_examples(self, api: str, query: str):
+        return self._curate(super()._find_relevant_examples, api, query)
+
+    def _get_agent(self, api: str):
+        # per instance and per integration (instead of `@cache`), so a replaced integration gets a new agent
+        if (agent := self.agents.get(api)) is None:
+            handle = self.handles.get(api)
+            agent = AdhocApi._get_agent.__wrapped__(self, api)
+            if (index := self.indexes.get(api)) is not None:
+                agent = RetrievingDrafter(agent, index, request=self._answered_request)
+            with self.lock:
+                # if replaced while the agent was being made, this request still gets it, but it is not kept
+                if self.handles.get(api) is handle:
+                    agent = self.agents.setdefault(api, agent)
+        if (on_token := getattr(self.answering, "on_token", None)) is not None:
+            return StreamingDrafter(agent, on_token)
+        return agent
+
+    def replace(self, handle: SpecHandle) -> None:
+        """Serve `handle` under its slug from the next request on."""
+        with self.lock:
+            self.handles[handle.slug] = handle
+            self.loaded.discard(handle.slug)
+            self.agents.pop(handle.slug, None)
+            self.indexes.pop(handle.slug, None)
+            self.example_indexes.pop(handle.slug, None)
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear(handle.slug)
+            self.add_api(handle.stub())
+
+    def remove(self, slug: str) -> None:
+        with self.lock:
+            self.handles.pop(slug, None)
+            self.loaded.discard(slug)
+            self.agents.pop(slug, None)
+            self.indexes.pop(slug, None)
+            self.example_indexes.pop(slug, None)
+            self.apis.pop(slug, None)
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear(slug)
+
+
+class StreamingDrafter:
+    """A drafter agent that passes each piece of its answers to `on_token` as it is generated."""
+
+    def __init__(self, agent, on_token: Callable[[str], None]):
+        self.agent = agent
+        self.on_token = on_token
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    def message(self, query: str, **kwargs) -> str:
+        chunks = []
+        for chunk in self.agent.message(query, stream=True, **kwargs):
+            chunks.append(chunk)
+            self.on_token(chunk)
+        return "".join(chunks)
+
+
+def model_configs() -> dict:
+    """The model configuration of each agent role."""
     curator_config = {**o3_mini, 'api_key': os.environ.get("OPENAI_API_KEY")}
     gpt_41_config = {**gpt_41, 'api_key': os.environ.get("OPENAI_API_KEY")}
+    return {
+        "drafter": [gpt_41_config],
+        "curator": curator_config,
+        "contextualizer": gpt_41_config,
+    }
+
 
+def initialize_adhoc():
+    handles = fetch_spec_handles()
+    configs = model_configs()
 
-    return AdhocApi(
-        apis=specs,
-        drafter_config=[gpt_41_config],
-        curator_config=curator_config,
-        contextualizer_config=gpt_41_config
+    return LazyAdhocApi(
+        handles=handles,
+        drafter_config=configs["drafter"],
+        curator_config=configs["curator"],
+        contextualizer_config=configs["contextualizer"]
     )
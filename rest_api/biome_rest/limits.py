@@ -0,0 +1,114 @@
+"""
+Bounded concurrency for the specialist agent endpoints.
+
+The agent calls (`ask_api`, `use_api`) block for as long as the LLM takes to answer, so they run on a dedicated
+thread pool instead of FastAPI's shared one, behind two asyncio semaphores: one per integration
+(`BIOME_MAX_CONCURRENT_PER_INTEGRATION`) and one per LLM provider of the integration's drafter
+(`BIOME_MAX_CONCURRENT_PER_PROVIDER`). Requests over the limits wait in line, up to
+`BIOME_MAX_QUEUED_PER_INTEGRATION` per integration and `BIOME_QUEUE_TIMEOUT` seconds; past either they are
+rejected with `Busy`, which the endpoints turn into a 429 with a `Retry-After` estimated from recent call durations.
+"""
+import asyncio
+import functools
+import math
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable
+
+DEFAULT_PER_INTEGRATION = 4
+DEFAULT_PER_PROVIDER = 16
+DEFAULT_QUEUED_PER_INTEGRATION = 16
+DEFAULT_QUEUE_TIMEOUT = 30.0
+# Assumed duration of an agent call until one has been measured, and the weight of each new measurement.
+INITIAL_DURATION = 30.0
+DURATION_SMOOTHING = 0.3
+
+
+class Busy(Exception):
+    """An agent call was rejected because its integration or provider is at capacity."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AgentLimiter:
+    def __init__(
+        self,
+        per_integration: int = DEFAULT_PER_INTEGRATION,
+        per_provider: int = DEFAULT_PER_PROVIDER,
+        queued_per_integration: int = DEFAULT_QUEUED_PER_INTEGRATION,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+    ):
+        self.per_integration = per_integration
+        self.per_provider = per_provider
+        self.queued_per_integration = queued_per_integration
+        self.queue_timeout = queue_timeout
+        self.integration_slots: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_integration))
+        self.provider_slots: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_provider))
+        # requests holding or waiting for a slot, per integration
+        self.pending: dict[str, int] = defaultdict(int)
+        self.durations: dict[str, float] = defaultdict(lambda: INITIAL_DURATION)
+        # the semaphores bound how many of these threads are busy at once
+        self.executor = ThreadPoolExecutor(max_workers=per_provider * 4, thread_name_prefix="agent")
+
+    @classmethod
+    def from_env(cls) -> "AgentLimiter":
+        return cls(
+            per_integration=max(1, int(os.environ.get("BIOME_MAX_CONCURRENT_PER_INTEGRATION") or DEFAULT_PER_INTEGRATION)),
+            per_provider=max(1, int(os.environ.get("BIOME_MAX_CONCURRENT_PER_PROVIDER") or DEFAULT_PER_PROVIDER)),
+            queued_per_integration=max(0, int(os.environ.get("BIOME_MAX_QUEUED_PER_INTEGRATION") or DEFAULT_QUEUED_PER_INTEGRATION)),
+            queue_timeout=float(os.environ.get("BIOME_QUEUE_TIMEOUT") or DEFAULT_QUEUE_TIMEOUT),
+        )
+
+    def retry_after(self, integration: str) -> int:
+        """Seconds until the requests ahead in line for `integration` are likely done."""
+        waiting = self.pending[integration] + 1 - self.per_integration
+        return max(1, math.ceil(self.durations[integration] * max(1.0, waiting / self.per_integration)))
+
+    @asynccontextmanager
+    async def slot(self, integration: str, provider: str):
+        """Hold a slot for `integration` and `provider` for the duration of the block, or raise `Busy`."""
+        integration_slots = self.integration_slots[integration]
+        provider_slots = self.provider_slots[provider]
+        if self.pending[integration] >= self.per_integration + self.queued_per_integration:
+            raise Busy(f"Too many requests waiting for `{integration}`.", self.retry_after(integration))
+
+        async def acquire():
+            # always in this order, so two requests never wait on each other's slot
+            await integration_slots.acquire()
+            try:
+                await provider_slots.acquire()
+            except BaseException:
+                integration_slots.release()
+                raise
+
+        self.pending[integration] += 1
+        try:
+            try:
+                await asyncio.wait_for(acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise Busy(f"Timed out waiting for a free `{integration}` ({provider}) agent.", self.retry_after(integration))
+            try:
+                yield
+            finally:
+                provider_slots.release()
+                integration_slots.release()
+        finally:
+            self.pending[integration] -= 1
+
+    async def run(self, integration: str, provider: str, call: Callable, *args):
+        """Run the blocking `call(*args)` on the agent thread pool once a slot is free."""
+        async with self.slot(integration, provider):
+            started = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(call, *args))
+            finally:
+                duration = time.perf_counter() - started
+                self.durations[integration] += DURATION_SMOOTHING * (duration - self.durations[integration])
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
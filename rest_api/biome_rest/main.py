@@ -1,21 +1,146 @@
-from typing import Annotated
+import asyncio
+import json
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Annotated, Optional
 
-from fastapi import FastAPI, HTTPException, Body, Query, Path
+from fastapi import FastAPI, HTTPException, Body, Header, Query, Path, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from .integrations import initialize_adhoc
+from .integrations import initialize_adhoc, model_configs
+from .limits import AgentLimiter, Busy
+from .reload import watch_integrations, watching_enabled
+from .response_cache import ResponseCache, cache_directives, model_names
 
 integrations = initialize_adhoc()
-app = FastAPI()
+limiter = AgentLimiter.from_env()
+response_cache = ResponseCache.from_env()
+CACHED_MODELS = model_names(model_configs())
+
+CacheControlHeader = Annotated[
+    Optional[str],
+    Header(description="`no-cache` to ask the specialist agent again instead of returning a cached response, `no-store` to also not cache its response.")
+]
+# Seconds between comments sent on an idle event stream, so proxies and clients don't time it out.
+KEEP_ALIVE_INTERVAL = 15
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_watching = threading.Event()
+    if watching_enabled():
+        watch_integrations(integrations, stop_watching)
+    yield
+    stop_watching.set()
+    limiter.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 def raise_on_invalid_integration(integration: str) -> None:
-    if integration not in [
-            integration_data["slug"]
-            for (integration_data, _) in integrations.apis.values()
-        ]:
+    # `apis` is keyed by slug, and may change under us when integrations are reloaded
+    if integration not in integrations.apis:
         raise HTTPException(status_code=403, detail=f"The requested integration `{integration}` does not exist.")
 
+
+def response_key(endpoint: str, integration: str, query: str) -> str:
+    handle = integrations.handles.get(integration)
+    return response_cache.key(endpoint, integration, query, handle.key if handle else "", CACHED_MODELS)
+
+
+async def run_agent(
+    endpoint: str, integration: str, call, query: str, cache_control: Optional[str], response: Response,
+) -> tuple[str, Optional[str]]:
+    """
+    The cached response to the query (see `response_cache.py`), or the result of the agent call, made within the
+    integration's and provider's concurrency limits (see `limits.py`). The second value is the earlier request whose
+    answer was reused, when the query was a near duplicate of it (see `shared/semantic_cache.py`).
+    """
+    directives = cache_directives(cache_control)
+    key = response_key(endpoint, integration, query)
+    # SQLite blocks, so the cache is read and written off the event loop
+    cached = None if directives & {"no-cache", "no-store"} else await asyncio.to_thread(response_cache.get, key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        response.headers["Age"] = str(int(time.time() - cached.created))
+        return cached.response, None
+
+    _, drafter_config = integrations.apis.get(integration, ({}, {}))
+    try:
+        result, matched = await limiter.run(
+            integration, drafter_config.get("provider", ""), integrations.answer, call, integration, query,
+            not directives & {"no-cache", "no-store"}, "no-store" not in directives,
+        )
+    except Busy as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if matched is not None:
+        response.headers["X-Cache"] = "similar"
+        return result, matched
+    if "no-store" not in directives:
+        await asyncio.to_thread(response_cache.put, key, endpoint, integration, query, result)
+    response.headers["X-Cache"] = "miss"
+    return result, None
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_agent(endpoint: str, integration: str, call, query: str, cache_control: Optional[str]):
+    """
+    `run_agent` as server-sent events: a `token` event with each piece of the drafter's answer as it is generated,
+    then a `complete` event with the whole response, or an `error` event. Cached responses only get the `complete` event.
+    """
+    directives = cache_directives(cache_control)
+    key = response_key(endpoint, integration, query)
+    cached = None if directives & {"no-cache", "no-store"} else await asyncio.to_thread(response_cache.get, key)
+    if cached is not None:
+        yield sse("complete", {"response": cached.response, "matched_query": None, "cache": "hit"})
+        return
+
+    loop = asyncio.get_running_loop()
+    tokens: asyncio.Queue[str] = asyncio.Queue()
+    def on_token(text: str) -> None:
+        # called on the agent thread
+        loop.call_soon_threadsafe(tokens.put_nowait, text)
+
+    _, drafter_config = integrations.apis.get(integration, ({}, {}))
+    task = asyncio.ensure_future(limiter.run(
+        integration, drafter_config.get("provider", ""), integrations.answer, call, integration, query,
+        not directives & {"no-cache", "no-store"}, "no-store" not in directives, on_token,
+    ))
+    try:
+        while not task.done():
+            next_token = asyncio.ensure_future(tokens.get())
+            done, _ = await asyncio.wait({next_token, task}, timeout=KEEP_ALIVE_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            if next_token in done:
+                yield sse("token", {"text": next_token.result()})
+                continue
+            next_token.cancel()
+            if not done:
+                yield ": keep-alive\n\n"
+        while not tokens.empty():
+            yield sse("token", {"text": tokens.get_nowait()})
+        result, matched = task.result()
+    except Busy as e:
+        yield sse("error", {"status": 429, "detail": str(e), "retry_after": e.retry_after})
+        return
+    except Exception as e:
+        yield sse("error", {"status": 503, "detail": str(e)})
+        return
+    finally:
+        if not task.done():
+            # the client went away; the agent call can't be interrupted, so it holds its slot until it ends
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    if matched is None and "no-store" not in directives:
+        await asyncio.to_thread(response_cache.put, key, endpoint, integration, query, result)
+    yield sse("complete", {"response": result, "matched_query": matched, "cache": "similar" if matched else "miss"})
+
 ListIntegrationsOutput = Annotated[
     dict[str, dict[str, str]],
     Body(
@@ -53,11 +178,12 @@ def list_integrations() -> ListIntegrationsOutput:
     return {
         slug: {
             integration_data.get('name', integration_data["slug"]): integration_data["description"]
-        } for slug, (integration_data, _) in integrations.apis.items()
+        } for slug, (integration_data, _) in list(integrations.apis.items())
     }
 
 class IntegrationDocumentationOutput(BaseModel):
     response: str
+    matched_query: Optional[str] = None
     model_config = {
         "json_schema_extra": {
             "examples": [
@@ -69,7 +195,7 @@ class IntegrationDocumentationOutput(BaseModel):
     }
 
 @app.get("/consult_integration_documentation/{integration}")
-def consult_integration_documentation(
+async def consult_integration_documentation(
     integration: Annotated[
         str,
         Path(description="The integration to ask the query of. The available integrations are listed with the `/list_integrations` endpoint, and this parameter must be one of those integration IDs.")
@@ -77,7 +203,9 @@ def consult_integration_documentation(
     query: Annotated[
         str,
         Query(description="The query to ask of the integration, such as: asking `cbioportal` a query like `How would you go about finding RNA-seq z-scores for these studies?` or `fetch all AML studies`, or more broadly asking an integration `What sorts of questions can you help me with?`")
-    ]
+    ],
+    response: Response,
+    cache_control: CacheControlHeader = None,
 ) -> IntegrationDocumentationOutput:
     """
     Asks a question to the given integration's specialist agent expecting an answer in the form of a
@@ -86,14 +214,34 @@ def consult_integration_documentation(
     and other questions that are higher level that executing the task on the spot.
     """
     raise_on_invalid_integration(integration)
-    try:
-        response = integrations.ask_api(integration, query)
-        return IntegrationDocumentationOutput(response=response)
-    except Exception as e:
-        raise HTTPException(status_code=503, detail=str(e))
+    result, matched = await run_agent("consult", integration, integrations.ask_api, query, cache_control, response)
+    return IntegrationDocumentationOutput(response=result, matched_query=matched)
+
+@app.get("/consult_integration_documentation/{integration}/stream")
+async def stream_integration_documentation(
+    integration: Annotated[
+        str,
+        Path(description="The integration to ask the query of. The available integrations are listed with the `/list_integrations` endpoint, and this parameter must be one of those integration IDs.")
+    ],
+    query: Annotated[
+        str,
+        Query(description="The query to ask of the integration, as for `/consult_integration_documentation/{integration}`.")
+    ],
+    cache_control: CacheControlHeader = None,
+) -> StreamingResponse:
+    """
+    `/consult_integration_documentation/{integration}` as server-sent events: `token` events (`{"text": ...}`) with
+    the answer as it is written, then a `complete` event with the same fields as the non-streaming response, or an
+    `error` event (`{"status": ..., "detail": ...}`).
+    """
+    raise_on_invalid_integration(integration)
+    return StreamingResponse(
+        stream_agent("consult", integration, integrations.ask_api, query, cache_control), media_type="text/event-stream"
+    )
 
 class IntegrationCodeOutput(BaseModel):
     response: str
+    matched_query: Optional[str] = None
     model_config = {
         "json_schema_extra": {
             "examples": [
@@ -121,7 +269,7 @@ if response.status_code == 200:
     }
 
 @app.get("/draft_integration_code/{integration}")
-def draft_integration_code(
+async def draft_integration_code(
     integration: Annotated[
         str,
         Path(description="The integration to ask the query of. The available integrations are listed with the `/list_integrations` endpoint, and this parameter must be one of those integration IDs.")
@@ -129,7 +277,9 @@ def draft_integration_code(
     query: Annotated[
         str,
         Query(description="The task for the specialist agent to complete. For example, asking the integration `cbioportal` the query `Find colorectal cancer studies`.")
-    ]
+    ],
+    response: Response,
+    cache_control: CacheControlHeader = None,
 ) -> IntegrationCodeOutput:
     """
     Sends a task to the given integration's specialist agent expecting an answer in the form of
@@ -138,8 +288,27 @@ def draft_integration_code(
     take, if any.
     """
     raise_on_invalid_integration(integration)
-    try:
-        response = integrations.use_api(integration, query)
-        return IntegrationCodeOutput(response=response)
-    except Exception as e:
-        raise HTTPException(status_code=503, detail=str(e))
+    result, matched = await run_agent("draft", integration, integrations.use_api, query, cache_control, response)
+    return IntegrationCodeOutput(response=result, matched_query=matched)
+
+@app.get("/draft_integration_code/{integration}/stream")
+async def stream_integration_code(
+    integration: Annotated[
+        str,
+        Path(description="The integration to ask the query of. The available integrations are listed with the `/list_integrations` endpoint, and this parameter must be one of those integration IDs.")
+    ],
+    query: Annotated[
+        str,
+        Query(description="The task for the specialist agent to complete, as for `/draft_integration_code/{integration}`.")
+    ],
+    cache_control: CacheControlHeader = None,
+) -> StreamingResponse:
+    """
+    `/draft_integration_code/{integration}` as server-sent events: `token` events (`{"text": ...}`) with the
+    specialist agent's reply as it is written, code block fences included, then a `complete` event whose `response`
+    is just the code, or an `error` event (`{"status": ..., "detail": ...}`).
+    """
+    raise_on_invalid_integration(integration)
+    return StreamingResponse(
+        stream_agent("draft", integration, integrations.use_api, query, cache_control), media_type="text/event-stream"
+    )
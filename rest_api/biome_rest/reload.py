@@ -0,0 +1,92 @@
+"""
+Hot reload of the integrations folder.
+
+A background thread watches `BIOME_INTEGRATIONS_DIR`. When files change, only the integration folders they belong
+to are loaded again, and those whose content changed are swapped into the live `LazyAdhocApi`. A folder that was
+removed, or lost its `api.yaml`, is dropped. A folder that fails to load keeps serving its previous version.
+Requests already in progress are not interrupted; they finish with the spec and agent they started with.
+
+Set `BIOME_WATCH_INTEGRATIONS=false` to disable. On filesystems without change notifications (some Docker volume
+mounts), set `WATCHFILES_FORCE_POLLING=true`.
+"""
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Iterable
+
+from .integrations import LazyAdhocApi, datasource_root, get_data_dir, load_handle
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_MS = 1000
+
+
+def reload_integrations(api: LazyAdhocApi, directories: Iterable[Path]) -> dict[str, str]:
+    """Load the given integration folders again and swap the changed ones into `api`. Returns the status per folder."""
+    data_dir = get_data_dir()
+    statuses = {}
+    for directory in directories:
+        current = next((handle for handle in list(api.handles.values()) if handle.directory == directory), None)
+        if not (directory / "api.yaml").is_file():
+            if current is not None:
+                api.remove(current.slug)
+                logger.info(f"Removed integration `{current.slug}` ({directory.name} no longer has an api.yaml)")
+                statuses[directory.name] = "removed"
+            continue
+        try:
+            handle, _ = load_handle(directory, data_dir)
+        except Exception as e:
+            logger.error(f"Failed to reload integration `{directory.name}`, keeping the loaded version: {e.__class__.__name__}: {e}")
+            statuses[directory.name] = "failed"
+            continue
+        if current is not None and current.key == handle.key and current.slug == handle.slug:
+            statuses[directory.name] = "unchanged"
+            continue
+        if current is not None and current.slug != handle.slug:
+            api.remove(current.slug)
+        api.replace(handle)
+        logger.info(f"Reloaded integration `{handle.slug}` from {directory.name}")
+        statuses[directory.name] = "reloaded" if current is not None else "added"
+    return statuses
+
+
+def changed_directories(root: Path, paths: Iterable[str]) -> list[Path]:
+    """The integration folders (direct children of `root`) the changed paths belong to."""
+    directories = set()
+    for path in paths:
+        try:
+            relative = Path(path).relative_to(root)
+        except ValueError:
+            continue
+        if relative.parts and not relative.parts[0].startswith("."):
+            directories.add(root / relative.parts[0])
+    # removed folders are kept too, so they are dropped from the api
+    return sorted(directories)
+
+
+def watch_integrations(api: LazyAdhocApi, stop_event: threading.Event) -> threading.Thread:
+    """Start the watcher thread; it stops when `stop_event` is set."""
+    from watchfiles import watch
+
+    root = datasource_root()
+
+    def run() -> None:
+        logger.info(f"Watching {root} for integration changes")
+        for changes in watch(root, stop_event=stop_event, debounce=DEBOUNCE_MS):
+            directories = changed_directories(root, [path for _, path in changes])
+            if not directories:
+                continue
+            try:
+                reload_integrations(api, directories)
+            except Exception as e:
+                # keep watching, the next change may fix it
+                logger.error(f"Failed to reload integrations: {e.__class__.__name__}: {e}")
+
+    thread = threading.Thread(target=run, name="integration-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+def watching_enabled() -> bool:
+    return os.environ.get("BIOME_WATCH_INTEGRATIONS", "true").lower() not in ("false", "0", "no")
@@ -0,0 +1,157 @@
+"""
+Persistent cache of the consult and draft responses.
+
+Responses are kept in a SQLite database (`BIOME_RESPONSE_CACHE`, default `~/.cache/biome/responses.sqlite3`), so they
+survive restarts. Each is keyed by a sha256 over the endpoint, the integration slug, the normalized query, the content
+key of the integration's folder (see `shared/spec_cache.py`) and the agent models, so editing an integration or changing
+models never serves a stale answer. Entries expire `BIOME_RESPONSE_CACHE_TTL` seconds after they were stored (0
+disables the cache), and once the responses exceed `BIOME_RESPONSE_CACHE_MB`, the least recently used are evicted until
+they take up `EVICT_TO` of it. Expired entries are deleted when read, and all of them every `CLEANUP_INTERVAL`. Its
+methods block, so the API calls them on a worker thread.
+
+Callers bypass it with `Cache-Control`: `no-cache` always asks the agent and stores the new response, `no-store`
+neither reads nor stores.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_MB = 256
+CACHE_VERSION = 1
+# Eviction leaves room for this fraction of the size limit, so it runs once per many writes rather than on each.
+EVICT_TO = 0.9
+CLEANUP_INTERVAL = 3600
+
+
+def get_cache_path() -> Path:
+    if path := os.environ.get("BIOME_RESPONSE_CACHE"):
+        return Path(path)
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "biome" / "responses.sqlite3"
+
+
+def normalize_query(query: str) -> str:
+    """The query with whitespace collapsed, case folded and trailing punctuation dropped."""
+    return " ".join(query.split()).casefold().rstrip("?.! ")
+
+
+def cache_directives(cache_control: Optional[str]) -> set[str]:
+    """The directive names of a `Cache-Control` header, lowercased."""
+    return {directive.split("=", 1)[0].strip().lower() for directive in (cache_control or "").split(",") if directive.strip()}
+
+
+def model_names(configs: dict) -> dict:
+    """The models of each agent role, without their API keys, for the cache key."""
+    def name(config):
+        return config and {key: value for key, value in config.items() if key != "api_key"}
+    return {role: [name(config) for config in value] if isinstance(value, list) else name(value) for role, value in configs.items()}
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    query: str
+    created: float
+
+
+class ResponseCache:
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        # size of the responses at the last cleanup (other processes may write too), and written since
+        self.total: Optional[int] = None
+        self.written = 0
+        self.next_cleanup = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            get_cache_path(),
+            ttl=float(os.environ.get("BIOME_RESPONSE_CACHE_TTL") or DEFAULT_TTL),
+            max_bytes=int(float(os.environ.get("BIOME_RESPONSE_CACHE_MB") or DEFAULT_MAX_MB) * 1024 * 1024),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT, integration TEXT, "
+                "query TEXT, response TEXT, created REAL, accessed REAL, size INTEGER)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.connection = connection
+        return self.connection
+
+    def key(self, endpoint: str, integration: str, query: str, spec_key: str, models: dict) -> str:
+        payload = json.dumps([CACHE_VERSION, endpoint, integration, normalize_query(query), spec_key, models], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self.lock:
+                connection = self._connect()
+                row = connection.execute("SELECT response, query, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if now - row[2] > self.ttl:
+                    connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            # the cache only ever saves a call, it never fails one
+            logger.warning(f"Could not read the response cache {self.path}: {e}")
+            return None
+        return CachedResponse(response=row[0], query=row[1], created=row[2])
+
+    def put(self, key: str, endpoint: str, integration: str, query: str, response: str) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        size = len(response.encode()) + len(query.encode())
+        try:
+            with self.lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, endpoint, integration, query, response, now, now, size),
+                )
+                self.written += size
+                if self.total is None or self.total + self.written > self.max_bytes or now >= self.next_cleanup:
+                    self._cleanup(connection, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write to the response cache {self.path}: {e}")
+
+    def _cleanup(self, connection: sqlite3.Connection, now: float) -> None:
+        """Delete the expired responses and, when over the size limit, the least recently used ones."""
+        connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            # least recently used first, until the rest fits in `EVICT_TO` of the limit
+            connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS running FROM responses) WHERE running > ?)",
+                (int(self.max_bytes * EVICT_TO),),
+            )
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.total, self.written, self.next_cleanup = total, 0, now + CLEANUP_INTERVAL
@@ -0,0 +1,232 @@
+"""
+Token budget of every integration, per agent role and model, checked against a stored baseline.
+
+    python -m biome_rest.token_report                     # report, with the change since the baseline
+    python -m biome_rest.token_report --update-baseline   # store the current counts as the baseline
+    python -m biome_rest.token_report --check             # exit 1 if an integration grew past the tolerance,
+                                                          # failed to load, or is missing from the baseline
+
+Specs are loaded with `fetch_spec_handles`, exactly as the REST API serves them. For each integration it counts
+what the spec adds to each agent's prompt:
+
+- drafter: the drafter system prompt and the documentation, carried by every consult and draft (for integrations with
+  `retrieval`, the documentation without its large attachments, whose relevant sections are attached per request),
+- curator: the curator prompt listing all examples, sent before drafting when the integration has examples,
+- every file in the integration folder (the attachments the documentation inlines), for the drafter models.
+
+The contextualizer only sees the conversation, not the spec, so it is not reported. OpenAI models are counted with
+their tiktoken encoding; other providers are estimated at `CHARS_PER_TOKEN` characters per token, since counting
+them exactly takes an API call per text. With `--estimate`, or when the tiktoken encodings cannot be downloaded, every
+model is estimated. A baseline records which way it was counted, and is always compared with counts made the same way.
+"""
+import argparse
+import functools
+import json
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from adhoc_api.tool import CURATOR_FIND_GOOD_MATCHES_PROMPT, DRAFTER_SYSTEM_PROMPT, examples_to_str
+from adhoc_api.uaii import openai_tokenizers
+
+from .integrations import LOAD_TIMINGS, SpecHandle, fetch_spec_handles, load_workers, model_configs
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent.parent / "token_baseline.json"
+# An integration regresses when a count grows by more than both of these.
+DEFAULT_TOLERANCE = 0.05
+MIN_INCREASE = 500
+CHARS_PER_TOKEN = 4
+
+
+@functools.cache
+def _encoding(name: str):
+    import tiktoken
+
+    return tiktoken.get_encoding(name)
+
+
+def is_exact(config: dict, estimate: bool = False) -> bool:
+    return not estimate and config.get("provider") == "openai" and config.get("model") in openai_tokenizers
+
+
+def count_tokens(text: str, config: dict, estimate: bool = False) -> int:
+    if is_exact(config, estimate):
+        return len(_encoding(openai_tokenizers[config["model"]]).encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def model_label(config: dict, estimate: bool = False) -> str:
+    return config["model"] if is_exact(config, estimate) else f"{config['model']} (estimated)"
+
+
+def encodings_available(models: dict[str, list[dict]]) -> bool:
+    """Whether the tiktoken encodings of the OpenAI models can be loaded (they are downloaded on first use)."""
+    try:
+        for config in (config for configs in models.values() for config in configs):
+            if is_exact(config):
+                _encoding(openai_tokenizers[config["model"]])
+    except Exception as e:
+        print(f"Could not load the tiktoken encodings, estimating every model instead: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def role_models() -> dict[str, list[dict]]:
+    configs = model_configs()
+    return {"drafter": configs["drafter"], "curator": [configs["curator"]] if configs["curator"] else []}
+
+
+def integration_tokens(handle: SpecHandle, models: dict[str, list[dict]], estimate: bool = False) -> dict:
+    """`{"drafter": {model: tokens}, "curator": {...}, "attachments": {file: {model: tokens}}}` for one integration."""
+    spec = handle.load()
+    examples = spec.get("examples") or []
+    prompts = {
+        "drafter": DRAFTER_SYSTEM_PROMPT.format(name=handle.slug) + f"\n\n# API Documentation:\n{spec['documentation']}",
+        "curator": CURATOR_FIND_GOOD_MATCHES_PROMPT.format(
+            api=handle.slug, query="", examples_str=examples_to_str(examples, title_header="Solutions", example_header="Solution"),
+        ) if examples else "",
+    }
+    counts: dict[str, dict] = {
+        role: {model_label(config, estimate): count_tokens(prompts[role], config, estimate) for config in configs}
+        for role, configs in models.items()
+    }
+    counts["attachments"] = {}
+    for path in sorted(handle.directory.rglob("*")):
+        relative = path.relative_to(handle.directory)
+        if not path.is_file() or any(part.startswith(".") for part in relative.parts):
+            continue
+        try:
+            text = path.read_text()
+        except (UnicodeDecodeError, OSError):
+            continue
+        counts["attachments"][relative.as_posix()] = {
+            model_label(config, estimate): count_tokens(text, config, estimate) for config in models["drafter"]
+        }
+    return counts
+
+
+def build_report(integrations: Optional[list[str]] = None, estimate: bool = False) -> dict:
+    """
+    The counts of every integration (or only of `integrations`), and the integrations that failed to load, by their
+    slug or, when they failed before it was known, their folder name.
+    """
+    handles = [handle for handle in fetch_spec_handles() if not integrations or handle.slug in integrations]
+    failed = {
+        timing["integration"]: timing["error"] for timing in LOAD_TIMINGS
+        if "error" in timing and (not integrations or timing["integration"] in integrations)
+    }
+    models = role_models()
+    estimate = estimate or not encodings_available(models)
+
+    def count(handle: SpecHandle) -> dict | None:
+        try:
+            return integration_tokens(handle, models, estimate)
+        except Exception as e:
+            failed[handle.slug] = f"{e.__class__.__name__}: {e}"
+            return None
+
+    with ThreadPoolExecutor(max_workers=load_workers()) as executor:
+        counts = list(executor.map(count, handles))
+    return {
+        "estimated": estimate,
+        "models": {role: [model_label(config, estimate) for config in configs] for role, configs in models.items()},
+        "integrations": {handle.slug: count for handle, count in zip(handles, counts) if count is not None},
+        "failed": failed,
+    }
+
+
+def regressions(report: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE, complete: bool = True) -> list[str]:
+    """
+    What `--check` fails on: integrations that failed to load, integrations, roles or models missing from the
+    baseline, and counts that grew by more than `tolerance` and `MIN_INCREASE` tokens since it. With `complete`
+    (all integrations were counted), integrations in the baseline that are no longer loaded fail too.
+    """
+    found = [f"{slug}: failed to load ({error})" for slug, error in sorted(report.get("failed", {}).items())]
+    for slug, counts in report["integrations"].items():
+        previous = baseline.get("integrations", {}).get(slug)
+        if previous is None:
+            found.append(f"{slug}: not in the baseline")
+            continue
+        for role in ("drafter", "curator"):
+            for model, tokens in counts[role].items():
+                before = previous.get(role, {}).get(model)
+                if before is None:
+                    found.append(f"{slug} {role} ({model}): not in the baseline")
+                elif tokens - before > max(MIN_INCREASE, before * tolerance):
+                    found.append(f"{slug} {role} ({model}): {before} -> {tokens} tokens (+{(tokens - before) / max(before, 1):.0%})")
+    if complete:
+        missing = set(baseline.get("integrations", {})) - set(report["integrations"]) - set(report.get("failed", {}))
+        found.extend(f"{slug}: in the baseline, no longer loaded" for slug in sorted(missing))
+    return found
+
+
+def format_report(report: dict, baseline: dict) -> str:
+    lines = []
+    for slug, counts in sorted(report["integrations"].items(), key=lambda item: -max(item[1]["drafter"].values(), default=0)):
+        previous = baseline.get("integrations", {}).get(slug, {})
+        lines.append(slug)
+        for role in ("drafter", "curator"):
+            for model, tokens in counts[role].items():
+                before = previous.get(role, {}).get(model)
+                change = "new" if before is None else f"{tokens - before:+d}"
+                lines.append(f"  {role:<8} {model:<32} {tokens:>10,}  ({change})")
+        for name, by_model in sorted(counts["attachments"].items(), key=lambda item: -max(item[1].values(), default=0)):
+            lines.append(f"    {name:<50} " + ", ".join(f"{tokens:,}" for tokens in by_model.values()))
+    for slug, error in sorted(report.get("failed", {}).items()):
+        lines.append(f"{slug}  (failed to load: {error})")
+    for slug in sorted(set(baseline.get("integrations", {})) - set(report["integrations"]) - set(report.get("failed", {}))):
+        lines.append(f"{slug}  (in the baseline, no longer loaded)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m biome_rest.token_report",
+        description="Report the tokens each integration adds to the specialist agents' prompts, against a baseline.",
+    )
+    parser.add_argument("integrations", nargs="*", help="Only these integration slugs (default: all).")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help=f"Baseline file, default {DEFAULT_BASELINE.name}.")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the current counts as the baseline.")
+    parser.add_argument(
+        "--check", action="store_true",
+        help="Exit with status 1 if any integration regressed, failed to load or is missing from the baseline.",
+    )
+    parser.add_argument("--estimate", action="store_true", help=f"Estimate every model at {CHARS_PER_TOKEN} characters per token.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative growth, default 0.05.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = json.loads(args.baseline.read_text())
+    except (OSError, ValueError) as e:
+        if args.check:
+            print(f"No usable baseline at {args.baseline} ({e}); create it with --update-baseline.", file=sys.stderr)
+            raise SystemExit(1)
+        baseline = {}
+    # counted the same way as the baseline, so the two compare; only a full update may change how it is counted
+    full_update = args.update_baseline and not args.integrations
+    estimate = args.estimate or (not full_update and baseline.get("estimated", False))
+    report = build_report(args.integrations, estimate=estimate)
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report, baseline))
+    mismatched = bool(baseline) and report["estimated"] != baseline.get("estimated", False)
+    if mismatched and not full_update and (args.update_baseline or args.check):
+        print("The baseline was counted differently (see --estimate); update it for all integrations.", file=sys.stderr)
+        raise SystemExit(1)
+    if args.update_baseline:
+        if args.integrations:
+            # only the requested integrations are replaced
+            report = {**report, "integrations": {**baseline.get("integrations", {}), **report["integrations"]}}
+        stored = {key: value for key, value in report.items() if key != "failed"}
+        args.baseline.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    elif args.check:
+        if found := regressions(report, baseline, args.tolerance, complete=not args.integrations):
+            print("Token budget check failed:\n  " + "\n  ".join(found), file=sys.stderr)
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,8 @@ logger = logging.getLogger(__name__)
 
 # Default base URL for the Biome REST API
 DEFAULT_BASE_URL = "http://localhost:8001"
+# The streaming endpoints send something at least every 15 seconds, so a longer silence means the API is stuck
+STREAM_READ_TIMEOUT = 60.0
 
 class BiomeMCPServer:
     def __init__(self, base_url: str = DEFAULT_BASE_URL):
@@ -137,6 +139,47 @@ class BiomeMCPServer:
                 logger.error(f"Unexpected error for {url}: {type(e).__name__}: {e}")
                 raise Exception(f"Failed to connect to Biome API: {str(e)}")
 
+    async def _stream_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Make a request to a streaming Biome REST API endpoint, returning the data of its final event"""
+        url = f"{self.base_url}{endpoint}"
+        logger.info(f"Making streaming request to: {url} with params: {params}")
+
+        # no limit on the whole request, only on the wait for each event, so long drafts don't time out
+        timeout = httpx.Timeout(10.0, read=STREAM_READ_TIMEOUT)
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            try:
+                async with client.stream("GET", url, params=params) as response:
+                    logger.info(f"Response status: {response.status_code}")
+                    if response.is_error:
+                        await response.aread()
+                    response.raise_for_status()
+                    event, data, received = "message", [], 0
+                    async for line in response.aiter_lines():
+                        if line.startswith("event:"):
+                            event = line[len("event:"):].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[len("data:"):].strip())
+                        elif not line and data:
+                            payload = json.loads("\n".join(data))
+                            if event == "complete":
+                                return payload
+                            if event == "error":
+                                raise Exception(f"API request failed: {payload.get('status')} {payload.get('detail')}")
+                            if event == "token":
+                                received += len(payload.get("text", ""))
+                                logger.debug(f"Received {received} characters from {url}")
+                            event, data = "message", []
+                raise Exception("The stream ended without a response")
+            except httpx.ConnectError as e:
+                logger.error(f"Connection failed to {url}: {e}")
+                raise Exception(f"Failed to connect to Biome API at {url}. Is the FastAPI server running?")
+            except httpx.TimeoutException as e:
+                logger.error(f"Request timeout to {url}: {e}")
+                raise Exception(f"Biome API sent nothing for {STREAM_READ_TIMEOUT:.0f} seconds: {str(e)}")
+            except httpx.HTTPStatusError as e:
+                logger.error(f"HTTP error {e.response.status_code}: {e.response.text}")
+                raise Exception(f"API request failed: {e.response.status_code} {e.response.text}")
+
     async def _list_integrations(self) -> str:
         """List all available integrations"""
         try:
@@ -158,7 +201,7 @@ class BiomeMCPServer:
         try:
             logger.info(f"Consulting documentation for {integration} with query: {query}")
             params = {"query": query}
-            data = await self._make_request("GET", f"/consult_integration_documentation/{integration}", params)
+            data = await self._stream_request(f"/consult_integration_documentation/{integration}/stream", params)
             response = data.get("response", "No response received")
             logger.info(f"Documentation consultation completed for {integration}")
             return response
@@ -171,7 +214,7 @@ class BiomeMCPServer:
         try:
             logger.info(f"Drafting code for {integration} with query: {query}")
             params = {"query": query}
-            data = await self._make_request("GET", f"/draft_integration_code/{integration}", params)
+            data = await self._stream_request(f"/draft_integration_code/{integration}/stream", params)
             code = data.get("response", "No code generated")
             logger.info(f"Code generation completed for {integration}")
             
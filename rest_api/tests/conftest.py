@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+from biome_rest import integrations as integrations_module
+from biome_rest.integrations import LazyAdhocApi
+from biome_rest.limits import AgentLimiter
+from biome_rest.response_cache import ResponseCache
+
+
+class FakeIntegrations:
+    """
+    Stands in for `LazyAdhocApi` with one integration, `gdc`, whose agent calls are `consult` (the endpoints call it
+    as `ask_api` and `use_api`). `answer` is the real one, so the calls see the cache flags and `on_token` as the
+    drafter would.
+    """
+    answer = LazyAdhocApi.answer
+
+    def __init__(self, consult=None):
+        self.apis = {"gdc": ({"slug": "gdc", "name": "GDC", "description": "Genomic Data Commons"}, {"provider": "openai"})}
+        self.handles: dict = {}
+        self.answering = threading.local()
+        self.consult = consult or (lambda api, query: f"answer to {query}")
+        self.calls: list[tuple[str, bool, bool]] = []
+
+    def ask_api(self, api: str, query: str) -> str:
+        self.calls.append((query, self.answering.read_cache, self.answering.store_cache))
+        return self.consult(api, query)
+
+    use_api = ask_api
+
+
+@pytest.fixture
+def main(monkeypatch, tmp_path):
+    """`biome_rest.main`, with fake integrations, an empty response cache and a fresh limiter."""
+    # importing `main` loads the integrations
+    monkeypatch.setenv("BIOME_RESPONSE_CACHE", str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(integrations_module, "initialize_adhoc", FakeIntegrations)
+    from biome_rest import main
+
+    limiter = AgentLimiter()
+    monkeypatch.setattr(main, "integrations", FakeIntegrations())
+    monkeypatch.setattr(main, "response_cache", ResponseCache(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(main, "limiter", limiter)
+    yield main
+    limiter.shutdown()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+
+import pytest
+
+from biome_rest.limits import AgentLimiter, Busy
+
+
+def blocking_call(event: threading.Event) -> str:
+    # stands in for an agent call, done when the test sets the event
+    if not event.wait(timeout=5):
+        raise TimeoutError("the test never released the call")
+    return "answer"
+
+
+def failing_call():
+    raise ValueError("the agent failed")
+
+
+def test_full_queue():
+    async def scenario():
+        limiter = AgentLimiter(per_integration=1, per_provider=1, queued_per_integration=0, queue_timeout=5)
+        release = threading.Event()
+        running = asyncio.create_task(limiter.run("gdc", "openai", blocking_call, release))
+        await asyncio.sleep(0.05)
+        with pytest.raises(Busy, match="Too many requests"):
+            await limiter.run("gdc", "openai", blocking_call, release)
+        # other integrations have their own line
+        assert limiter.pending["idc"] == 0
+        release.set()
+        assert await running == "answer"
+        limiter.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout():
+    async def scenario():
+        limiter = AgentLimiter(per_integration=1, per_provider=1, queued_per_integration=1, queue_timeout=0.05)
+        release = threading.Event()
+        running = asyncio.create_task(limiter.run("gdc", "openai", blocking_call, release))
+        await asyncio.sleep(0.05)
+        with pytest.raises(Busy, match="Timed out") as busy:
+            await limiter.run("gdc", "openai", blocking_call, release)
+        assert busy.value.retry_after >= 1
+        assert limiter.pending["gdc"] == 1
+        release.set()
+        await running
+        limiter.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_retry_after():
+    limiter = AgentLimiter(per_integration=2)
+    assert limiter.retry_after("gdc") == 30
+    limiter.durations["gdc"] = 10.0
+    # two calls running and two waiting: the next one waits for one and a half rounds of calls
+    limiter.pending["gdc"] = 4
+    assert limiter.retry_after("gdc") == 15
+    limiter.pending["gdc"] = 0
+    assert limiter.retry_after("gdc") == 10
+    limiter.shutdown()
+
+
+def test_durations_are_measured():
+    async def scenario():
+        limiter = AgentLimiter()
+        await limiter.run("gdc", "openai", lambda: None)
+        limiter.shutdown()
+        return limiter.durations["gdc"]
+
+    # an instant call moves the estimate from the initial 30s by the smoothing weight
+    assert asyncio.run(scenario()) == pytest.approx(21.0, abs=0.1)
+
+
+def assert_released(limiter: AgentLimiter):
+    assert limiter.pending["gdc"] == 0
+    assert limiter.integration_slots["gdc"]._value == limiter.per_integration
+    assert limiter.provider_slots["openai"]._value == limiter.per_provider
+
+
+def test_release_after_exception():
+    async def scenario():
+        limiter = AgentLimiter(per_integration=1, per_provider=1)
+        with pytest.raises(ValueError):
+            await limiter.run("gdc", "openai", failing_call)
+        assert_released(limiter)
+        assert await limiter.run("gdc", "openai", lambda: "answer") == "answer"
+        limiter.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_release_after_cancellation():
+    async def scenario():
+        limiter = AgentLimiter(per_integration=1, per_provider=1, queue_timeout=5)
+        release = threading.Event()
+        running = asyncio.create_task(limiter.run("gdc", "openai", blocking_call, release))
+        waiting = asyncio.create_task(limiter.run("gdc", "openai", blocking_call, release))
+        await asyncio.sleep(0.05)
+        assert limiter.pending["gdc"] == 2
+        # a client disconnecting while in line, then one disconnecting while its call runs
+        for task in (waiting, running):
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert_released(limiter)
+        release.set()
+        assert await limiter.run("gdc", "openai", lambda: "answer") == "answer"
+        limiter.shutdown()
+
+    asyncio.run(scenario())
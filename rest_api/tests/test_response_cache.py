@@ -0,0 +1,92 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from biome_rest import response_cache as response_cache_module
+from biome_rest.response_cache import EVICT_TO, ResponseCache, cache_directives
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache_module.time, "time", clock)
+    return clock
+
+
+def stored_keys(cache: ResponseCache) -> set[str]:
+    return {row[0] for row in cache._connect().execute("SELECT key FROM responses")}
+
+
+def test_ttl_expiry(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", ttl=60)
+    cache.put("key", "consult", "gdc", "query", "response")
+    clock.now += 59
+    assert cache.get("key").response == "response"
+    clock.now += 2
+    assert cache.get("key") is None
+    assert not stored_keys(cache)
+
+
+def test_disabled(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", ttl=0)
+    cache.put("key", "consult", "gdc", "query", "response")
+    assert cache.get("key") is None
+    assert not (tmp_path / "responses.sqlite3").exists()
+
+
+def test_least_recently_used_evicted(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", max_bytes=1000)
+    # 300 bytes each, so three fit and the fourth is over the limit
+    for key in "abc":
+        clock.now += 1
+        cache.put(key, "consult", "gdc", "q", "x" * 299)
+    clock.now += 1
+    assert cache.get("a") is not None
+    clock.now += 1
+    cache.put("d", "consult", "gdc", "q", "x" * 299)
+    # b is the least recently used: evicting it is enough to get down to 90% of the limit
+    assert stored_keys(cache) == {"a", "c", "d"}
+    assert cache.total == 900 <= EVICT_TO * cache.max_bytes
+
+
+def test_expired_cleaned_up(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", ttl=60)
+    cache.put("old", "consult", "gdc", "query", "response")
+    clock.now += 3600
+    cache.put("new", "consult", "gdc", "query", "response")
+    assert stored_keys(cache) == {"new"}
+
+
+def test_cache_directives():
+    assert cache_directives("No-Cache, max-age=0") == {"no-cache", "max-age"}
+    assert cache_directives(None) == set()
+
+
+def test_no_cache_and_no_store(main):
+    client = TestClient(main.app)
+    integrations = main.integrations
+
+    def consult(headers=None, query="projects"):
+        response = client.get("/consult_integration_documentation/gdc", params={"query": query}, headers=headers or {})
+        assert response.status_code == 200
+        return response.headers["X-Cache"], len(integrations.calls)
+
+    assert consult() == ("miss", 1)
+    assert consult() == ("hit", 1)
+    # no-cache asks the agent again, bypassing the semantic cache too, and stores its answer
+    integrations.consult = lambda api, query: "new answer"
+    assert consult({"Cache-Control": "no-cache"}) == ("miss", 2)
+    assert integrations.calls[-1] == ("projects", False, True)
+    assert client.get("/consult_integration_documentation/gdc", params={"query": "projects"}).json()["response"] == "new answer"
+    # no-store neither reads nor stores
+    assert consult({"Cache-Control": "no-store"}) == ("miss", 3)
+    assert integrations.calls[-1] == ("projects", False, False)
+    assert consult({"Cache-Control": "no-store"}, query="cases") == ("miss", 4)
+    assert consult(query="cases") == ("miss", 5)
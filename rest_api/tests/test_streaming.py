@@ -0,0 +1,97 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import mcp_server
+from biome_rest.limits import Busy
+
+
+def streaming(integrations, tokens, delay=0.0, error=None):
+    """An agent call writing `tokens` through the drafter's `on_token`, `delay` seconds apart."""
+    def consult(api, query):
+        for token in tokens:
+            time.sleep(delay)
+            integrations.answering.on_token(token)
+        if error is not None:
+            raise error
+        return "".join(tokens)
+    return consult
+
+
+def parse(chunks: list[str]) -> list[tuple[str, object]]:
+    """The events of a stream, with comments as ("comment", text)."""
+    events = []
+    for chunk in chunks:
+        if chunk.startswith(":"):
+            events.append(("comment", chunk[1:].strip()))
+            continue
+        fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def stream(main, query="projects", cache_control=None) -> list[tuple[str, object]]:
+    async def collect():
+        generator = main.stream_agent("consult", "gdc", main.integrations.ask_api, query, cache_control)
+        return [chunk async for chunk in generator]
+    return parse(asyncio.run(collect()))
+
+
+def test_tokens_then_complete(main):
+    main.integrations.consult = streaming(main.integrations, ["The ", "GDC ", "projects"])
+    assert stream(main) == [
+        ("token", {"text": "The "}),
+        ("token", {"text": "GDC "}),
+        ("token", {"text": "projects"}),
+        ("complete", {"response": "The GDC projects", "matched_query": None, "cache": "miss"}),
+    ]
+    # stored, so the same request only gets the complete event
+    assert stream(main) == [("complete", {"response": "The GDC projects", "matched_query": None, "cache": "hit"})]
+
+
+def test_tokens_then_error(main):
+    main.integrations.consult = streaming(main.integrations, ["The "], error=RuntimeError("the drafter failed"))
+    assert stream(main) == [("token", {"text": "The "}), ("error", {"status": 503, "detail": "the drafter failed"})]
+    assert main.integrations.calls
+
+
+def test_busy(main, monkeypatch):
+    async def busy(*args):
+        raise Busy("Too many requests waiting for `gdc`.", 12)
+
+    monkeypatch.setattr(main.limiter, "run", busy)
+    assert stream(main) == [("error", {"status": 429, "detail": "Too many requests waiting for `gdc`.", "retry_after": 12})]
+
+
+def test_keep_alive(main, monkeypatch):
+    monkeypatch.setattr(main, "KEEP_ALIVE_INTERVAL", 0.05)
+    main.integrations.consult = streaming(main.integrations, ["slow"], delay=0.3)
+    events = stream(main)
+    assert events[0] == ("comment", "keep-alive")
+    assert [event for event, _ in events if event != "comment"] == ["token", "complete"]
+
+
+@pytest.fixture
+def client(main, monkeypatch):
+    """The MCP server, its requests served by the API in process."""
+    make_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        mcp_server.httpx, "AsyncClient",
+        lambda **kwargs: make_client(transport=httpx.ASGITransport(app=main.app), **kwargs),
+    )
+    return mcp_server.BiomeMCPServer(base_url="http://biome")
+
+
+def test_mcp_client_reads_the_final_event(main, client):
+    main.integrations.consult = streaming(main.integrations, ["The ", "GDC ", "projects"])
+    data = asyncio.run(client._stream_request("/consult_integration_documentation/gdc/stream", {"query": "projects"}))
+    assert data == {"response": "The GDC projects", "matched_query": None, "cache": "miss"}
+
+
+def test_mcp_client_raises_the_error_event(main, client):
+    main.integrations.consult = streaming(main.integrations, ["The "], error=RuntimeError("the drafter failed"))
+    with pytest.raises(Exception, match="API request failed: 503 the drafter failed"):
+        asyncio.run(client._stream_request("/consult_integration_documentation/gdc/stream", {"query": "projects"}))
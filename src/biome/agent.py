@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import requests
 import os
@@ -12,6 +13,8 @@ from pathlib import Path
 
 from Bio import Entrez
 
+from biome.datasets.codebooks import get_codebook_index
+from biome.datasets.sql import get_sql_engine
 from biome.literature_review import LiteratureReviewAgent, PubmedSource
 
 logger = logging.getLogger(__name__)
@@ -140,6 +143,55 @@ Remember: Check for missing API keys BEFORE writing code, not after encountering
 
         return f"Successfully configured {api_key_map[key_name]}. You can now proceed with using this integration."
 
+    @tool()
+    async def lookup_codebook(self, query: str, dataset: str = "", limit: int = 10) -> str:
+        """
+        Look up variables in the codebooks of the local survey datasets (NSCH, AHS, ...) and the field references
+        of the integrations (e.g. FAERS), without running code.
+
+        Use this whenever you are asked about a variable, its meaning or its values. Query forms:
+          - a variable name, e.g. "K2Q40A"
+          - a variable and a value code, e.g. "K2Q40A=1", to decode a value
+          - a variable name prefix ending in "*", e.g. "K2Q4*"
+          - free text, e.g. "asthma diagnosis", to find variables by their description, question or labels
+
+        Args:
+            query (str): The variable, variable=code, prefix* or free text to look up.
+            dataset (str): Optional dataset/integration to restrict the lookup to, e.g. "census-nsch", "census-ahs", "faers".
+            limit (int): Maximum number of entries to return. Defaults to 10.
+
+        Returns:
+            str: The matching codebook entries with their descriptions and response codes.
+        """
+        index = await asyncio.to_thread(get_codebook_index)
+        return index.lookup(query, dataset=dataset or None, limit=limit)
+
+    @tool()
+    async def query_local_dataset(self, query: str, max_rows: int = 50) -> str:
+        """
+        Run a read-only SQL query (DuckDB dialect) over the local dataset files (AHS, NSCH, NHANES, EPA TRI,
+        USGS pesticide, ...) without loading them in the notebook.
+
+        Every data file is a view named `<dataset>.<file>`, e.g. `census_ahs.survey_2021`. Call with an empty query
+        to list the views, and use `DESCRIBE <dataset>.<view>` to see a view's columns. Files are scanned out-of-core
+        on all cores, so filter, join and aggregate in SQL and only bring back the small result; for example to
+        answer counts, averages or distributions, or to check which rows or codes exist before writing code.
+
+        Args:
+            query (str): A SELECT/WITH/DESCRIBE/SUMMARIZE statement, or an empty string to list the available views.
+            max_rows (int): Maximum number of result rows to return. Defaults to 50.
+
+        Returns:
+            str: The result rows as a pipe-separated table, the list of views, or the error message.
+        """
+        def run():
+            return get_sql_engine().query(query, max_rows=max_rows)
+
+        try:
+            return await asyncio.to_thread(run)
+        except Exception as e:
+            return f"Query failed: {e.__class__.__name__}: {e}"
+
     @tool()
     async def drs_uri_info(self, uris: List[str]) -> List[dict]:
         """
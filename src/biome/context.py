@@ -99,6 +99,8 @@ class BiomeContext(BeakerContext):
             "immport_password": os.environ.get("IMMPORT_PASSWORD"),
             "aqs_email": os.environ.get("API_EPA_AQS_EMAIL"),
             "aqs_key": os.environ.get("API_EPA_AQS"),
+            "dataset_cache_mb": os.environ.get("BIOME_DATASET_CACHE_MB"),
+            "lfs_mirror": os.environ.get("BIOME_LFS_MIRROR"),
         })
         await self.execute(command)
         await super().setup(context_info, parent_header=parent_header)
@@ -0,0 +1,63 @@
+import argparse
+import logging
+
+from . import ahs, epa_tri, geo, lfs, nhanes, nsch, profiles, samples, usgs_pesticide
+from .utils import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+# Builders take (data_dir, force) and skip anything whose sources have not changed since the last build.
+BUILDERS = {
+    "ahs": ahs.build,
+    "ahs_harmonized": ahs.build_harmonized,
+    "nsch": nsch.build,
+    "nhanes": nhanes.build,
+    "epa_tri": epa_tri.build,
+    "usgs_pesticide": usgs_pesticide.build,
+    "samples": samples.build,
+    "geo": geo.build,
+    "profiles": profiles.build,
+}
+
+
+def build(targets: list[str], data_dir=None, force: bool = False) -> None:
+    unknown = [target for target in targets if target not in BUILDERS]
+    if unknown:
+        raise ValueError(f"Unknown build target(s): {', '.join(unknown)}. Valid targets: {', '.join(BUILDERS)}")
+    data_dir = get_data_dir(data_dir)
+    for target in targets or list(BUILDERS):
+        logger.info(f"Building `{target}` in {data_dir}")
+        try:
+            BUILDERS[target](data_dir=data_dir, force=force)
+        except Exception as e:
+            logger.error(f"Failed to build `{target}`: {e.__class__.__name__}: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m biome.datasets",
+        description="Build derived artifacts (columnar copies, indexes, ...) for the local Biome datasets.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build derived artifacts for the given targets (default: all).")
+    build_parser.add_argument("targets", nargs="*", help=f"Any of: {', '.join(BUILDERS)}")
+    build_parser.add_argument("--data-dir", default=None, help="Dataset root, defaults to BIOME_DATA_DIR or $INTEGRATION_PATH/data.")
+    build_parser.add_argument("--force", action="store_true", help="Rebuild even if the sources have not changed.")
+    hydrate_parser = subparsers.add_parser(
+        "hydrate", help="Replace Git LFS pointers with their content from BIOME_LFS_MIRROR (default: the whole data folder).",
+    )
+    hydrate_parser.add_argument("paths", nargs="*", help="Files or folders, relative to the data folder.")
+    hydrate_parser.add_argument("--data-dir", default=None, help="Dataset root, defaults to BIOME_DATA_DIR or $INTEGRATION_PATH/data.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    if args.command == "build":
+        build(args.targets, data_dir=args.data_dir, force=args.force)
+    elif args.command == "hydrate":
+        statuses = lfs.hydrate_all(args.paths, data_dir=args.data_dir)
+        if "failed" in statuses.values():
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Columnar (Parquet) store for the Census American Housing Survey CSVs.
+
+Each `census-ahs/survey_<year>.csv` is converted once into `census-ahs/parquet/survey_<year>.parquet`
+and described in `census-ahs/parquet/catalog.json`, so generated code can read only the columns and
+row groups it needs instead of parsing a multi-hundred-MB CSV on every turn.
+
+The per-year files are then combined into `census-ahs/harmonized/`, a single hive-partitioned dataset
+(`year=<year>/part-0.parquet`) with column names and types reconciled across years, for longitudinal queries.
+"""
+import csv
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .lfs import ensure_hydrated
+from .utils import fingerprint, get_data_dir, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+AHS_FOLDER = "census-ahs"
+CODEBOOK_FILENAME = "census_ahs_codebook.csv"
+PARQUET_FOLDER = "parquet"
+CATALOG_FILENAME = "catalog.json"
+HARMONIZED_FOLDER = "harmonized"
+HARMONIZED_SCHEMA_FILENAME = "_schema.json"  # underscore prefix keeps it out of dataset discovery
+COMMON_METADATA_FILENAME = "_common_metadata"
+PARTITION_FIELD = pa.field("year", pa.int16())
+SURVEY_FILE_PATTERN = re.compile(r"^survey_(\d{4})\.csv$")
+
+CSV_BLOCK_SIZE = 64 << 20
+ROW_GROUP_SIZE = 50_000
+COMPRESSION = "zstd"
+
+INTEGER_PATTERN = r"^[+-]?\d+$"
+FLOAT_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+# A response code that is a numeric range ("1 - 99999: Number of rooms") marks a measured quantity, not a category.
+NUMERIC_RANGE_PATTERN = re.compile(r"-?\d+(\.\d+)?\s*(-|to)\s*-?\d+(\.\d+)?\s*:")
+
+
+def get_parquet_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / AHS_FOLDER / PARQUET_FOLDER
+
+
+def get_catalog(data_dir: Optional[os.PathLike] = None) -> dict:
+    return read_json(get_parquet_dir(data_dir) / CATALOG_FILENAME) or {"surveys": {}}
+
+
+def survey_sources(data_dir: Optional[os.PathLike] = None) -> dict[int, Path]:
+    """Map of survey year to raw CSV path."""
+    ahs_dir = get_data_dir(data_dir) / AHS_FOLDER
+    sources = {}
+    for path in sorted(ahs_dir.glob("survey_*.csv")):
+        if (match := SURVEY_FILE_PATTERN.match(path.name)):
+            sources[int(match.group(1))] = path
+    return sources
+
+
+def _open_as_strings(source: Path) -> pacsv.CSVStreamingReader:
+    # Read every column as text so that type decisions are made over the whole file, not the first block.
+    with source.open(newline="") as f:
+        header = next(csv.reader(f))
+    return pacsv.open_csv(
+        source,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in header},
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def _all_match(values: pa.Array, pattern: str) -> bool:
+    if len(values) == 0:
+        return True
+    return pc.all(pc.match_substring_regex(values, pattern)).as_py()
+
+
+def infer_schema(source: Path) -> tuple[pa.Schema, set[str]]:
+    """
+    Scan a survey CSV and decide the storage type of every column.
+
+    AHS public use files wrap categorical codes in single quotes (`'1'`, `'-6'`). Those columns are kept as
+    (dictionary-encoded) strings with the quotes removed, matching how the codebook lists response codes.
+    Unquoted columns become int64 or float64 when every value parses, and strings otherwise.
+
+    Returns the schema and the set of quoted columns.
+    """
+    reader = _open_as_strings(source)
+    names = reader.schema.names
+    quoted = {name: False for name in names}
+    integer = {name: True for name in names}
+    floating = {name: True for name in names}
+    for batch in reader:
+        for name, column in zip(names, batch.columns):
+            values = pc.drop_null(column)
+            if len(values) == 0:
+                continue
+            if not quoted[name] and pc.any(pc.starts_with(values, "'")).as_py():
+                quoted[name] = True
+            if quoted[name]:
+                continue
+            if integer[name]:
+                integer[name] = _all_match(values, INTEGER_PATTERN)
+            if not integer[name] and floating[name]:
+                floating[name] = _all_match(values, FLOAT_PATTERN)
+
+    fields = []
+    for name in names:
+        if quoted[name]:
+            field_type = pa.string()
+        elif integer[name]:
+            field_type = pa.int64()
+        elif floating[name]:
+            field_type = pa.float64()
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(name, field_type))
+    return pa.schema(fields), {name for name, is_quoted in quoted.items() if is_quoted}
+
+
+def _convert_batch(batch: pa.RecordBatch, schema: pa.Schema, quoted: set[str]) -> pa.RecordBatch:
+    columns = []
+    for field, column in zip(schema, batch.columns):
+        if field.name in quoted:
+            column = pc.utf8_trim(column, characters="'")
+        if field.type != pa.string():
+            column = pc.cast(column, field.type)
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def convert_survey(source: Path, destination: Path) -> dict:
+    """Convert one survey CSV into a typed, compressed Parquet file. Returns its catalog entry."""
+    schema, quoted = infer_schema(source)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_destination = destination.with_name(f".{destination.name}.tmp")
+    with pq.ParquetWriter(tmp_destination, schema, compression=COMPRESSION) as writer:
+        for batch in _open_as_strings(source):
+            writer.write_batch(_convert_batch(batch, schema, quoted), row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_destination, destination)
+
+    metadata = pq.read_metadata(destination)
+    return {
+        "path": destination.name,
+        "source": source.name,
+        "source_fingerprint": fingerprint(source),
+        "rows": metadata.num_rows,
+        "row_groups": metadata.num_row_groups,
+        "size": destination.stat().st_size,
+        "columns": {field.name: str(field.type) for field in schema},
+        "built": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False, years: Optional[list[int]] = None) -> dict:
+    """
+    Convert every AHS survey year whose CSV changed since the last build and refresh the catalog.
+
+    The catalog is rewritten after each year so an interrupted build resumes where it stopped.
+    """
+    parquet_dir = get_parquet_dir(data_dir)
+    catalog_path = parquet_dir / CATALOG_FILENAME
+    catalog = get_catalog(data_dir)
+    surveys: dict = catalog.setdefault("surveys", {})
+    catalog["format"] = "parquet"
+
+    for year, source in survey_sources(data_dir).items():
+        if years and year not in years:
+            continue
+        if not ensure_hydrated(source, data_dir):
+            logger.warning(f"Skipping AHS {year}: {source} is a Git LFS pointer that could not be hydrated, run `git lfs pull` or set BIOME_LFS_MIRROR.")
+            continue
+        entry = surveys.get(str(year))
+        destination = parquet_dir / f"survey_{year}.parquet"
+        if (
+            not force
+            and entry is not None
+            and entry.get("source_fingerprint") == fingerprint(source)
+            and destination.is_file()
+        ):
+            logger.info(f"AHS {year} is up to date.")
+            continue
+        logger.info(f"Converting AHS {year} from {source} to {destination}")
+        surveys[str(year)] = convert_survey(source, destination)
+        write_json(catalog_path, catalog)
+
+    write_json(catalog_path, catalog)
+    return catalog
+
+
+def read_survey(
+    year: int,
+    columns: Optional[list[str]] = None,
+    filters: Optional[list] = None,
+    data_dir: Optional[os.PathLike] = None,
+):
+    """
+    Read one survey year from the Parquet store as a pandas DataFrame.
+
+    Only the requested `columns` are decoded, and `filters` (pyarrow/pandas DNF filter syntax, e.g.
+    `[("OMB13CBSA", "=", "12060")]`) are used to skip row groups whose statistics cannot match.
+    """
+    path = get_parquet_dir(data_dir) / f"survey_{year}.parquet"
+    if not path.is_file():
+        raise FileNotFoundError(
+            f"No Parquet copy of the AHS {year} survey at {path}. Build it with `python -m biome.datasets build ahs`."
+        )
+    return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+
+
+def get_harmonized_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / AHS_FOLDER / HARMONIZED_FOLDER
+
+
+def harmonize_name(name: str) -> str:
+    """Canonical column name: the codebook spells every variable in upper case without quotes."""
+    return name.strip().strip("'\"").upper()
+
+
+def load_codebook_variables(data_dir: Optional[os.PathLike] = None) -> dict[str, dict]:
+    """Codebook rows keyed by canonical variable name. Empty if the codebook is missing or not hydrated."""
+    import pandas as pd
+
+    path = get_data_dir(data_dir) / AHS_FOLDER / CODEBOOK_FILENAME
+    if not ensure_hydrated(path, data_dir):
+        logger.warning(f"AHS codebook not available at {path}, harmonizing types without it.")
+        return {}
+    codebook = pd.read_csv(path, dtype=str, index_col=False).fillna("")
+    return {
+        harmonize_name(row["Variable"]): row
+        for row in codebook.to_dict("records")
+        if row.get("Variable")
+    }
+
+
+def _is_numeric_variable(codebook_row: Optional[dict]) -> bool:
+    if not codebook_row:
+        return False
+    return bool(NUMERIC_RANGE_PATTERN.search(codebook_row.get("Response Codes", "")))
+
+
+def unify_type(year_types: set[str], codebook_row: Optional[dict]) -> pa.DataType:
+    """
+    Pick one storage type for a variable that may be typed differently in different survey years.
+
+    Years that agree keep their type (int64 is widened to float64 if any year has decimals). When some years
+    store a variable as quoted codes and others as plain numbers, the codebook decides: variables whose response
+    codes describe a numeric range become float64 (non-numeric codes such as `M`/`N` become null), everything
+    else stays a string so no code is lost.
+    """
+    if "string" in year_types:
+        if year_types == {"string"} or not _is_numeric_variable(codebook_row):
+            return pa.string()
+        return pa.float64()
+    if "double" in year_types:
+        return pa.float64()
+    return pa.int64()
+
+
+def _cast_column(column: pa.ChunkedArray, target: pa.DataType) -> pa.ChunkedArray:
+    if column.type == target:
+        return column
+    if pa.types.is_string(column.type) and not pa.types.is_string(target):
+        column = pc.if_else(pc.match_substring_regex(column, FLOAT_PATTERN), column, pa.scalar(None, pa.string()))
+    return pc.cast(column, target)
+
+
+def harmonized_schema(catalog: dict, codebook: dict[str, dict]) -> dict:
+    """Unified column description across all converted survey years, as stored in `_schema.json`."""
+    columns: dict[str, dict] = {}
+    for year, entry in sorted(catalog.get("surveys", {}).items()):
+        for name, type_name in entry["columns"].items():
+            canonical = harmonize_name(name)
+            column = columns.setdefault(canonical, {"source_names": {}, "source_types": {}})
+            if year in column["source_names"]:
+                logger.warning(f"AHS {year}: `{name}` collides with `{column['source_names'][year]}`, keeping the latter.")
+                continue
+            column["source_names"][year] = name
+            column["source_types"][year] = type_name
+    for canonical, column in columns.items():
+        codebook_row = codebook.get(canonical)
+        column["type"] = str(unify_type(set(column["source_types"].values()), codebook_row))
+        column["years"] = sorted(int(year) for year in column["source_names"])
+        column["description"] = (codebook_row or {}).get("Description", "")
+    return dict(sorted(columns.items()))
+
+
+def _arrow_schema(columns: dict) -> pa.Schema:
+    return pa.schema(
+        [pa.field(name, pa.type_for_alias(column["type"])) for name, column in columns.items()]
+        + [PARTITION_FIELD]
+    )
+
+
+def _partition_hash(year: str, columns: dict) -> str:
+    year_columns = {name: column["type"] for name, column in columns.items() if year in column["source_names"]}
+    return hashlib.sha256(json.dumps(year_columns, sort_keys=True).encode()).hexdigest()
+
+
+def build_harmonized(data_dir: Optional[os.PathLike] = None, force: bool = False) -> dict:
+    """
+    Build `census-ahs/harmonized/`, one partition per survey year, from the per-year Parquet store.
+
+    A partition is only rewritten when its per-year Parquet file changed or the unified type of one of its columns
+    changed (e.g. a newly converted year turned a numeric column into a coded one).
+    """
+    parquet_dir = get_parquet_dir(data_dir)
+    harmonized_dir = get_harmonized_dir(data_dir)
+    schema_path = harmonized_dir / HARMONIZED_SCHEMA_FILENAME
+    catalog = get_catalog(data_dir)
+    columns = harmonized_schema(catalog, load_codebook_variables(data_dir))
+    previous = read_json(schema_path) or {}
+    partitions: dict = previous.get("partitions", {})
+
+    for year, entry in sorted(catalog.get("surveys", {}).items()):
+        source = parquet_dir / entry["path"]
+        if not source.is_file():
+            continue
+        state = {"source_fingerprint": fingerprint(source), "schema_hash": _partition_hash(year, columns)}
+        partition_dir = harmonized_dir / f"{PARTITION_FIELD.name}={year}"
+        if not force and partitions.get(year) == state and partition_dir.is_dir():
+            logger.info(f"Harmonized AHS {year} is up to date.")
+            continue
+
+        logger.info(f"Harmonizing AHS {year} into {partition_dir}")
+        table = pq.read_table(source)
+        arrays, fields = [], []
+        for canonical, column in columns.items():
+            if (name := column["source_names"].get(year)) is None:
+                continue
+            target = pa.type_for_alias(column["type"])
+            arrays.append(_cast_column(table.column(name), target))
+            fields.append(pa.field(canonical, target))
+        harmonized = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+        tmp_dir = harmonized_dir / f".{partition_dir.name}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        pq.write_table(harmonized, tmp_dir / "part-0.parquet", compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        os.replace(tmp_dir, partition_dir)
+        partitions[year] = state
+
+    # Drop partitions whose survey year is no longer in the catalog.
+    for year in set(partitions) - set(catalog.get("surveys", {})):
+        shutil.rmtree(harmonized_dir / f"{PARTITION_FIELD.name}={year}", ignore_errors=True)
+        partitions.pop(year)
+
+    if columns:
+        pq.write_metadata(_arrow_schema(columns), harmonized_dir / COMMON_METADATA_FILENAME)
+    description = {"partitioning": "hive", "partitions": partitions, "columns": columns}
+    write_json(schema_path, description)
+    return description
+
+
+def open_harmonized(data_dir: Optional[os.PathLike] = None) -> ds.Dataset:
+    """The cross-year AHS dataset, with the unified schema so columns missing in a year read as null."""
+    harmonized_dir = get_harmonized_dir(data_dir)
+    metadata_path = harmonized_dir / COMMON_METADATA_FILENAME
+    if not metadata_path.is_file():
+        raise FileNotFoundError(
+            f"No harmonized AHS dataset at {harmonized_dir}. Build it with `python -m biome.datasets build ahs ahs_harmonized`."
+        )
+    return ds.dataset(harmonized_dir, schema=pq.read_schema(metadata_path), format="parquet", partitioning="hive")
+
+
+def read_harmonized(
+    columns: list[str],
+    years: Optional[list[int]] = None,
+    filters: Optional[list] = None,
+    data_dir: Optional[os.PathLike] = None,
+):
+    """
+    Read a few variables across survey years as one pandas DataFrame with a `year` column.
+
+    `years` prunes whole partitions and `filters` (DNF filter syntax) is pushed down to row-group statistics,
+    so only the requested columns of the matching years are ever read from disk.
+    """
+    dataset = open_harmonized(data_dir)
+    # the lower case partition key is always included; harmonizing it would name the `YEAR` data column instead
+    wanted = [harmonize_name(column) for column in columns if column.strip() != PARTITION_FIELD.name]
+    unknown = [column for column in wanted if column not in dataset.schema.names]
+    if unknown:
+        raise KeyError(f"Unknown AHS variable(s): {', '.join(unknown)}. See `{HARMONIZED_SCHEMA_FILENAME}` for available columns.")
+    expression = None
+    if years:
+        expression = ds.field(PARTITION_FIELD.name).isin(years)
+    if filters:
+        filter_expression = pq.filters_to_expression(filters)
+        expression = filter_expression if expression is None else expression & filter_expression
+    table = dataset.to_table(columns=wanted + [PARTITION_FIELD.name], filter=expression)
+    return table.to_pandas()
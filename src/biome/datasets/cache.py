@@ -0,0 +1,238 @@
+"""
+In-kernel cache for DataFrames read from local dataset files.
+
+Installed into the Python subkernel by the `setup` procedure. The pandas readers (`read_csv`, `read_sas`,
+`read_parquet`, ...) are wrapped so that reading the same file with the same arguments again returns the frame
+loaded earlier instead of re-parsing it. Entries are keyed by reader, resolved path, file size/mtime and the read
+arguments, so a modified file is always re-read, and are evicted least-recently-used first once the cached frames
+exceed a memory budget.
+"""
+import functools
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHED_READERS = ["read_csv", "read_table", "read_sas", "read_parquet", "read_feather", "read_excel", "read_json"]
+# Arguments that make a reader return an iterator/handle rather than a DataFrame.
+STREAMING_ARGUMENTS = {"chunksize", "iterator"}
+# Small files parse faster than the bookkeeping is worth.
+MIN_FILE_SIZE = 1024 * 1024
+DEFAULT_BUDGET_FRACTION = 0.25
+FALLBACK_BUDGET_MB = 2048
+CGROUP_MEMORY_LIMIT_FILES = ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]
+
+
+def default_budget_bytes() -> int:
+    """A quarter of the container's memory limit (cgroup v2 or v1), or 2 GB if there is none."""
+    for limit_file in CGROUP_MEMORY_LIMIT_FILES:
+        try:
+            limit = Path(limit_file).read_text().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge page-aligned number.
+        if limit.isdigit() and int(limit) < 2**60:
+            return int(int(limit) * DEFAULT_BUDGET_FRACTION)
+    return FALLBACK_BUDGET_MB * 1024 * 1024
+
+
+def is_literal(value: Any) -> bool:
+    """Whether a value is a plain literal (str, int, float, bool, None, or a list, tuple or dict of them)."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(is_literal(item) for item in value)
+    if isinstance(value, dict):
+        return all(is_literal(key) and is_literal(item) for key, item in value.items())
+    return False
+
+
+def _size_of(value: Any) -> int:
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(_size_of(item) for item in value.values())
+    return 0
+
+
+def _detach(value: Any) -> Any:
+    """
+    Hand out a frame that cannot be used to modify the cached one.
+
+    With pandas copy-on-write (the default from pandas 3) a shallow copy is enough and costs nothing; otherwise the
+    data has to be copied, which is still far cheaper than parsing the file again.
+    """
+    import pandas as pd
+
+    if isinstance(value, dict):
+        return {key: _detach(item) for key, item in value.items()}
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        copy_on_write = int(pd.__version__.split(".")[0]) >= 3 or pd.options.mode.copy_on_write is True
+        return value.copy(deep=not copy_on_write)
+    return value
+
+
+class DatasetCache:
+    """LRU cache of loaded datasets bounded by the memory they use."""
+
+    def __init__(self, budget_bytes: Optional[int] = None):
+        self.budget_bytes = budget_bytes if budget_bytes is not None else default_budget_bytes()
+        self.entries: OrderedDict[tuple, tuple[Any, int]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(reader_name: str, path: Path, args: tuple, kwargs: dict) -> tuple:
+        stat = path.stat()
+        arguments = repr(args) + repr(sorted(kwargs.items()))
+        return (reader_name, str(path), stat.st_size, stat.st_mtime_ns, arguments)
+
+    def load(self, reader: Callable, path: os.PathLike, *args, **kwargs) -> Any:
+        """
+        Return `reader(path, *args, **kwargs)`, from the cache if this file was read the same way before. Reads with
+        arguments that are not plain literals are never cached: the key holds the arguments' reprs, and a callable
+        `usecols` or a numpy array does not repr to its value.
+        """
+        path = Path(path).resolve()
+        if not all(is_literal(value) for value in (*args, *kwargs.values())):
+            return reader(str(path), *args, **kwargs)
+        key = self.make_key(getattr(reader, "__qualname__", repr(reader)), path, args, kwargs)
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return _detach(self.entries[key][0])
+        self.misses += 1
+        value = reader(str(path), *args, **kwargs)
+        self._store(key, value)
+        return _detach(value)
+
+    def _store(self, key: tuple, value: Any) -> None:
+        size = _size_of(value)
+        if size == 0 or size > self.budget_bytes:
+            return
+        with self._lock:
+            # A changed file gets a new key; drop the stale versions of it straight away.
+            for stale_key in [k for k in self.entries if k[:2] == key[:2] and k[2:4] != key[2:4]]:
+                self._evict(stale_key)
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.budget_bytes and self.entries:
+                self._evict(next(iter(self.entries)))
+
+    def resize(self, budget_bytes: int) -> None:
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            while self.size > self.budget_bytes and self.entries:
+                self._evict(next(iter(self.entries)))
+
+    def _evict(self, key: tuple) -> None:
+        _, size = self.entries.pop(key)
+        self.size -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "entries": [
+                    {"reader": key[0], "path": key[1], "arguments": key[4], "size_mb": round(size / 2**20, 1)}
+                    for key, (_, size) in self.entries.items()
+                ],
+                "size_mb": round(self.size / 2**20, 1),
+                "budget_mb": round(self.budget_bytes / 2**20, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __repr__(self):
+        info = self.info()
+        return (
+            f"<DatasetCache {len(info['entries'])} entries, {info['size_mb']}/{info['budget_mb']} MB, "
+            f"{info['hits']} hits, {info['misses']} misses>"
+        )
+
+
+def _cached_reader(cache: DatasetCache, reader: Callable) -> Callable:
+    @functools.wraps(reader)
+    def wrapper(filepath_or_buffer, *args, **kwargs):
+        if (
+            isinstance(filepath_or_buffer, (str, os.PathLike))
+            and not STREAMING_ARGUMENTS.intersection(kwargs)
+            and os.path.isfile(filepath_or_buffer)
+            and os.path.getsize(filepath_or_buffer) >= MIN_FILE_SIZE
+        ):
+            try:
+                return cache.load(reader, filepath_or_buffer, *args, **kwargs)
+            except TypeError:
+                # Unrepresentable arguments; fall through to an uncached read.
+                pass
+        return reader(filepath_or_buffer, *args, **kwargs)
+
+    setattr(wrapper, "__biome_cached__", reader)
+    return wrapper
+
+
+_installed_cache: Optional[DatasetCache] = None
+
+
+def parse_budget_mb(value: Optional[float | str]) -> Optional[float]:
+    """A budget in MB from a number or its string form (e.g. `BIOME_DATASET_CACHE_MB`), None for the default."""
+    if value is None or not isinstance(value, str):
+        return value
+    if value.strip() in ("", "None"):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Ignoring the dataset cache budget {value!r}, which is not a number of MB; using the default.")
+        return None
+
+
+def install_dataset_cache(budget_mb: Optional[float | str] = None) -> DatasetCache:
+    """
+    Route the pandas file readers through a shared `DatasetCache`. Calling it again only updates the budget.
+
+    Pass `budget_mb` to override the default budget (a quarter of the container memory limit). A string that is not
+    a number falls back to the default.
+    """
+    import pandas as pd
+
+    budget_mb = parse_budget_mb(budget_mb)
+
+    global _installed_cache
+    if _installed_cache is None:
+        _installed_cache = DatasetCache()
+        for reader_name in CACHED_READERS:
+            reader = getattr(pd, reader_name, None)
+            if reader is not None and not hasattr(reader, "__biome_cached__"):
+                setattr(pd, reader_name, _cached_reader(_installed_cache, reader))
+    if budget_mb is not None:
+        _installed_cache.resize(int(budget_mb * 1024 * 1024))
+    return _installed_cache
+
+
+def uninstall_dataset_cache() -> None:
+    """Restore the original pandas readers and free the cached frames."""
+    import pandas as pd
+
+    global _installed_cache
+    for reader_name in CACHED_READERS:
+        reader = getattr(pd, reader_name, None)
+        if reader is not None and hasattr(reader, "__biome_cached__"):
+            setattr(pd, reader_name, reader.__biome_cached__)
+    if _installed_cache is not None:
+        _installed_cache.clear()
+        _installed_cache = None
@@ -0,0 +1,204 @@
+"""
+In-process inverted index over the codebooks of the local datasets and the tabular spec attachments.
+
+Indexes every `*codebook*.csv` / `*dictionary*.csv` under the data folder and every CSV attached to a specification
+(e.g. the FAERS field reference). Each row becomes an entry with its variable name, descriptive text and parsed
+response codes, so the agent can resolve variables, labels and value codes without running code in the kernel.
+"""
+import csv
+import logging
+import os
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .utils import fingerprint, get_data_dir, is_lfs_pointer
+
+logger = logging.getLogger(__name__)
+
+CODEBOOK_GLOBS = ["**/*codebook*.csv", "**/*dictionary*.csv"]
+ATTACHMENT_GLOB = "*/attachments/*.csv"
+
+VARIABLE_COLUMNS = ["Variable", "Field Name", "Field", "Name"]
+TEXT_COLUMNS = ["Description", "Question", "Question Text", "Label", "Topic", "Section", "Universe", "User Notes"]
+CODE_COLUMNS = ["Response Codes", "Response Code"]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# `1: Yes || 2: No` (AHS) and `1=Yes||2=No` (NSCH)
+CODE_PATTERN = re.compile(r"^\s*'?([^:=']+?)'?\s*[:=]\s*(.+?)\s*$")
+VALUE_QUERY_PATTERN = re.compile(r"^\s*([A-Za-z_][\w.]*)\s*(?:=|==|:)\s*'?([^']+?)'?\s*$")
+
+VARIABLE_WEIGHT = 4.0
+TEXT_WEIGHT = 1.0
+CODE_WEIGHT = 0.5
+
+
+def get_specifications_dir() -> Path:
+    return (Path(os.environ.get("INTEGRATION_PATH", "./adhoc_data")) / "specifications").resolve()
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def parse_codes(response_codes: str) -> dict[str, str]:
+    """Split a response code cell into `{code: label}`; free text that is not a code list yields `{}`."""
+    codes = {}
+    for part in response_codes.split("||"):
+        if not part.strip():
+            continue
+        if not (match := CODE_PATTERN.match(part)):
+            return {}
+        codes[match.group(1).strip()] = match.group(2)
+    return codes
+
+
+@dataclass
+class CodebookEntry:
+    dataset: str
+    source: str
+    variable: str
+    text: dict[str, str]
+    codes: dict[str, str] = field(default_factory=dict)
+
+    def format(self, code: Optional[str] = None) -> str:
+        lines = [f"{self.variable} ({self.dataset}, {self.source})"]
+        lines.extend(f"  {name}: {value}" for name, value in self.text.items() if value)
+        if code is not None:
+            label = self.codes.get(code)
+            lines.append(f"  Value {code}: {label}" if label is not None else f"  Value {code} is not a listed response code.")
+        elif self.codes:
+            lines.append("  Codes: " + " || ".join(f"{key}={value}" for key, value in self.codes.items()))
+        return "\n".join(lines)
+
+
+def _pick(row: dict, columns: list[str]) -> Optional[str]:
+    return next((column for column in columns if row.get(column)), None)
+
+
+def read_codebook(path: Path, dataset: str) -> list[CodebookEntry]:
+    entries = []
+    with path.open(newline="", encoding="utf-8-sig", errors="replace") as f:
+        for row in csv.DictReader(f):
+            row = {(key or "").strip(): (value or "").strip() for key, value in row.items() if key}
+            if not (variable_column := _pick(row, VARIABLE_COLUMNS)):
+                continue
+            code_column = _pick(row, CODE_COLUMNS)
+            entries.append(CodebookEntry(
+                dataset=dataset,
+                source=path.name,
+                variable=row[variable_column].strip("'\""),
+                text={column: row[column] for column in TEXT_COLUMNS if row.get(column)},
+                codes=parse_codes(row[code_column]) if code_column else {},
+            ))
+    return entries
+
+
+def codebook_files(data_dir: Optional[os.PathLike] = None) -> dict[Path, str]:
+    """Codebook path -> dataset name (its folder under the data dir, or its specification)."""
+    data_dir = get_data_dir(data_dir)
+    files = {}
+    for pattern in CODEBOOK_GLOBS:
+        for path in sorted(data_dir.glob(pattern)):
+            files[path] = path.relative_to(data_dir).parts[0]
+    for path in sorted(get_specifications_dir().glob(ATTACHMENT_GLOB)):
+        files[path] = path.parent.parent.name
+    return files
+
+
+class CodebookIndex:
+    """Inverted index over codebook entries, with exact and prefix lookups on variable names."""
+
+    def __init__(self, entries: list[CodebookEntry]):
+        self.entries = entries
+        self.by_variable: dict[str, list[int]] = defaultdict(list)
+        self.postings: dict[str, dict[int, float]] = defaultdict(lambda: defaultdict(float))
+        for entry_id, entry in enumerate(entries):
+            self.by_variable[entry.variable.upper()].append(entry_id)
+            for token in tokenize(entry.variable):
+                self.postings[token][entry_id] += VARIABLE_WEIGHT
+            for value in entry.text.values():
+                for token in tokenize(value):
+                    self.postings[token][entry_id] += TEXT_WEIGHT
+            for label in entry.codes.values():
+                for token in tokenize(label):
+                    self.postings[token][entry_id] += CODE_WEIGHT
+        self.variables = sorted(self.by_variable)
+
+    @property
+    def datasets(self) -> list[str]:
+        return sorted({entry.dataset for entry in self.entries})
+
+    def _in_dataset(self, entry_id: int, dataset: Optional[str]) -> bool:
+        return not dataset or dataset.lower() in self.entries[entry_id].dataset.lower()
+
+    def variable(self, name: str, dataset: Optional[str] = None) -> list[CodebookEntry]:
+        return [self.entries[i] for i in self.by_variable.get(name.strip().upper(), []) if self._in_dataset(i, dataset)]
+
+    def variable_prefix(self, prefix: str, dataset: Optional[str] = None) -> list[CodebookEntry]:
+        prefix = prefix.strip().upper()
+        matches: list[CodebookEntry] = []
+        for name in self.variables[bisect_left(self.variables, prefix):]:
+            if not name.startswith(prefix):
+                break
+            matches.extend(self.entries[i] for i in self.by_variable[name] if self._in_dataset(i, dataset))
+        return matches
+
+    def search(self, query: str, dataset: Optional[str] = None, limit: int = 10) -> list[CodebookEntry]:
+        """Entries ranked by how many query terms they contain, then by weighted term frequency."""
+        matched: dict[int, int] = defaultdict(int)
+        scores: dict[int, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            for entry_id, weight in self.postings.get(token, {}).items():
+                if self._in_dataset(entry_id, dataset):
+                    matched[entry_id] += 1
+                    scores[entry_id] += weight / (1 + len(self.postings[token]) / len(self.entries))
+        ranked = sorted(scores, key=lambda entry_id: (matched[entry_id], scores[entry_id]), reverse=True)
+        return [self.entries[entry_id] for entry_id in ranked[:limit]]
+
+    def lookup(self, query: str, dataset: Optional[str] = None, limit: int = 10) -> str:
+        """
+        Answer a variable (`K2Q40A`), value code (`K2Q40A=1`), variable prefix (`K2Q4*`) or free text
+        (`asthma diagnosis`) query as plain text.
+        """
+        if (match := VALUE_QUERY_PATTERN.match(query)) and (entries := self.variable(match.group(1), dataset)):
+            return "\n\n".join(entry.format(code=match.group(2)) for entry in entries[:limit])
+        if query.strip().endswith("*"):
+            entries = self.variable_prefix(query.strip().rstrip("*"), dataset)
+            if entries:
+                more = f"\n\n({len(entries) - limit} more variables match)" if len(entries) > limit else ""
+                return "\n\n".join(entry.format() for entry in entries[:limit]) + more
+        exact = self.variable(query, dataset)
+        related = [entry for entry in self.search(query, dataset, limit) if entry not in exact]
+        entries = (exact + related)[:limit]
+        if not entries:
+            return f"No codebook entries match '{query}'. Indexed datasets: {', '.join(self.datasets)}"
+        return "\n\n".join(entry.format() for entry in entries)
+
+
+_index: Optional[CodebookIndex] = None
+_index_fingerprints: dict = {}
+_index_lock = threading.Lock()
+
+
+def get_codebook_index(data_dir: Optional[os.PathLike] = None) -> CodebookIndex:
+    """The process-wide index, rebuilt only when a codebook file is added, removed or modified."""
+    global _index, _index_fingerprints
+    files = {path: dataset for path, dataset in codebook_files(data_dir).items() if not is_lfs_pointer(path)}
+    fingerprints = {str(path): fingerprint(path) for path in files}
+    with _index_lock:
+        if _index is None or fingerprints != _index_fingerprints:
+            entries = []
+            for path, dataset in files.items():
+                try:
+                    entries.extend(read_codebook(path, dataset))
+                except (OSError, csv.Error) as e:
+                    logger.warning(f"Could not index codebook {path}: {e}")
+            _index = CodebookIndex(entries)
+            _index_fingerprints = fingerprints
+            logger.info(f"Indexed {len(entries)} codebook entries from {len(files)} files.")
+        return _index
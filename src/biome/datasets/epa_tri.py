@@ -0,0 +1,184 @@
+"""
+Materialized rollups of the EPA Toxics Release Inventory file.
+
+Almost every question about `epa-tri/EPA_TRI_Toxics_2014_2023.csv` aggregates releases by state, county, chemical
+and/or year. `build` computes those aggregates once into small Parquet tables under `epa-tri/rollups/`, sorted by
+their keys so filters on them only touch the matching row groups, and recomputes them only when the sha256 of the
+source file changes.
+"""
+import csv
+import datetime
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from .lfs import ensure_hydrated
+from .utils import fingerprint, get_data_dir, read_json, sha256sum, write_json
+
+logger = logging.getLogger(__name__)
+
+TRI_FOLDER = "epa-tri"
+SOURCE_FILENAME = "EPA_TRI_Toxics_2014_2023.csv"
+ROLLUP_FOLDER = "rollups"
+CATALOG_FILENAME = "catalog.json"
+ROW_GROUP_SIZE = 10_000
+COMPRESSION = "zstd"
+
+FACILITY_COLUMN = "TRI Facility ID"
+# Summed as-is, so the rollups use the same column names as the raw file.
+MEASURE_COLUMNS = ["Releases (lb)", "Waste Managed (lb)", "RSEI Hazard"]
+# Name given to the empty field after a trailing comma, which the rollups never include.
+TRAILING_COLUMN = "__trailing__"
+ROLLUPS = {
+    "year": ["Year"],
+    "state_year": ["State", "Year"],
+    "county_year": ["State", "County", "Year"],
+    "chemical_year": ["Chemical", "Year"],
+    "state_chemical_year": ["State", "Chemical", "Year"],
+    "county_chemical_year": ["State", "County", "Chemical", "Year"],
+    "region_year": ["EPA Region", "Year"],
+}
+
+
+def get_rollup_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / TRI_FOLDER / ROLLUP_FOLDER
+
+
+def get_catalog(data_dir: Optional[os.PathLike] = None) -> dict:
+    return read_json(get_rollup_dir(data_dir) / CATALOG_FILENAME) or {"rollups": {}}
+
+
+def column_names(source: Path, delimiter: str = ",") -> list[str]:
+    """
+    The header of the file, plus `TRAILING_COLUMN` when the rows end with a delimiter the header doesn't have (the
+    case pandas needs `index_col=False` for, and that pyarrow rejects as a row with too many columns).
+    """
+    with open(source, newline="", encoding="utf-8", errors="replace") as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        header = next(reader, [])
+        first_row = next(reader, [])
+    if len(first_row) == len(header) + 1 and not first_row[-1].strip():
+        return header + [TRAILING_COLUMN]
+    return header
+
+
+def read_source(source: Path) -> pa.Table:
+    """The columns the rollups need, with measures parsed as numbers (thousands separators tolerated)."""
+    header = column_names(source)
+    wanted = sorted({key for keys in ROLLUPS.values() for key in keys} | set(MEASURE_COLUMNS) | {FACILITY_COLUMN})
+    columns = [column for column in wanted if column in header]
+    table = pacsv.read_csv(
+        source,
+        read_options=pacsv.ReadOptions(column_names=header, skip_rows=1),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.string() for column in columns},
+            strings_can_be_null=True,
+        ),
+    )
+    for column in MEASURE_COLUMNS:
+        if column in table.column_names:
+            values = pc.replace_substring(pc.utf8_trim_whitespace(table.column(column)), ",", "")
+            values = pc.if_else(pc.equal(values, ""), None, values)
+            table = table.set_column(table.schema.get_field_index(column), column, pc.cast(values, pa.float64()))
+    if "Year" in table.column_names:
+        table = table.set_column(table.schema.get_field_index("Year"), "Year", pc.cast(table.column("Year"), pa.int16()))
+    return table
+
+
+def rollup(table: pa.Table, keys: list[str]) -> pa.Table:
+    aggregations: list[tuple] = [(column, "sum") for column in MEASURE_COLUMNS if column in table.column_names]
+    aggregations.append((keys[0], "count", pc.CountOptions(mode="all")))
+    if FACILITY_COLUMN in table.column_names:
+        aggregations.append((FACILITY_COLUMN, "count_distinct"))
+    result = table.group_by(keys).aggregate(aggregations)
+    names = {f"{column}_sum": column for column in MEASURE_COLUMNS}
+    names[f"{keys[0]}_count"] = "Reports"
+    names[f"{FACILITY_COLUMN}_count_distinct"] = "Facilities"
+    result = result.rename_columns([names.get(name, name) for name in result.column_names])
+    return result.select(keys + [name for name in result.column_names if name not in keys]).sort_by(
+        [(key, "ascending") for key in keys]
+    )
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False) -> dict:
+    """Recompute the rollups if the checksum of the TRI file changed since the last build."""
+    source = get_data_dir(data_dir) / TRI_FOLDER / SOURCE_FILENAME
+    rollup_dir = get_rollup_dir(data_dir)
+    catalog_path = rollup_dir / CATALOG_FILENAME
+    catalog = get_catalog(data_dir)
+
+    if not source.is_file():
+        logger.warning(f"Skipping EPA TRI rollups: {source} does not exist.")
+        return catalog
+    if not ensure_hydrated(source, data_dir):
+        logger.warning(f"Skipping EPA TRI rollups: {source} is a Git LFS pointer that could not be hydrated, run `git lfs pull` or set BIOME_LFS_MIRROR.")
+        return catalog
+
+    checksum = None
+    rollups_present = all((rollup_dir / f"{name}.parquet").is_file() for name in catalog["rollups"])
+    if not force and catalog["rollups"] and rollups_present:
+        # Hashing 70+ MB is only needed when the cheap fingerprint says the file may have changed.
+        if catalog.get("source_fingerprint") == fingerprint(source):
+            logger.info("EPA TRI rollups are up to date.")
+            return catalog
+        if catalog.get("source_sha256") == (checksum := sha256sum(source)):
+            logger.info("EPA TRI file was touched but its content is unchanged; rollups are up to date.")
+            catalog["source_fingerprint"] = fingerprint(source)
+            write_json(catalog_path, catalog)
+            return catalog
+
+    logger.info(f"Computing EPA TRI rollups from {source}")
+    table = read_source(source)
+    rollup_dir.mkdir(parents=True, exist_ok=True)
+    rollups = {}
+    for name, keys in ROLLUPS.items():
+        if (missing := [key for key in keys if key not in table.column_names]):
+            logger.warning(f"Skipping EPA TRI rollup `{name}`: missing column(s) {', '.join(missing)}")
+            continue
+        result = rollup(table, keys)
+        destination = rollup_dir / f"{name}.parquet"
+        tmp_destination = destination.with_name(f".{destination.name}.tmp")
+        pq.write_table(result, tmp_destination, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_destination, destination)
+        rollups[name] = {
+            "path": destination.name,
+            "keys": keys,
+            "rows": result.num_rows,
+            "columns": {field.name: str(field.type) for field in result.schema},
+        }
+
+    catalog = {
+        "source": source.name,
+        "source_sha256": checksum or sha256sum(source),
+        "source_fingerprint": fingerprint(source),
+        "source_rows": table.num_rows,
+        "rollups": rollups,
+        "built": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    write_json(catalog_path, catalog)
+    return catalog
+
+
+def read_rollup(
+    name: str,
+    columns: Optional[list[str]] = None,
+    filters: Optional[list] = None,
+    data_dir: Optional[os.PathLike] = None,
+):
+    """
+    Read one rollup (see `ROLLUPS`) as a pandas DataFrame, e.g.
+    `read_rollup("state_chemical_year", filters=[("State", "=", "TX"), ("Year", ">=", 2020)])`.
+    """
+    if name not in ROLLUPS:
+        raise KeyError(f"Unknown EPA TRI rollup `{name}`. Available rollups: {', '.join(ROLLUPS)}")
+    path = get_rollup_dir(data_dir) / f"{name}.parquet"
+    if not path.is_file():
+        raise FileNotFoundError(f"{path} does not exist. Build it with `python -m biome.datasets build epa_tri`.")
+    return pq.read_table(path, columns=columns, filters=filters).to_pandas()
@@ -0,0 +1,245 @@
+"""
+Pre-simplified US county and state geometries, keyed by FIPS, for choropleth maps.
+
+`build` downloads the Census cartographic boundary files (1:500k) once into `geo/source/` and writes one GeoParquet
+file per level and detail, `geo/<county|state>_<fine|medium|coarse>.parquet`, listed in `geo/catalog.json`.
+Each detail is simplified as a coverage (shared borders are simplified once, so neighbours keep touching) and its
+coordinates are snapped to a grid, which keeps a national county map at the coarse detail to a few hundred KB.
+
+In the kernel, `county_geometries`, `state_geometries` and `choropleth` are imported by the setup procedure.
+"""
+import functools
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from .utils import fingerprint, get_data_dir, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+GEO_FOLDER = "geo"
+SOURCE_FOLDER = "source"
+CATALOG_FILENAME = "catalog.json"
+BOUNDARY_YEAR = 2023
+SOURCE_URL = "https://www2.census.gov/geo/tiger/GENZ{year}/shp/cb_{year}_us_{level}_500k.zip"
+LEVELS = ["county", "state"]
+# Simplification tolerance and coordinate grid in degrees (~100 m, ~1 km and ~5 km at mid-latitudes).
+DETAILS = {
+    "fine": {"tolerance": 0.001, "grid": 0.0001},
+    "medium": {"tolerance": 0.01, "grid": 0.001},
+    "coarse": {"tolerance": 0.05, "grid": 0.01},
+}
+DEFAULT_DETAIL = "medium"
+
+
+def get_geo_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / GEO_FOLDER
+
+
+def get_catalog(data_dir: Optional[os.PathLike] = None) -> dict:
+    return read_json(get_geo_dir(data_dir) / CATALOG_FILENAME) or {"files": {}}
+
+
+def geometry_path(level: str, detail: str, data_dir: Optional[os.PathLike] = None) -> Path:
+    if level not in LEVELS:
+        raise ValueError(f"Unknown level `{level}`, expected one of: {', '.join(LEVELS)}")
+    if detail not in DETAILS:
+        raise ValueError(f"Unknown detail `{detail}`, expected one of: {', '.join(DETAILS)}")
+    return get_geo_dir(data_dir) / f"{level}_{detail}.parquet"
+
+
+def download_source(level: str, data_dir: Optional[os.PathLike] = None) -> Path:
+    """The boundary shapefile archive for a level, downloaded from the Census Bureau if missing."""
+    import requests
+
+    url = SOURCE_URL.format(year=BOUNDARY_YEAR, level=level)
+    destination = get_geo_dir(data_dir) / SOURCE_FOLDER / url.rsplit("/", 1)[-1]
+    if destination.is_file():
+        return destination
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Downloading {url}")
+    tmp_destination = destination.with_name(f".{destination.name}.tmp")
+    with requests.get(url, stream=True, timeout=120) as response:
+        response.raise_for_status()
+        with tmp_destination.open("wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+    os.replace(tmp_destination, destination)
+    return destination
+
+
+def read_source(level: str, source: Path):
+    """The boundaries of a level with normalized columns: FIPS, STATE_FIPS, [COUNTY_FIPS], STATE, NAME, geometry."""
+    import geopandas as gpd
+
+    boundaries = gpd.read_file(f"zip://{source}").to_crs(epsg=4326)
+    if level == "county":
+        columns = {"GEOID": "FIPS", "STATEFP": "STATE_FIPS", "COUNTYFP": "COUNTY_FIPS", "STUSPS": "STATE", "NAME": "NAME"}
+    else:
+        columns = {"GEOID": "FIPS", "STATEFP": "STATE_FIPS", "STUSPS": "STATE", "NAME": "NAME"}
+    boundaries = boundaries[[column for column in columns if column in boundaries.columns] + ["geometry"]]
+    return boundaries.rename(columns=columns).sort_values("FIPS", ignore_index=True)
+
+
+def simplify(boundaries, tolerance: float, grid: float):
+    """Simplify a set of boundaries as one coverage and snap the coordinates to `grid`."""
+    import shapely
+
+    geometries = boundaries.geometry.values
+    try:
+        simplified = shapely.coverage_simplify(geometries, tolerance)
+    except Exception as e:
+        # shapely < 2.1, or a source that is not a clean coverage: simplify each shape on its own
+        logger.warning(f"Coverage simplification failed ({e}), simplifying shapes independently.")
+        simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    simplified = shapely.set_precision(simplified, grid)
+    result = boundaries.copy()
+    result.geometry = shapely.make_valid(simplified)
+    return result[~result.geometry.is_empty]
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False) -> dict:
+    """Write the details of every level whose source changed since the last build (downloading the sources once)."""
+    geo_dir = get_geo_dir(data_dir)
+    catalog = get_catalog(data_dir)
+    for level in LEVELS:
+        source = download_source(level, data_dir)
+        destinations = {detail: geometry_path(level, detail, data_dir) for detail in DETAILS}
+        if not force and all(
+            catalog["files"].get(destination.name, {}).get("source_fingerprint") == fingerprint(source)
+            and destination.is_file()
+            for destination in destinations.values()
+        ):
+            continue
+        # Each detail is simplified from the previous, finer one, which leaves far fewer vertices to process; a coarse
+        # outline then deviates from the source by at most the sum of the tolerances, instead of its own tolerance.
+        simplified = read_source(level, source)
+        for detail, settings in DETAILS.items():
+            destination = destinations[detail]
+            logger.info(f"Simplifying {level} boundaries ({detail}, tolerance {settings['tolerance']} degrees)")
+            simplified = simplify(simplified, settings["tolerance"], settings["grid"])
+            tmp_destination = destination.with_name(f".{destination.name}.tmp")
+            simplified.to_parquet(tmp_destination, index=False, compression="zstd")
+            os.replace(tmp_destination, destination)
+            catalog["files"][destination.name] = {
+                "level": level,
+                "detail": detail,
+                **settings,
+                "features": len(simplified),
+                "bytes": destination.stat().st_size,
+                "source": source.name,
+                "source_fingerprint": fingerprint(source),
+            }
+            write_json(geo_dir / CATALOG_FILENAME, catalog)
+    return catalog
+
+
+@functools.lru_cache(maxsize=16)
+def _load(level: str, detail: str, data_dir: Path):
+    import geopandas as gpd
+
+    path = geometry_path(level, detail, data_dir)
+    if not path.is_file():
+        logger.info(f"{path} has not been built yet, building the geometry cache.")
+        build(data_dir)
+    return gpd.read_parquet(path).set_index("FIPS", drop=False)
+
+
+def _state_fips(states, data_dir: Optional[os.PathLike] = None) -> Optional[list[str]]:
+    """State FIPS codes from FIPS codes (numbers or strings) and/or postal codes such as "TX"."""
+    if states is None:
+        return None
+    if isinstance(states, (str, int)):
+        states = [states]
+    by_postal_code = None
+    codes = []
+    for state in states:
+        state = str(state).strip()
+        if state.isdigit():
+            codes.append(state.zfill(2))
+            continue
+        if by_postal_code is None:
+            state_table = _load("state", "coarse", get_data_dir(data_dir))
+            by_postal_code = dict(zip(state_table["STATE"].str.upper(), state_table["STATE_FIPS"]))
+        if state.upper() not in by_postal_code:
+            raise ValueError(f"Unknown state `{state}`")
+        codes.append(by_postal_code[state.upper()])
+    return codes
+
+
+def county_geometries(detail: str = DEFAULT_DETAIL, states=None, data_dir: Optional[os.PathLike] = None):
+    """
+    County boundaries as a GeoDataFrame indexed by 5-digit FIPS, with STATE_FIPS, COUNTY_FIPS, STATE and NAME.
+
+    `detail` is "fine" (a few states), "medium" (regional) or "coarse" (national maps); `states` restricts the
+    result to FIPS or postal codes, e.g. ["TX", "48", 6].
+    """
+    counties = _load("county", detail, get_data_dir(data_dir))
+    if (codes := _state_fips(states, data_dir)) is not None:
+        counties = counties[counties["STATE_FIPS"].isin(codes)]
+    return counties.copy()
+
+
+def state_geometries(detail: str = DEFAULT_DETAIL, data_dir: Optional[os.PathLike] = None):
+    """State boundaries as a GeoDataFrame indexed by 2-digit FIPS, with STATE_FIPS, STATE and NAME."""
+    return _load("state", detail, get_data_dir(data_dir)).copy()
+
+
+def normalize_fips(values, level: str = "county"):
+    """Zero-padded FIPS strings from numbers or strings (e.g. 6037 or "6037.0" -> "06037")."""
+    import pandas as pd
+
+    width = 5 if level == "county" else 2
+    text = pd.Series(values).astype("string").str.strip().str.replace(r"\.0$", "", regex=True)
+    return text.str.zfill(width)
+
+
+def choropleth(
+    data,
+    value: str,
+    fips: str = "FIPS",
+    level: str = "county",
+    detail: Optional[str] = None,
+    fill_color: str = "YlOrRd",
+    tooltip: Optional[list[str]] = None,
+    **map_kwargs,
+):
+    """
+    A folium choropleth of `data[value]` by FIPS code, drawn with the cached simplified geometries.
+
+    Only the states present in `data` are drawn. Without an explicit `detail`, maps spanning many states use the
+    coarse geometries and maps of one or a few states the finer ones, so the output stays small.
+    """
+    import folium
+
+    frame = data.reset_index() if fips not in data.columns else data.copy()
+    frame["FIPS"] = normalize_fips(frame[fips], level).values
+    state_codes = sorted(frame["FIPS"].str[:2].dropna().unique())
+    if detail is None:
+        detail = "fine" if len(state_codes) <= 2 else "medium" if len(state_codes) <= 10 else "coarse"
+    if level == "county":
+        shapes = county_geometries(detail, states=state_codes)
+    else:
+        shapes = state_geometries(detail)
+        shapes = shapes[shapes["STATE_FIPS"].isin(state_codes)]
+    columns = ["FIPS", value] + [column for column in tooltip or [] if column in frame.columns and column not in ("FIPS", value)]
+    shapes = shapes.reset_index(drop=True).merge(frame[columns].drop_duplicates("FIPS"), on="FIPS", how="left")
+
+    west, south, east, north = shapes.total_bounds
+    folium_map = folium.Map(**{"tiles": "cartodbpositron", **map_kwargs})
+    folium_map.fit_bounds([[south, west], [north, east]])
+    layer = folium.Choropleth(
+        geo_data=shapes[["FIPS", "NAME", value, "geometry"] + columns[2:]],
+        data=shapes,
+        columns=["FIPS", value],
+        key_on="feature.properties.FIPS",
+        fill_color=fill_color,
+        fill_opacity=0.8,
+        line_opacity=0.2,
+        nan_fill_color="lightgray",
+        legend_name=value,
+    )
+    layer.add_to(folium_map)
+    layer.geojson.add_child(folium.GeoJsonTooltip(fields=["NAME", "FIPS", value] + columns[2:]))
+    return folium_map
@@ -0,0 +1,321 @@
+"""
+On-demand hydration of Git LFS pointer files under the data folder.
+
+A checkout without `git lfs pull` only has ~130 byte pointer files (`version`, `oid sha256:<hex>`, `size`) in place
+of the data. Instead of pulling every file at container start, a pointer is replaced by its content the first time
+something reads it, fetched from the mirrors listed in `BIOME_LFS_MIRROR` (comma-separated, tried in order):
+
+- a local directory (e.g. a mounted volume, or a `.git/lfs/objects` folder),
+- `s3://bucket/prefix`, `gs://bucket/prefix`, or an `http(s)://` base URL.
+
+Each mirror is looked up both by the file's path relative to the data folder and by the LFS object layout
+(`ab/cd/abcd...`). The content is copied in parallel byte-range chunks into a temporary file, verified against the
+pointer's sha256 oid, and only then moved over the pointer.
+"""
+import functools
+import logging
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+from .utils import LFS_POINTER_MAX_SIZE, get_data_dir, is_lfs_pointer, sha256sum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_CHUNK_MB = 64
+POINTER_PATTERN = re.compile(r"^oid sha256:(?P<oid>[0-9a-f]{64})\s*^size (?P<size>\d+)\s*", re.MULTILINE)
+HYDRATED_READERS = ["read_csv", "read_table", "read_sas", "read_parquet", "read_feather", "read_excel", "read_json", "read_stata"]
+
+
+@dataclass
+class LfsPointer:
+    oid: str
+    size: int
+
+    @property
+    def object_key(self) -> str:
+        """Where git-lfs keeps the object in its own storage, e.g. `.git/lfs/objects/ab/cd/abcd...`."""
+        return f"{self.oid[:2]}/{self.oid[2:4]}/{self.oid}"
+
+
+def read_pointer(path: os.PathLike) -> Optional[LfsPointer]:
+    """The oid and size recorded in an LFS pointer file, or None if the file holds real data."""
+    if not is_lfs_pointer(path):
+        return None
+    text = Path(path).read_text(errors="replace")[:LFS_POINTER_MAX_SIZE]
+    if not (match := POINTER_PATTERN.search(text)):
+        raise ValueError(f"{path} looks like a Git LFS pointer but has no sha256 oid and size.")
+    return LfsPointer(oid=match.group("oid"), size=int(match.group("size")))
+
+
+class Mirror(ABC):
+    """A place hydrated content can be fetched from, addressed by key (a relative path)."""
+
+    @abstractmethod
+    def size(self, key: str) -> Optional[int]:
+        """Size of the object, or None if the mirror does not have it."""
+
+    @abstractmethod
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        """Bytes `start` (inclusive) to `end` (exclusive) of the object."""
+
+
+class LocalMirror(Mirror):
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def size(self, key):
+        path = self.root / key
+        return path.stat().st_size if path.is_file() and not is_lfs_pointer(path) else None
+
+    def read_range(self, key, start, end):
+        with (self.root / key).open("rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def __repr__(self):
+        return f"LocalMirror({self.root})"
+
+
+class S3Mirror(Mirror):
+    def __init__(self, url: str):
+        import boto3
+
+        parsed = urlparse(url)
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.strip("/")
+        self.client = boto3.client("s3")
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def size(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))["ContentLength"]
+        except Exception:
+            return None
+
+    def read_range(self, key, start, end):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{end - 1}")
+        return response["Body"].read()
+
+    def __repr__(self):
+        return f"S3Mirror(s3://{self.bucket}/{self.prefix})"
+
+
+class GCSMirror(Mirror):
+    def __init__(self, url: str):
+        from google.cloud import storage
+
+        parsed = urlparse(url)
+        self.bucket = storage.Client().bucket(parsed.netloc)
+        self.prefix = parsed.path.strip("/")
+
+    def _blob(self, key):
+        return self.bucket.blob(f"{self.prefix}/{key}" if self.prefix else key)
+
+    def size(self, key):
+        blob = self._blob(key)
+        try:
+            blob.reload()
+        except Exception:
+            return None
+        return blob.size
+
+    def read_range(self, key, start, end):
+        return self._blob(key).download_as_bytes(start=start, end=end - 1)
+
+    def __repr__(self):
+        return f"GCSMirror(gs://{self.bucket.name}/{self.prefix})"
+
+
+class HTTPMirror(Mirror):
+    def __init__(self, url: str):
+        import requests
+
+        self.base_url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def size(self, key):
+        try:
+            response = self.session.head(f"{self.base_url}/{key}", allow_redirects=True, timeout=30)
+        except Exception:
+            return None
+        if not response.ok or "Content-Length" not in response.headers:
+            return None
+        return int(response.headers["Content-Length"])
+
+    def read_range(self, key, start, end):
+        response = self.session.get(
+            f"{self.base_url}/{key}", headers={"Range": f"bytes={start}-{end - 1}"}, timeout=300,
+        )
+        response.raise_for_status()
+        if response.status_code != 206 and (start, end) != (0, len(response.content)):
+            raise IOError(f"{self.base_url} ignored the byte range request for {key}")
+        return response.content
+
+    def __repr__(self):
+        return f"HTTPMirror({self.base_url})"
+
+
+def make_mirror(location: str) -> Mirror:
+    scheme = urlparse(location).scheme
+    if scheme == "s3":
+        return S3Mirror(location)
+    if scheme == "gs":
+        return GCSMirror(location)
+    if scheme in ("http", "https"):
+        return HTTPMirror(location)
+    return LocalMirror(location)
+
+
+def configured_mirrors() -> list[Mirror]:
+    return [make_mirror(location.strip()) for location in os.environ.get("BIOME_LFS_MIRROR", "").split(",") if location.strip()]
+
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(str(path), threading.Lock())
+
+
+def _copy_chunks(mirror: Mirror, key: str, destination: Path, size: int, workers: int, chunk_size: int) -> None:
+    with destination.open("wb") as f:
+        f.truncate(size)
+    ranges = [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+    def copy(byte_range: tuple[int, int]) -> None:
+        start, end = byte_range
+        data = mirror.read_range(key, start, end)
+        if len(data) != end - start:
+            raise IOError(f"Short read from {mirror} for {key}: expected {end - start} bytes at {start}, got {len(data)}")
+        fd = os.open(destination, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, start)
+        finally:
+            os.close(fd)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first failed chunk
+        list(executor.map(copy, ranges))
+
+
+def hydrate(
+    path: os.PathLike,
+    mirrors: Optional[list[Mirror]] = None,
+    data_dir: Optional[os.PathLike] = None,
+    workers: Optional[int] = None,
+    chunk_mb: Optional[int] = None,
+) -> bool:
+    """
+    Replace an LFS pointer with its verified content. Returns False if the file already held real data.
+
+    Raises FileNotFoundError if no mirror has the object and ValueError if the content fails verification.
+    """
+    path = Path(path).resolve()
+    workers = workers or int(os.environ.get("BIOME_LFS_WORKERS", DEFAULT_WORKERS))
+    chunk_size = (chunk_mb or int(os.environ.get("BIOME_LFS_CHUNK_MB", DEFAULT_CHUNK_MB))) * 1024 * 1024
+    with _lock_for(path):
+        if (pointer := read_pointer(path)) is None:
+            return False
+        mirrors = configured_mirrors() if mirrors is None else mirrors
+        if not mirrors:
+            raise FileNotFoundError(
+                f"{path} is a Git LFS pointer and no mirror is configured. "
+                f"Run `git lfs pull`, or set BIOME_LFS_MIRROR to a directory, s3://, gs:// or http(s):// location."
+            )
+        data_dir = get_data_dir(data_dir)
+        keys = [path.relative_to(data_dir).as_posix() if path.is_relative_to(data_dir) else path.name, pointer.object_key]
+        errors = []
+
+        for mirror in mirrors:
+            key = next((key for key in keys if mirror.size(key) == pointer.size), None)
+            if key is None:
+                continue
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.hydrating")
+            try:
+                logger.info(f"Hydrating {path} ({pointer.size / 2**20:.1f} MB) from {mirror}")
+                _copy_chunks(mirror, key, tmp_path, pointer.size, workers, chunk_size)
+                if (checksum := sha256sum(tmp_path)) != pointer.oid:
+                    raise ValueError(f"Checksum mismatch for {path} from {mirror}: expected {pointer.oid}, got {checksum}")
+                os.replace(tmp_path, path)
+                return True
+            except Exception as e:
+                logger.warning(f"Failed to hydrate {path} from {mirror}: {e}")
+                errors.append(e)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+        if errors:
+            raise errors[-1]
+        raise FileNotFoundError(f"None of the configured mirrors ({', '.join(map(repr, mirrors))}) has {path} (oid {pointer.oid}).")
+
+
+def ensure_hydrated(path: os.PathLike, data_dir: Optional[os.PathLike] = None) -> bool:
+    """True if the file holds real data, hydrating it first if it is a pointer and a mirror is configured."""
+    if not is_lfs_pointer(path):
+        return Path(path).is_file()
+    if not (mirrors := configured_mirrors()):
+        return False
+    try:
+        hydrate(path, mirrors=mirrors, data_dir=data_dir)
+    except Exception as e:
+        logger.warning(f"Could not hydrate {path}: {e}")
+        return False
+    return True
+
+
+def hydrate_all(paths: list[os.PathLike], data_dir: Optional[os.PathLike] = None) -> dict[str, str]:
+    """Hydrate every pointer in the given files/folders (default: the whole data folder). Returns the status per file."""
+    data_dir = get_data_dir(data_dir)
+    targets = [Path(path) if Path(path).is_absolute() else data_dir / path for path in paths] or [data_dir]
+    files = []
+    for target in targets:
+        files.extend(sorted(p for p in target.rglob("*") if p.is_file()) if target.is_dir() else [target])
+    statuses = {}
+    mirrors = configured_mirrors()
+    for path in files:
+        if not is_lfs_pointer(path):
+            continue
+        try:
+            hydrate(path, mirrors=mirrors, data_dir=data_dir)
+            statuses[str(path)] = "hydrated"
+        except Exception as e:
+            logger.error(f"Failed to hydrate {path}: {e}")
+            statuses[str(path)] = "failed"
+    return statuses
+
+
+def _hydrating_reader(reader: Callable) -> Callable:
+    @functools.wraps(reader)
+    def wrapper(filepath_or_buffer, *args, **kwargs):
+        if isinstance(filepath_or_buffer, (str, os.PathLike)) and is_lfs_pointer(filepath_or_buffer):
+            hydrate(filepath_or_buffer)
+        return reader(filepath_or_buffer, *args, **kwargs)
+
+    setattr(wrapper, "__biome_hydrating__", reader)
+    return wrapper
+
+
+def install_lfs_hydration() -> None:
+    """
+    Make the pandas file readers hydrate LFS pointers before reading them.
+
+    Installed by the kernel `setup` procedure underneath the dataset cache: the cache passes a (small) pointer
+    straight through, and caches the hydrated file from the next read on.
+    """
+    import pandas as pd
+
+    for reader_name in HYDRATED_READERS:
+        reader = getattr(pd, reader_name, None)
+        if reader is not None and not hasattr(reader, "__biome_hydrating__"):
+            setattr(pd, reader_name, _hydrating_reader(reader))
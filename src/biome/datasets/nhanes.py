@@ -0,0 +1,253 @@
+"""
+Pre-joined, SEQN-indexed Parquet copies of the NHANES dietary XPT files.
+
+For every cycle with both an individual foods file (`*_DR1IFF_individual_foods.xpt`, `*_DRXIFF_...` in 1999-2000)
+and a demographics file, the foods file is streamed in chunks and left-joined to the demographics on SEQN into
+`nhanes_dietary/parquet/<cycle>_foods_demographics.parquet`, sorted by SEQN so row group statistics prune SEQN
+filters. Demographics get their own `<cycle>_demographics.parquet`, and `seqn_index.parquet` maps every SEQN to its
+cycle and row positions in both files, across cycles.
+"""
+import datetime
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .lfs import ensure_hydrated
+from .utils import fingerprint, get_data_dir, iter_sas_batches, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+NHANES_FOLDER = "nhanes_dietary"
+PARQUET_FOLDER = "parquet"
+CATALOG_FILENAME = "catalog.json"
+INDEX_FILENAME = "seqn_index.parquet"
+SOURCE_FILE_PATTERN = re.compile(r"^(\d{4})[_-](\d{4})_(DEMOGRAPHICS|DR1IFF_individual_foods|DRXIFF_individual_foods)\.xpt$")
+
+XPT_CHUNK_SIZE = 50_000
+XPT_ENCODING = "latin-1"
+ROW_GROUP_SIZE = 20_000
+COMPRESSION = "zstd"
+DEMOGRAPHICS_SUFFIX = "_DEMO"
+
+
+def get_parquet_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / NHANES_FOLDER / PARQUET_FOLDER
+
+
+def get_catalog(data_dir: Optional[os.PathLike] = None) -> dict:
+    return read_json(get_parquet_dir(data_dir) / CATALOG_FILENAME) or {"cycles": {}}
+
+
+def cycle_sources(data_dir: Optional[os.PathLike] = None) -> dict[str, dict[str, Path]]:
+    """
+    Map of cycle (`1999_2000`, ...) to its `demographics` and `foods` XPT files.
+
+    File names are not consistent across cycles (`2009-2010_DEMOGRAPHICS.xpt`), so cycles are normalized to
+    underscores.
+    """
+    nhanes_dir = get_data_dir(data_dir) / NHANES_FOLDER
+    sources: dict[str, dict[str, Path]] = {}
+    for path in sorted(nhanes_dir.glob("*.xpt")):
+        if (match := SOURCE_FILE_PATTERN.match(path.name)):
+            kind = "demographics" if match.group(3) == "DEMOGRAPHICS" else "foods"
+            sources.setdefault(f"{match.group(1)}_{match.group(2)}", {})[kind] = path
+    return sources
+
+
+def read_xpt(path: os.PathLike, columns: Optional[Iterable[str]] = None, chunksize: int = XPT_CHUNK_SIZE):
+    """
+    Read an XPT file as a pandas DataFrame, streaming it in chunks and keeping only `columns`.
+
+    Peak memory is bounded by the selected columns plus one chunk, rather than the whole file.
+    """
+    columns = list(columns) if columns is not None else None
+    batches = [
+        batch.select(columns) if columns is not None else batch
+        for batch in iter_sas_batches(path, "xport", chunksize, XPT_ENCODING)
+    ]
+    return pa.Table.from_batches(batches).to_pandas()
+
+
+def _with_integer_seqn(table):
+    index = table.schema.get_field_index("SEQN")
+    if index < 0:
+        raise KeyError("SEQN")
+    return table.set_column(index, "SEQN", pc.cast(table.column("SEQN"), pa.int64()))
+
+
+def _line_column(schema: pa.Schema) -> Optional[str]:
+    """The per-participant food line number, `DR1ILINE` in most cycles."""
+    return next((name for name in schema.names if name.endswith("ILINE")), None)
+
+
+def convert_cycle(cycle: str, sources: dict[str, Path], parquet_dir: Path) -> dict:
+    """Write the demographics and pre-joined foods Parquet files for one cycle. Returns its catalog entry."""
+    parquet_dir.mkdir(parents=True, exist_ok=True)
+    demographics_path = parquet_dir / f"{cycle}_demographics.parquet"
+    joined_path = parquet_dir / f"{cycle}_foods_demographics.parquet"
+
+    # Demographics are one row per participant (~10k rows), small enough to hold as the join's build side.
+    demographics = pa.Table.from_batches(list(iter_sas_batches(sources["demographics"], "xport", XPT_CHUNK_SIZE, XPT_ENCODING)))
+    demographics = _with_integer_seqn(demographics).sort_by("SEQN")
+    tmp_demographics = demographics_path.with_name(f".{demographics_path.name}.tmp")
+    pq.write_table(demographics, tmp_demographics, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_demographics, demographics_path)
+
+    tmp_joined = joined_path.with_name(f".{joined_path.name}.tmp")
+    writer = None
+    in_order = True
+    last_seqn = None
+    try:
+        for batch in iter_sas_batches(sources["foods"], "xport", XPT_CHUNK_SIZE, XPT_ENCODING):
+            foods = _with_integer_seqn(pa.Table.from_batches([batch]))
+            sort_keys = [("SEQN", "ascending")]
+            if (line_column := _line_column(foods.schema)):
+                sort_keys.append((line_column, "ascending"))
+            joined = foods.join(
+                demographics, keys="SEQN", join_type="left outer", right_suffix=DEMOGRAPHICS_SUFFIX,
+            ).sort_by(sort_keys)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_joined, joined.schema, compression=COMPRESSION)
+            min_max = pc.min_max(joined.column("SEQN")).as_py()
+            if last_seqn is not None and min_max["min"] is not None and min_max["min"] < last_seqn:
+                in_order = False
+            last_seqn = min_max["max"] if last_seqn is None else max(last_seqn, min_max["max"] or last_seqn)
+            writer.write_table(joined.cast(writer.schema), row_group_size=ROW_GROUP_SIZE)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not in_order:
+        # The published files are ordered by SEQN; only re-sort (in memory) if one is not.
+        logger.warning(f"NHANES {cycle} foods are not ordered by SEQN, sorting the joined table in memory.")
+        joined = pq.read_table(tmp_joined)
+        pq.write_table(
+            joined.sort_by([("SEQN", "ascending")] + ([(line_column, "ascending")] if line_column else [])),
+            tmp_joined, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE,
+        )
+    os.replace(tmp_joined, joined_path)
+
+    joined_metadata = pq.read_metadata(joined_path)
+    return {
+        "demographics": demographics_path.name,
+        "foods_demographics": joined_path.name,
+        "sources": {kind: path.name for kind, path in sources.items()},
+        "source_fingerprints": {kind: fingerprint(path) for kind, path in sources.items()},
+        "participants": demographics.num_rows,
+        "rows": joined_metadata.num_rows,
+        "row_groups": joined_metadata.num_row_groups,
+        "columns": {field.name: str(field.type) for field in joined_metadata.schema.to_arrow_schema()},
+        "built": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def _cycle_index(cycle: str, parquet_dir: Path, entry: dict) -> pa.Table:
+    """SEQN -> row positions in the (SEQN-sorted) demographics and pre-joined foods files of one cycle."""
+    demographics_seqn = pq.read_table(parquet_dir / entry["demographics"], columns=["SEQN"]).column("SEQN")
+    demographics = pa.table({
+        "SEQN": demographics_seqn,
+        "demographics_row": pa.array(range(len(demographics_seqn)), pa.int64()),
+    })
+    foods_seqn = pq.read_table(parquet_dir / entry["foods_demographics"], columns=["SEQN"]).column("SEQN")
+    foods = pa.table({"SEQN": foods_seqn, "row": pa.array(range(len(foods_seqn)), pa.int64())})
+    foods = foods.group_by("SEQN").aggregate([("row", "min"), ("row", "count")]).rename_columns(
+        ["SEQN", "foods_row_start", "foods_rows"]
+    )
+    index = demographics.join(foods, keys="SEQN", join_type="full outer")
+    return pa.table({
+        "cycle": pa.array([cycle] * index.num_rows, pa.string()),
+        "SEQN": index.column("SEQN"),
+        "demographics_row": index.column("demographics_row"),
+        "foods_row_start": index.column("foods_row_start"),
+        "foods_rows": pc.fill_null(index.column("foods_rows"), 0),
+    }).sort_by("SEQN")
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False, cycles: Optional[list[str]] = None) -> dict:
+    """
+    Convert every NHANES cycle whose foods or demographics XPT changed since the last build, then rebuild the
+    cross-cycle SEQN index.
+    """
+    parquet_dir = get_parquet_dir(data_dir)
+    catalog_path = parquet_dir / CATALOG_FILENAME
+    catalog = get_catalog(data_dir)
+    entries: dict = catalog.setdefault("cycles", {})
+    catalog["format"] = "parquet"
+
+    for cycle, sources in cycle_sources(data_dir).items():
+        if cycles and cycle not in cycles:
+            continue
+        if set(sources) != {"demographics", "foods"}:
+            logger.warning(f"Skipping NHANES {cycle}: needs both a demographics and an individual foods file.")
+            continue
+        if (pointers := [path for path in sources.values() if not ensure_hydrated(path, data_dir)]):
+            logger.warning(f"Skipping NHANES {cycle}: {pointers[0]} is a Git LFS pointer that could not be hydrated, run `git lfs pull` or set BIOME_LFS_MIRROR.")
+            continue
+        entry = entries.get(cycle)
+        if (
+            not force
+            and entry is not None
+            and entry.get("source_fingerprints") == {kind: fingerprint(path) for kind, path in sources.items()}
+            and (parquet_dir / entry["foods_demographics"]).is_file()
+            and (parquet_dir / entry["demographics"]).is_file()
+        ):
+            logger.info(f"NHANES {cycle} is up to date.")
+            continue
+        logger.info(f"Joining NHANES {cycle} foods and demographics into {parquet_dir}")
+        entries[cycle] = convert_cycle(cycle, sources, parquet_dir)
+        write_json(catalog_path, catalog)
+
+    if entries:
+        index = pa.concat_tables([_cycle_index(cycle, parquet_dir, entry) for cycle, entry in sorted(entries.items())])
+        tmp_index = parquet_dir / f".{INDEX_FILENAME}.tmp"
+        pq.write_table(index, tmp_index, compression=COMPRESSION)
+        os.replace(tmp_index, parquet_dir / INDEX_FILENAME)
+        catalog["index"] = INDEX_FILENAME
+    write_json(catalog_path, catalog)
+    return catalog
+
+
+def _require(path: Path) -> Path:
+    if not path.is_file():
+        raise FileNotFoundError(f"{path} does not exist. Build it with `python -m biome.datasets build nhanes`.")
+    return path
+
+
+def read_seqn_index(data_dir: Optional[os.PathLike] = None):
+    """The cross-cycle SEQN index as a pandas DataFrame."""
+    return pq.read_table(_require(get_parquet_dir(data_dir) / INDEX_FILENAME)).to_pandas()
+
+
+def read_foods_demographics(
+    cycles: Optional[list[str]] = None,
+    columns: Optional[list[str]] = None,
+    filters: Optional[list] = None,
+    data_dir: Optional[os.PathLike] = None,
+):
+    """
+    Read the pre-joined foods x demographics table for the given cycles (default: all) as one DataFrame.
+
+    A `cycle` column is added; columns missing from a cycle (variable names differ between cycles) are null.
+    `filters` use the pyarrow/pandas DNF filter syntax, e.g. `[("SEQN", "in", [41475, 41476])]`.
+    """
+    parquet_dir = get_parquet_dir(data_dir)
+    entries = get_catalog(data_dir)["cycles"]
+    tables = []
+    for cycle in cycles or sorted(entries):
+        if cycle not in entries:
+            raise KeyError(f"NHANES cycle {cycle} has not been built. Built cycles: {', '.join(sorted(entries))}")
+        path = _require(parquet_dir / entries[cycle]["foods_demographics"])
+        available = pq.read_schema(path).names
+        table = pq.read_table(
+            path,
+            columns=[column for column in columns if column in available] if columns is not None else None,
+            filters=filters,
+        )
+        tables.append(table.append_column("cycle", pa.array([cycle] * table.num_rows, pa.string())))
+    return pa.concat_tables(tables, promote_options="permissive").to_pandas()
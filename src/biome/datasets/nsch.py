@@ -0,0 +1,258 @@
+"""
+Memory-mappable Arrow IPC (Feather v2) copies of the National Survey of Children's Health sas7bdat files.
+
+`census-nsch/<year>e_topical.sas7bdat` is parsed once into `census-nsch/arrow/<year>e_topical.arrow`.
+SAS stores every numeric as float64; the copies use the narrowest integer type that holds each coded column, and
+every variable with a categorical `Response Code` in `nsch_dictionary_codebook.csv` gets a dictionary-encoded
+`<VARIABLE>_label` column next to it. Files are written uncompressed so opening one is a memory map, not a read.
+"""
+import datetime
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .lfs import ensure_hydrated
+from .utils import fingerprint, get_data_dir, iter_sas_batches, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+NSCH_FOLDER = "census-nsch"
+CODEBOOK_FILENAME = "nsch_dictionary_codebook.csv"
+ARROW_FOLDER = "arrow"
+CATALOG_FILENAME = "catalog.json"
+SOURCE_FILE_PATTERN = re.compile(r"^(\d{4})e_topical\.sas7bdat$")
+LABEL_SUFFIX = "_label"
+
+SAS_CHUNK_SIZE = 100_000
+SAS_ENCODING = "latin-1"
+
+INTEGER_TYPES = [pa.int8(), pa.int16(), pa.int32(), pa.int64()]
+
+
+def get_arrow_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / NSCH_FOLDER / ARROW_FOLDER
+
+
+def get_catalog(data_dir: Optional[os.PathLike] = None) -> dict:
+    return read_json(get_arrow_dir(data_dir) / CATALOG_FILENAME) or {"years": {}}
+
+
+def year_sources(data_dir: Optional[os.PathLike] = None) -> dict[int, Path]:
+    """Map of survey year to raw sas7bdat path."""
+    nsch_dir = get_data_dir(data_dir) / NSCH_FOLDER
+    sources = {}
+    for path in sorted(nsch_dir.glob("*e_topical.sas7bdat")):
+        if (match := SOURCE_FILE_PATTERN.match(path.name)):
+            sources[int(match.group(1))] = path
+    return sources
+
+
+def parse_response_codes(response_codes: str) -> dict[int, str]:
+    """
+    Parse a codebook `Response Code` cell such as `1=Yes||2=No` into `{1: "Yes", 2: "No"}`.
+
+    Returns an empty mapping for anything that is not a list of integer codes (ranges, free text, ...), since
+    those variables are measurements rather than categories.
+    """
+    codes = {}
+    for pair in response_codes.split("||"):
+        code, separator, label = pair.partition("=")
+        if not separator:
+            return {}
+        try:
+            codes[int(float(code.strip()))] = label.strip()
+        except ValueError:
+            return {}
+    return codes if len(codes) > 1 else {}
+
+
+def load_codebook_labels(data_dir: Optional[os.PathLike] = None) -> dict[str, dict[int, str]]:
+    """Categorical response codes per upper-cased variable name."""
+    import pandas as pd
+
+    path = get_data_dir(data_dir) / NSCH_FOLDER / CODEBOOK_FILENAME
+    if not ensure_hydrated(path, data_dir):
+        logger.warning(f"NSCH codebook not available at {path}, no label columns will be added.")
+        return {}
+    codebook = pd.read_csv(path, dtype=str, index_col=False).fillna("")
+    labels: dict[str, dict[int, str]] = {}
+    for row in codebook.to_dict("records"):
+        if (variable := row.get("Variable", "").strip().upper()) and (codes := parse_response_codes(row.get("Response Code", ""))):
+            labels.setdefault(variable, codes)
+    return labels
+
+
+def _integer_type(minimum, maximum) -> Optional[pa.DataType]:
+    """Narrowest signed integer type holding every value in [minimum, maximum]."""
+    for integer_type in INTEGER_TYPES:
+        bound = 2 ** (integer_type.bit_width - 1)
+        if -bound <= minimum and maximum < bound:
+            return integer_type
+    return None
+
+
+def _stage_sas(source: Path, staging: Path) -> dict[str, dict]:
+    """
+    Stream the sas7bdat file into an uncompressed Arrow file as-is, collecting per-column statistics.
+
+    This is the only pass over the (slow, single-threaded) SAS parser; the final typed file is produced from the
+    memory-mapped staging copy.
+    """
+    stats: dict[str, dict] = {}
+    writer = None
+    try:
+        for batch in iter_sas_batches(source, "sas7bdat", SAS_CHUNK_SIZE, SAS_ENCODING):
+            if writer is None:
+                writer = pa.ipc.new_file(staging, batch.schema)
+                stats = {
+                    field.name: {"integral": True, "min": None, "max": None}
+                    for field in batch.schema
+                    if field.type == pa.float64()
+                }
+            for name, column_stats in stats.items():
+                values = pc.drop_null(pc.if_else(pc.is_nan(batch.column(name)), None, batch.column(name)))
+                if len(values) == 0:
+                    continue
+                if column_stats["integral"]:
+                    column_stats["integral"] = pc.all(pc.equal(pc.floor(values), values)).as_py()
+                min_max = pc.min_max(values).as_py()
+                column_stats["min"] = min_max["min"] if column_stats["min"] is None else min(column_stats["min"], min_max["min"])
+                column_stats["max"] = min_max["max"] if column_stats["max"] is None else max(column_stats["max"], min_max["max"])
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return stats
+
+
+def _label_column(codes: pa.Array, labels: dict[int, str]) -> pa.DictionaryArray:
+    value_set = pa.array(sorted(labels), pa.int64())
+    dictionary = pa.array([labels[code] for code in value_set.to_pylist()], pa.string())
+    indices = pc.index_in(pc.cast(codes, pa.int64()), value_set=value_set)
+    return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+
+def convert_year(source: Path, destination: Path, codebook_labels: dict[str, dict[int, str]]) -> dict:
+    """Convert one NSCH sas7bdat year into a typed Arrow IPC file. Returns its catalog entry."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    staging = destination.with_name(f".{destination.name}.staging")
+    tmp_destination = destination.with_name(f".{destination.name}.tmp")
+    try:
+        stats = _stage_sas(source, staging)
+        with pa.memory_map(str(staging)) as staged_file:
+            staged = pa.ipc.open_file(staged_file)
+            fields = []
+            labelled = {}
+            for field in staged.schema:
+                column_stats = stats.get(field.name)
+                field_type = field.type
+                if column_stats and column_stats["integral"] and column_stats["min"] is not None:
+                    field_type = _integer_type(column_stats["min"], column_stats["max"]) or field.type
+                fields.append(pa.field(field.name, field_type))
+                if pa.types.is_integer(field_type) and (labels := codebook_labels.get(field.name.upper())):
+                    labelled[field.name] = labels
+                    fields.append(pa.field(f"{field.name}{LABEL_SUFFIX}", pa.dictionary(pa.int32(), pa.string())))
+            schema = pa.schema(fields)
+
+            with pa.ipc.new_file(tmp_destination, schema) as writer:
+                for index in range(staged.num_record_batches):
+                    batch = staged.get_batch(index)
+                    arrays = []
+                    for field in staged.schema:
+                        column = batch.column(field.name)
+                        target = schema.field(field.name).type
+                        if target != field.type:
+                            column = pc.cast(pc.if_else(pc.is_nan(column), None, column), target)
+                        arrays.append(column)
+                        if field.name in labelled:
+                            arrays.append(_label_column(column, labelled[field.name]))
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        os.replace(tmp_destination, destination)
+    finally:
+        staging.unlink(missing_ok=True)
+        tmp_destination.unlink(missing_ok=True)
+
+    with pa.memory_map(str(destination)) as arrow_file:
+        rows = pa.ipc.open_file(arrow_file).read_all().num_rows
+    return {
+        "path": destination.name,
+        "source": source.name,
+        "source_fingerprint": fingerprint(source),
+        "rows": rows,
+        "size": destination.stat().st_size,
+        "columns": {field.name: str(field.type) for field in schema},
+        "labelled_columns": sorted(labelled),
+        "built": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False, years: Optional[list[int]] = None) -> dict:
+    """
+    Convert every NSCH year whose sas7bdat file (or the codebook) changed since the last build.
+    """
+    arrow_dir = get_arrow_dir(data_dir)
+    catalog_path = arrow_dir / CATALOG_FILENAME
+    catalog = get_catalog(data_dir)
+    entries: dict = catalog.setdefault("years", {})
+    catalog["format"] = "arrow_ipc"
+
+    codebook_path = get_data_dir(data_dir) / NSCH_FOLDER / CODEBOOK_FILENAME
+    codebook_fingerprint = fingerprint(codebook_path) if codebook_path.is_file() else None
+    if catalog.get("codebook_fingerprint") != codebook_fingerprint:
+        force = True
+    codebook_labels = None
+    # years left out of this build still have the labels of the old codebook
+    every_year = True
+
+    for year, source in year_sources(data_dir).items():
+        if years and year not in years:
+            every_year = False
+            continue
+        if not ensure_hydrated(source, data_dir):
+            logger.warning(f"Skipping NSCH {year}: {source} is a Git LFS pointer that could not be hydrated, run `git lfs pull` or set BIOME_LFS_MIRROR.")
+            every_year = False
+            continue
+        entry = entries.get(str(year))
+        destination = arrow_dir / f"{year}e_topical.arrow"
+        if (
+            not force
+            and entry is not None
+            and entry.get("source_fingerprint") == fingerprint(source)
+            and destination.is_file()
+        ):
+            logger.info(f"NSCH {year} is up to date.")
+            continue
+        if codebook_labels is None:
+            codebook_labels = load_codebook_labels(data_dir)
+        logger.info(f"Converting NSCH {year} from {source} to {destination}")
+        entries[str(year)] = convert_year(source, destination, codebook_labels)
+        write_json(catalog_path, catalog)
+
+    # only once every year has been converted with this codebook, so an interrupted build picks up where it stopped
+    if every_year:
+        catalog["codebook_fingerprint"] = codebook_fingerprint
+    write_json(catalog_path, catalog)
+    return catalog
+
+
+def open_year(year: int, data_dir: Optional[os.PathLike] = None) -> pa.Table:
+    """Memory-map one converted NSCH year. No data is read until a column is actually used."""
+    path = get_arrow_dir(data_dir) / f"{year}e_topical.arrow"
+    if not path.is_file():
+        raise FileNotFoundError(
+            f"No Arrow copy of NSCH {year} at {path}. Build it with `python -m biome.datasets build nsch`."
+        )
+    return pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+
+
+def read_year(year: int, columns: Optional[list[str]] = None, data_dir: Optional[os.PathLike] = None):
+    """Load the requested columns of one NSCH year as a pandas DataFrame; label columns become categoricals."""
+    table = open_year(year, data_dir)
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas()
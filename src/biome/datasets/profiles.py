@@ -0,0 +1,264 @@
+"""
+Schema and profile sidecars for the local data files.
+
+`build` scans every data file under the data folder once and writes two sidecars next to it:
+`<file>.profile.json` (row count, and per column: type, null rate, cardinality, min/max, sample and most common
+values) and `<file>.profile.md`, a compact summary of the same that is appended to the documentation of the
+specifications referencing the file. Drafted code can then pick the right columns, types and codes without loading
+the data first.
+"""
+import datetime
+import logging
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ..shared.profiles import FILE_TAG_PATTERN, summary_path
+from .epa_tri import TRAILING_COLUMN, column_names
+from .utils import fingerprint, get_data_dir, is_lfs_pointer, iter_sas_batches, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIX = ".profile.json"
+PROFILED_SUFFIXES = {".csv", ".tsv", ".txt", ".xpt", ".sas7bdat", ".parquet", ".arrow", ".feather"}
+# Folders holding artifacts derived by `python -m biome.datasets build`; their sources are profiled instead.
+DERIVED_FOLDERS = {"parquet", "arrow", "harmonized", "rollups", "samples", "geo"}
+
+DISTINCT_CAP = 1000
+TOP_VALUES_CAP = 20
+SAMPLE_SIZE = 5
+MAX_VALUE_LENGTH = 60
+SUMMARY_MAX_COLUMNS = 40
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+SAS_CHUNK_SIZE = 50_000
+
+
+def profile_path(path: Path) -> Path:
+    return path.with_name(path.name + PROFILE_SUFFIX)
+
+
+def is_profiled_file(path: Path, data_dir: Path) -> bool:
+    relative = path.relative_to(data_dir)
+    return (
+        path.is_file()
+        and path.suffix.lower() in PROFILED_SUFFIXES
+        and not any(part.startswith((".", "_")) for part in relative.parts)
+        and not DERIVED_FOLDERS.intersection(relative.parts[:-1])
+    )
+
+
+def data_files(data_dir: Optional[os.PathLike] = None) -> list[Path]:
+    data_dir = get_data_dir(data_dir)
+    return sorted(path for path in data_dir.rglob("*") if is_profiled_file(path, data_dir))
+
+
+def _delimiter(path: Path) -> str:
+    with path.open("r", errors="replace") as f:
+        header = f.readline()
+    return "\t" if "\t" in header else ","
+
+
+def _csv_batches(path: Path, as_strings: bool) -> Iterator[pa.RecordBatch]:
+    import pyarrow.csv as pacsv
+
+    delimiter = _delimiter(path)
+    # read with an explicit header so rows ending with a delimiter the header doesn't have (as in the TRI file) parse
+    header = column_names(path, delimiter)
+    if not header:
+        return
+    columns = [name for name in header if name != TRAILING_COLUMN]
+    yield from pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE, column_names=header, skip_rows=1),
+        parse_options=pacsv.ParseOptions(delimiter=delimiter),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={name: pa.string() for name in columns} if as_strings else None,
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def iter_batches(path: Path, as_strings: bool = False) -> Iterator[pa.RecordBatch]:
+    """Record batches of any supported data file; `as_strings` reads text files without type inference."""
+    suffix = path.suffix.lower()
+    if suffix in {".csv", ".tsv", ".txt"}:
+        yield from _csv_batches(path, as_strings=as_strings)
+    elif suffix == ".xpt":
+        yield from iter_sas_batches(path, "xport", SAS_CHUNK_SIZE)
+    elif suffix == ".sas7bdat":
+        yield from iter_sas_batches(path, "sas7bdat", SAS_CHUNK_SIZE)
+    elif suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        yield from pq.ParquetFile(path).iter_batches()
+    elif suffix in {".arrow", ".feather"}:
+        reader = pa.ipc.open_file(pa.memory_map(str(path)))
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index)
+    else:
+        raise ValueError(f"Unsupported data file type: {path.name}")
+
+
+def _display(value):
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+        return value[:MAX_VALUE_LENGTH] + "..."
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return float(f"{value:.6g}")
+    return value
+
+
+class ColumnProfiler:
+    """Accumulates the profile of one column over record batches."""
+
+    def __init__(self, data_type: pa.DataType):
+        self.type = data_type
+        self.count = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.distinct: set = set()
+        self.distinct_capped = False
+        self.samples: list = []
+        self.value_counts: Optional[Counter] = Counter()
+
+    def update(self, values: pa.Array) -> None:
+        if pa.types.is_dictionary(values.type):
+            values = values.dictionary_decode()
+        self.count += len(values)
+        if pa.types.is_floating(values.type):
+            values = pc.if_else(pc.is_nan(values), None, values)
+        self.nulls += values.null_count
+        values = pc.drop_null(values)
+        if len(values) == 0:
+            return
+
+        if (
+            pa.types.is_integer(values.type) or pa.types.is_floating(values.type) or pa.types.is_string(values.type)
+            or pa.types.is_large_string(values.type) or pa.types.is_temporal(values.type)
+        ):
+            min_max = pc.min_max(values).as_py()
+            self.minimum = min_max["min"] if self.minimum is None else min(self.minimum, min_max["min"])
+            self.maximum = min_max["max"] if self.maximum is None else max(self.maximum, min_max["max"])
+
+        if not self.distinct_capped or self.value_counts is not None:
+            counts = pc.value_counts(values)
+            for entry in counts.to_pylist():
+                value = entry["values"]
+                if not self.distinct_capped:
+                    if value not in self.distinct and len(self.samples) < SAMPLE_SIZE:
+                        self.samples.append(value)
+                    self.distinct.add(value)
+                    if len(self.distinct) > DISTINCT_CAP:
+                        self.distinct_capped = True
+                        self.distinct.clear()
+                if self.value_counts is not None:
+                    self.value_counts[value] += entry["counts"]
+            if self.value_counts is not None and len(self.value_counts) > TOP_VALUES_CAP:
+                self.value_counts = None
+
+    def result(self) -> dict:
+        profile = {
+            "type": str(self.type),
+            "nulls": self.nulls,
+            "null_rate": round(self.nulls / self.count, 4) if self.count else None,
+            "distinct": f">{DISTINCT_CAP}" if self.distinct_capped else len(self.distinct),
+            "min": _display(self.minimum),
+            "max": _display(self.maximum),
+            "samples": [_display(value) for value in self.samples],
+        }
+        if self.value_counts:
+            profile["values"] = [
+                {"value": _display(value), "count": count} for value, count in self.value_counts.most_common()
+            ]
+        return profile
+
+
+def profile_file(path: Path) -> dict:
+    """Profile one data file in a single streaming pass."""
+    def run(batches: Iterable[pa.RecordBatch]) -> tuple[int, dict[str, ColumnProfiler]]:
+        rows = 0
+        columns: dict[str, ColumnProfiler] = {}
+        for batch in batches:
+            if not columns:
+                columns = {field.name: ColumnProfiler(field.type) for field in batch.schema}
+            rows += batch.num_rows
+            for name, profiler in columns.items():
+                profiler.update(batch.column(name))
+        return rows, columns
+
+    try:
+        rows, columns = run(iter_batches(path))
+    except pa.ArrowInvalid:
+        if path.suffix.lower() not in {".csv", ".tsv", ".txt"}:
+            raise
+        # A column whose type inferred from the first block changes later on; profile everything as text.
+        rows, columns = run(iter_batches(path, as_strings=True))
+    return {
+        "file": path.name,
+        "format": path.suffix.lower().lstrip("."),
+        "source_fingerprint": fingerprint(path),
+        "rows": rows,
+        "columns": {name: profiler.result() for name, profiler in columns.items()},
+        "profiled": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def format_summary(profile: dict, path: Path) -> str:
+    """Compact, prompt-sized rendering of a profile."""
+    columns = profile["columns"]
+    lines = [f"### {path}", f"{profile['rows']} rows, {len(columns)} columns. Full profile: {profile_path(path)}"]
+    for name, column in list(columns.items())[:SUMMARY_MAX_COLUMNS]:
+        details = [column["type"]]
+        if column["null_rate"]:
+            details.append(f"{column['null_rate']:.1%} null")
+        details.append(f"{column['distinct']} distinct")
+        if "values" in column:
+            details.append("values: " + ", ".join(f"{entry['value']!r} ({entry['count']})" for entry in column["values"]))
+        else:
+            if column["min"] is not None:
+                details.append(f"range {column['min']!r}..{column['max']!r}")
+            if column["samples"]:
+                details.append("e.g. " + ", ".join(repr(value) for value in column["samples"][:3]))
+        lines.append(f"- {name}: " + "; ".join(details))
+    if len(columns) > SUMMARY_MAX_COLUMNS:
+        lines.append(f"- ... {len(columns) - SUMMARY_MAX_COLUMNS} more columns, see the full profile.")
+    return "\n".join(lines) + "\n"
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False) -> dict[str, str]:
+    """Profile every data file that changed since its sidecar was written. Returns the status per file."""
+    data_dir = get_data_dir(data_dir)
+    statuses = {}
+    for path in data_files(data_dir):
+        relative = str(path.relative_to(data_dir))
+        if is_lfs_pointer(path):
+            statuses[relative] = "lfs pointer"
+            continue
+        existing = read_json(profile_path(path))
+        if not force and existing and existing.get("source_fingerprint") == fingerprint(path) and summary_path(path).is_file():
+            statuses[relative] = "up to date"
+            continue
+        logger.info(f"Profiling {relative}")
+        try:
+            profile = profile_file(path)
+        except Exception as e:
+            logger.error(f"Failed to profile {relative}: {e.__class__.__name__}: {e}")
+            statuses[relative] = "failed"
+            continue
+        write_json(profile_path(path), profile)
+        tmp_summary = summary_path(path).with_name(f".{summary_path(path).name}.tmp")
+        tmp_summary.write_text(format_summary(profile, path))
+        os.replace(tmp_summary, summary_path(path))
+        statuses[relative] = "profiled"
+    if (skipped := [relative for relative, status in statuses.items() if status == "lfs pointer"]):
+        logger.warning(f"Skipped {len(skipped)} Git LFS pointer(s), run `git lfs pull` or `python -m biome.datasets hydrate` first.")
+    return statuses
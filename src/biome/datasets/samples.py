@@ -0,0 +1,211 @@
+"""
+Deterministic, stratified samples of the large local data files.
+
+For every data file of at least `MIN_SOURCE_MB`, `build` writes `<dataset>/samples/<file stem>.1pct.parquet` and
+`.10pct.parquet`, listed in `<dataset>/samples/catalog.json`. Samples are read from the columnar copy made by
+`python -m biome.datasets build` when there is one, so they have the same columns and types as the data the
+specifications point to.
+
+Rows are picked by a hash of the dataset's key column (household, participant, facility, ...), so all rows of a
+key are kept or dropped together, and within each stratum (state, census division, ...) the same share of keys is
+kept. The selection only depends on the data: rebuilding gives the same rows, and the 1% sample is a subset of the
+10% sample.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .profiles import data_files, iter_batches
+from .sql import SAS_FORMATS, TEXT_SUFFIXES, columnar_copy
+from .lfs import ensure_hydrated, read_pointer
+from .utils import fingerprint, get_data_dir, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_FOLDER = "samples"
+CATALOG_FILENAME = "catalog.json"
+SAMPLE_RATES = {"1pct": 0.01, "10pct": 0.10}
+MIN_SOURCE_MB = 50
+COMPRESSION = "zstd"
+
+# Per dataset folder: the columns identifying a sampling unit and the columns to stratify by. Columns missing from
+# a file are ignored; without a key each row is its own unit.
+SAMPLING = {
+    "census-ahs": {"key": ["CONTROL"], "strata": ["DIVISION"]},
+    "census-nsch": {"key": ["HHID"], "strata": ["FIPSST"]},
+    "nhanes_dietary": {"key": ["SEQN"], "strata": []},
+    "epa-tri": {"key": ["TRI Facility ID"], "strata": ["State"]},
+    "usgs_pesticide": {"key": [], "strata": ["STATE_FIPS_CODE"]},
+}
+
+
+def get_sample_dir(path: Path) -> Path:
+    return path.parent / SAMPLE_FOLDER
+
+
+def sample_path(path: Path, tier: str) -> Path:
+    """Where the `tier` ("1pct" or "10pct") sample of a source data file is written."""
+    return get_sample_dir(path) / f"{path.stem}.{tier}.parquet"
+
+
+def get_catalog(path: Path) -> dict:
+    return read_json(get_sample_dir(path) / CATALOG_FILENAME) or {"files": {}}
+
+
+def sampled_files(data_dir: Optional[os.PathLike] = None) -> list[Path]:
+    """Source data files large enough to be worth sampling (by their real size, for LFS pointers)."""
+    def size(path: Path) -> int:
+        return pointer.size if (pointer := read_pointer(path)) is not None else path.stat().st_size
+
+    return [
+        path for path in data_files(data_dir)
+        if path.suffix.lower() in TEXT_SUFFIXES | set(SAS_FORMATS) and size(path) >= MIN_SOURCE_MB * 1024 * 1024
+    ]
+
+
+def _unit_hashes(batch: pa.RecordBatch, columns: list[str], offset: int) -> np.ndarray:
+    if not columns:
+        # no key: rows are hashed by their position in the file
+        return pd.util.hash_array(np.arange(offset, offset + batch.num_rows, dtype=np.int64))
+    return pd.util.hash_pandas_object(batch.select(columns).to_pandas(), index=False).to_numpy()
+
+
+def _strata_hashes(batch: pa.RecordBatch, columns: list[str]) -> np.ndarray:
+    if not columns:
+        return np.zeros(batch.num_rows, dtype=np.uint64)
+    return pd.util.hash_pandas_object(batch.select(columns).to_pandas(), index=False).to_numpy()
+
+
+def thresholds(
+    read_from: Path, key: list[str], strata: list[str], as_strings: bool = False
+) -> tuple[int, dict[str, dict[int, int]]]:
+    """
+    First pass: the row count, and per tier and stratum the largest unit hash that is kept, so that
+    `round(rate * units)` (at least one) of the stratum's units are in the sample.
+    """
+    units, groups, rows = [], [], 0
+    for batch in iter_batches(read_from, as_strings=as_strings):
+        units.append(_unit_hashes(batch, key, rows))
+        groups.append(_strata_hashes(batch, strata))
+        rows += batch.num_rows
+    if not rows:
+        return 0, {tier: {} for tier in SAMPLE_RATES}
+    pairs = pd.DataFrame({"stratum": np.concatenate(groups), "unit": np.concatenate(units)}).drop_duplicates()
+    pairs = pairs.sort_values(["stratum", "unit"], ignore_index=True)
+    rank = pairs.groupby("stratum").cumcount()
+    size = pairs.groupby("stratum")["unit"].transform("size")
+    limits = {}
+    for tier, rate in SAMPLE_RATES.items():
+        kept = pairs[rank < np.maximum(1, np.round(size * rate))]
+        limits[tier] = kept.groupby("stratum")["unit"].max().to_dict()
+    return rows, limits
+
+
+def write_samples(read_from: Path, destinations: dict[str, Path], key: list[str], strata: list[str]) -> dict:
+    """Sample one file into every tier in two streaming passes. Returns the row counts."""
+    try:
+        return _write_samples(read_from, destinations, key, strata, as_strings=False)
+    except pa.ArrowInvalid:
+        if read_from.suffix.lower() not in TEXT_SUFFIXES:
+            raise
+        # A column whose type inferred from the first block changes later on; both passes must then read as text so
+        # the keys hash the same way.
+        return _write_samples(read_from, destinations, key, strata, as_strings=True)
+
+
+def _write_samples(
+    read_from: Path, destinations: dict[str, Path], key: list[str], strata: list[str], as_strings: bool
+) -> dict:
+    rows, limits = thresholds(read_from, key, strata, as_strings=as_strings)
+    writers: dict[str, pq.ParquetWriter] = {}
+    counts = {tier: 0 for tier in destinations}
+    tmp_paths = {tier: path.with_name(f".{path.name}.tmp") for tier, path in destinations.items()}
+    lookups = {
+        tier: (np.array(sorted(limits[tier]), dtype=np.uint64), np.array([limits[tier][s] for s in sorted(limits[tier])], dtype=np.uint64))
+        for tier in destinations
+    }
+    offset = 0
+    try:
+        for batch in iter_batches(read_from, as_strings=as_strings):
+            units = _unit_hashes(batch, key, offset)
+            groups = _strata_hashes(batch, strata)
+            offset += batch.num_rows
+            for tier in destinations:
+                if tier not in writers:
+                    writers[tier] = pq.ParquetWriter(tmp_paths[tier], batch.schema, compression=COMPRESSION)
+                strata_keys, strata_limits = lookups[tier]
+                if not len(strata_keys):
+                    continue
+                position = np.minimum(np.searchsorted(strata_keys, groups), len(strata_keys) - 1)
+                mask = (strata_keys[position] == groups) & (units <= strata_limits[position])
+                if mask.any():
+                    selected = batch.filter(pa.array(mask))
+                    writers[tier].write_batch(selected)
+                    counts[tier] += selected.num_rows
+    finally:
+        for writer in writers.values():
+            writer.close()
+    for tier, path in destinations.items():
+        if tier in writers:
+            os.replace(tmp_paths[tier], path)
+    return {"rows": rows, "sample_rows": counts}
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False) -> dict[str, str]:
+    """Sample every large data file whose source (or columnar copy) changed since its samples were written."""
+    data_dir = get_data_dir(data_dir)
+    statuses = {}
+    for path in sampled_files(data_dir):
+        relative = str(path.relative_to(data_dir))
+        read_from = columnar_copy(path) or path
+        if not ensure_hydrated(read_from, data_dir):
+            statuses[relative] = "lfs pointer"
+            continue
+        config = SAMPLING.get(path.relative_to(data_dir).parts[0], {"key": [], "strata": []})
+        catalog = get_catalog(path)
+        entry = catalog["files"].get(path.name)
+        destinations = {tier: sample_path(path, tier) for tier in SAMPLE_RATES}
+        if (
+            not force
+            and entry is not None
+            and entry.get("read_from") == str(read_from.relative_to(data_dir))
+            and entry.get("source_fingerprint") == fingerprint(read_from)
+            and all(destination.is_file() for destination in destinations.values())
+        ):
+            statuses[relative] = "up to date"
+            continue
+
+        try:
+            schema_names = set(next(iter_batches(read_from, as_strings=True), pa.record_batch({})).schema.names)
+            key = [column for column in config["key"] if column in schema_names]
+            strata = [column for column in config["strata"] if column in schema_names]
+            logger.info(f"Sampling {relative} (key: {', '.join(key) or 'row'}; strata: {', '.join(strata) or 'none'})")
+            get_sample_dir(path).mkdir(parents=True, exist_ok=True)
+            counts = write_samples(read_from, destinations, key, strata)
+        except Exception as e:
+            logger.error(f"Failed to sample {relative}: {e.__class__.__name__}: {e}")
+            statuses[relative] = "failed"
+            continue
+        catalog = get_catalog(path)
+        catalog["files"][path.name] = {
+            "read_from": str(read_from.relative_to(data_dir)),
+            "source_fingerprint": fingerprint(read_from),
+            "key": key,
+            "strata": strata,
+            "rows": counts["rows"],
+            "samples": {
+                tier: {"path": destinations[tier].name, "rate": SAMPLE_RATES[tier], "rows": counts["sample_rows"][tier]}
+                for tier in SAMPLE_RATES
+            },
+        }
+        write_json(get_sample_dir(path) / CATALOG_FILENAME, catalog)
+        statuses[relative] = "sampled"
+    if (skipped := [relative for relative, status in statuses.items() if status == "lfs pointer"]):
+        logger.warning(f"Skipped {len(skipped)} Git LFS pointer(s), run `git lfs pull` or set BIOME_LFS_MIRROR first.")
+    return statuses
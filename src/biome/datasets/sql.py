@@ -0,0 +1,383 @@
+"""
+Embedded SQL over the local datasets, backed by DuckDB.
+
+Every CSV/TSV/TXT, XPT and sas7bdat file under the data folder is a view `<dataset>.<file>` (folder and file stem,
+lower-cased, e.g. `census_ahs.survey_2021` or `nhanes_dietary."2017_2018_demographics"`). A view reads the columnar
+copy built by `python -m biome.datasets build` when there is one; otherwise text files are scanned in place, and SAS
+files, which DuckDB cannot read, are streamed once into a Parquet cache the first time a query references them.
+Derived tables without a source file of the same name (rollups, hive-partitioned tables, ...) get views too.
+
+Queries run out-of-core on all cores (spilling to a temporary directory past `BIOME_SQL_MEMORY_LIMIT`) and only
+the first rows of the result are returned. Only a single read-only statement is run, and DuckDB itself may only
+touch files under the data folder and its temporary directory.
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import pyarrow.parquet as pq
+import yaml
+
+from .codebooks import get_specifications_dir
+from .lfs import ensure_hydrated
+from .profiles import DERIVED_FOLDERS, FILE_TAG_PATTERN, is_profiled_file, profile_path
+from .utils import fingerprint, get_data_dir, is_lfs_pointer, iter_sas_batches, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUFFIXES = {".csv", ".tsv", ".txt"}
+SAS_FORMATS = {".xpt": "xport", ".sas7bdat": "sas7bdat"}
+COLUMNAR_SUFFIXES = {".parquet", ".arrow"}
+CACHE_FOLDER = ".sql_cache"
+CACHE_CATALOG_FILENAME = "_catalog.json"
+SAS_CHUNK_SIZE = 50_000
+CSV_SAMPLE_SIZE = 100_000
+
+DEFAULT_MEMORY_LIMIT = "4GB"
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_ROWS = 50
+MAX_CELL_LENGTH = 80
+# Column with each row's file path, from which the partition keys of hive-partitioned tables are read.
+PATH_COLUMN = "__biome_path"
+EXPLAIN_PATTERN = re.compile(r"^\s*explain\s+(analy[sz]e\s+)?", re.IGNORECASE)
+IDENTIFIER_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def _identifier(name: str) -> str:
+    name = re.sub(r"\W+", "_", name.lower()).strip("_")
+    return name or "unnamed"
+
+
+def _quote(identifier: str) -> str:
+    return identifier if IDENTIFIER_PATTERN.match(identifier) else f'"{identifier}"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+@dataclass
+class DatasetView:
+    schema: str
+    name: str
+    source: Path
+    # "csv", "parquet" or "arrow" are read in place, "sas" is served from the Parquet cache once converted
+    kind: str
+    backing: Path
+    hive: bool = False
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{_quote(self.schema)}.{_quote(self.name)}"
+
+    def select(self) -> str:
+        path = _literal(str(self.backing))
+        if self.kind == "csv":
+            delimiter = ", delim='\\t'" if self.source.suffix.lower() in {".tsv", ".txt"} and _is_tab_delimited(self.source) else ""
+            return f"SELECT * FROM read_csv({path}, header=true, sample_size={CSV_SAMPLE_SIZE}{delimiter})"
+        if self.hive:
+            return _hive_select(self.backing)
+        return f"SELECT * FROM read_parquet({path})"
+
+
+def _hive_select(folder: Path) -> str:
+    """
+    A hive-partitioned table, with the columns of every file unified by name (columns a partition lacks read as null).
+
+    The partition keys are parsed from the file paths rather than with `hive_partitioning`, which would silently
+    replace a data column of the same name (e.g. the AHS `YEAR` column by the `year=` partitions, as column names are
+    case-insensitive); such keys are named `<key>_partition` instead.
+    """
+    files = sorted(path for path in folder.rglob("*.parquet") if not path.name.startswith("."))
+    columns = {name.lower() for path in files for name in pq.read_schema(path).names}
+    partitions: dict[str, set[str]] = {}
+    for path in files:
+        for part in path.relative_to(folder).parts[:-1]:
+            key, separator, value = part.partition("=")
+            if separator:
+                partitions.setdefault(key, set()).add(value)
+    selected = [f"* EXCLUDE ({PATH_COLUMN})"]
+    for key, values in partitions.items():
+        value = f"regexp_extract({PATH_COLUMN}, {_literal('/' + re.escape(key) + '=([^/]*)/')}, 1)"
+        if all(value_text.lstrip("-").isdigit() for value_text in values):
+            value = f"CAST({value} AS BIGINT)"
+        name = f"{key}_partition" if key.lower() in columns else key
+        selected.append(f"{value} AS {_quote(_identifier(name))}")
+    # DuckDB enables hive partitioning by itself for `key=value` paths
+    options = f"hive_partitioning=false, union_by_name=true, filename={_literal(PATH_COLUMN)}"
+    return f"SELECT {', '.join(selected)} FROM read_parquet({_literal(str(folder / '**' / '*.parquet'))}, {options})"
+
+
+def _is_tab_delimited(path: Path) -> bool:
+    if is_lfs_pointer(path):
+        return path.suffix.lower() == ".tsv"
+    with path.open("r", errors="replace") as f:
+        return "\t" in f.readline()
+
+
+def get_cache_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / CACHE_FOLDER
+
+
+def columnar_copy(path: Path) -> Optional[Path]:
+    """The Parquet/Arrow copy `python -m biome.datasets build` made of a source file, if any."""
+    for folder in sorted(DERIVED_FOLDERS):
+        if not (path.parent / folder).is_dir():
+            continue
+        for candidate in sorted((path.parent / folder).iterdir()):
+            if candidate.suffix in COLUMNAR_SUFFIXES and _identifier(candidate.stem) == _identifier(path.stem):
+                return candidate
+    return None
+
+
+def _is_hive_table(path: Path) -> bool:
+    return path.is_dir() and any(child.is_dir() and "=" in child.name for child in path.iterdir())
+
+
+def discover_views(data_dir: Optional[os.PathLike] = None) -> list[DatasetView]:
+    data_dir = get_data_dir(data_dir)
+    views: dict[str, DatasetView] = {}
+
+    def add(view: DatasetView) -> None:
+        base, suffix = view.name, 2
+        while f"{view.schema}.{view.name}" in views:
+            view.name = f"{base}_{suffix}"
+            suffix += 1
+        views[f"{view.schema}.{view.name}"] = view
+
+    cache_dir = get_cache_dir(data_dir)
+    for path in sorted(data_dir.rglob("*")):
+        suffix = path.suffix.lower()
+        if suffix not in TEXT_SUFFIXES | set(SAS_FORMATS) or not is_profiled_file(path, data_dir):
+            continue
+        relative = path.relative_to(data_dir)
+        schema = _identifier(relative.parts[0]) if len(relative.parts) > 1 else "main"
+        if (copy := columnar_copy(path)) is not None:
+            kind, backing = copy.suffix.lstrip("."), copy
+        elif suffix in SAS_FORMATS:
+            kind, backing = "sas", cache_dir / relative.with_suffix(".parquet")
+        else:
+            kind, backing = "csv", path
+        add(DatasetView(schema=schema, name=_identifier(path.stem), source=path, kind=kind, backing=backing))
+
+    backed = {view.backing for view in views.values()}
+    for folder in sorted(path for path in data_dir.rglob("*") if path.is_dir() and path.name in DERIVED_FOLDERS):
+        relative = folder.relative_to(data_dir)
+        if any(part.startswith((".", "_")) for part in relative.parts):
+            continue
+        schema = _identifier(relative.parts[0])
+        if _is_hive_table(folder):
+            add(DatasetView(schema=schema, name=_identifier(folder.name), source=folder, kind="parquet", backing=folder, hive=True))
+            continue
+        for path in sorted(folder.iterdir()):
+            if path.suffix in COLUMNAR_SUFFIXES and path not in backed:
+                add(DatasetView(schema=schema, name=_identifier(path.stem), source=path, kind=path.suffix.lstrip("."), backing=path))
+    return list(views.values())
+
+
+def specification_names(data_dir: Optional[os.PathLike] = None) -> dict[Path, str]:
+    """Data file or folder -> name of the specification referencing it with `{% file %}`."""
+    data_dir = get_data_dir(data_dir)
+    names: dict[Path, str] = {}
+    for api_yaml in sorted(get_specifications_dir().glob("*/api.yaml")):
+        try:
+            spec = yaml.safe_load(api_yaml.read_text())
+        except (OSError, yaml.YAMLError):
+            continue
+        if not isinstance(spec, dict):
+            continue
+        for relative in FILE_TAG_PATTERN.findall(spec.get("source") or ""):
+            names.setdefault((data_dir / relative).resolve(), spec.get("name") or api_yaml.parent.name)
+    return names
+
+
+def is_cached(view: DatasetView, data_dir: Optional[os.PathLike] = None) -> bool:
+    data_dir = get_data_dir(data_dir)
+    catalog = read_json(get_cache_dir(data_dir) / CACHE_CATALOG_FILENAME) or {}
+    return catalog.get(str(view.source.relative_to(data_dir))) == fingerprint(view.source) and view.backing.is_file()
+
+
+def convert_sas(view: DatasetView, data_dir: Optional[os.PathLike] = None) -> None:
+    """Stream a SAS file into its Parquet cache, unless the cache is already up to date."""
+    data_dir = get_data_dir(data_dir)
+    if is_cached(view, data_dir):
+        return
+    catalog_path = get_cache_dir(data_dir) / CACHE_CATALOG_FILENAME
+    relative = str(view.source.relative_to(data_dir))
+    logger.info(f"Converting {relative} to Parquet for SQL queries")
+    view.backing.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = view.backing.with_name(f".{view.backing.name}.tmp")
+    writer = None
+    try:
+        for batch in iter_sas_batches(view.source, SAS_FORMATS[view.source.suffix.lower()], SAS_CHUNK_SIZE):
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema, compression="zstd")
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"{view.source} has no rows.")
+    os.replace(tmp_path, view.backing)
+    catalog = read_json(catalog_path) or {}
+    catalog[relative] = fingerprint(view.source)
+    write_json(catalog_path, catalog)
+
+
+def _format_cell(value) -> str:
+    text = "" if value is None else str(value)
+    return text if len(text) <= MAX_CELL_LENGTH else text[:MAX_CELL_LENGTH] + "..."
+
+
+class LocalSQLEngine:
+    """A DuckDB connection with a view per local dataset file."""
+
+    def __init__(self, data_dir: Optional[os.PathLike] = None):
+        import duckdb
+
+        self.data_dir = get_data_dir(data_dir)
+        self.views = discover_views(self.data_dir)
+        self.specifications = specification_names(self.data_dir)
+        temp_directory = os.environ.get("BIOME_SQL_TEMP_DIR", os.path.join(tempfile.gettempdir(), "biome-duckdb"))
+        self.connection = duckdb.connect(database=":memory:", config={
+            "threads": os.cpu_count() or 1,
+            "memory_limit": os.environ.get("BIOME_SQL_MEMORY_LIMIT", DEFAULT_MEMORY_LIMIT),
+            "temp_directory": temp_directory,
+            # lets aggregations and joins stream instead of buffering rows to keep their order
+            "preserve_insertion_order": False,
+        })
+        # Queries may only read (and spill) where the views do, and can't change that: a statement that got past
+        # `is_read_only` still can't write files elsewhere, attach databases or install extensions.
+        self.connection.execute(f"SET allowed_directories = [{_literal(str(self.data_dir))}, {_literal(temp_directory)}]")
+        self.connection.execute("SET enable_external_access = false")
+        self.connection.execute("SET lock_configuration = true")
+        self.lock = threading.Lock()
+        self.pending: dict[str, DatasetView] = {}
+        for schema in sorted({view.schema for view in self.views}):
+            self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {_quote(schema)}")
+        for view in self.views:
+            if is_lfs_pointer(view.source) or (view.kind == "sas" and not is_cached(view, self.data_dir)):
+                self.pending[f"{view.schema}.{view.name}"] = view
+            else:
+                self._create_view(view)
+
+    def _create_view(self, view: DatasetView) -> None:
+        if view.kind == "arrow":
+            import pyarrow.dataset as ds
+
+            relation = f"_arrow_{view.schema}_{view.name}"
+            self.connection.register(relation, ds.dataset(view.backing, format="ipc"))
+            self.connection.execute(f"CREATE OR REPLACE VIEW {view.qualified_name} AS SELECT * FROM {_quote(relation)}")
+        else:
+            self.connection.execute(f"CREATE OR REPLACE VIEW {view.qualified_name} AS {view.select()}")
+
+    def _prepare_referenced(self, query: str) -> None:
+        """Hydrate and convert the pending views a query mentions, so only what is used pays the cost."""
+        normalized = re.sub(r'["`]', "", query.lower())
+        for key, view in list(self.pending.items()):
+            if not re.search(rf"(?<![\w.]){re.escape(view.schema)}\s*\.\s*{re.escape(view.name)}(?!\w)", normalized):
+                continue
+            if not ensure_hydrated(view.source, self.data_dir):
+                raise FileNotFoundError(
+                    f"{view.source} is a Git LFS pointer, run `git lfs pull` or set BIOME_LFS_MIRROR."
+                )
+            if view.kind == "sas":
+                convert_sas(view, self.data_dir)
+            self._create_view(view)
+            del self.pending[key]
+
+    def describe(self) -> str:
+        """The available views grouped by dataset, with the specification documenting each dataset."""
+        lines = [
+            "Views over the local dataset files (query them as <dataset>.<view>; "
+            "`DESCRIBE <dataset>.<view>` lists the columns):"
+        ]
+        for schema in sorted({view.schema for view in self.views}):
+            schema_views = [view for view in self.views if view.schema == schema]
+            folder = schema_views[0].source.relative_to(self.data_dir).parts[0]
+            spec = next(
+                (name for path, name in self.specifications.items()
+                 if path == self.data_dir / folder or (self.data_dir / folder) in path.parents),
+                None,
+            )
+            lines.append(f"\n{_quote(schema)}" + (f" (documented by the `{spec}` integration)" if spec else ""))
+            for view in schema_views:
+                details = [str(view.source.relative_to(self.data_dir))]
+                if view.backing != view.source and view.kind != "sas":
+                    details.append(f"read from {view.backing.relative_to(self.data_dir)}")
+                if profile := read_json(profile_path(view.source)):
+                    details.append(f"{profile['rows']} rows, {len(profile['columns'])} columns")
+                if is_lfs_pointer(view.source):
+                    details.append("LFS pointer, hydrated on first query")
+                elif f"{view.schema}.{view.name}" in self.pending:
+                    details.append("converted to Parquet on first query")
+                lines.append(f"- {_quote(view.name)}: " + "; ".join(details))
+        return "\n".join(lines)
+
+    def is_read_only(self, sql: str) -> bool:
+        """
+        Whether `sql` is exactly one query statement (SELECT, WITH, FROM, DESCRIBE, SHOW, SUMMARIZE, VALUES, TABLE),
+        or an EXPLAIN of one; `EXPLAIN ANALYZE` runs the statement it explains.
+        """
+        import duckdb
+
+        statements = self.connection.extract_statements(sql)
+        if len(statements) != 1:
+            return False
+        if statements[0].type == duckdb.StatementType.EXPLAIN:
+            explained = EXPLAIN_PATTERN.sub("", sql, count=1)
+            return explained != sql and self.is_read_only(explained)
+        return statements[0].type == duckdb.StatementType.SELECT
+
+    def query(self, sql: str, max_rows: int = DEFAULT_MAX_ROWS, timeout: Optional[float] = None) -> str:
+        """Run a read-only statement and return at most `max_rows` rows as a pipe-separated table."""
+        sql = sql.strip().rstrip(";")
+        if not sql or sql.lower() in {"show tables", "show all tables"}:
+            return self.describe()
+        timeout = timeout or float(os.environ.get("BIOME_SQL_TIMEOUT", DEFAULT_TIMEOUT))
+        with self.lock:
+            if not self.is_read_only(sql):
+                return "Only a single read-only statement (SELECT, WITH, DESCRIBE, SUMMARIZE, EXPLAIN, ...) is allowed."
+            self._prepare_referenced(sql)
+            timer = threading.Timer(timeout, self.connection.interrupt)
+            timer.start()
+            try:
+                result = self.connection.execute(sql)
+                columns = [column[0] for column in result.description]
+                rows = result.fetchmany(max_rows + 1)
+            finally:
+                timer.cancel()
+        lines = [" | ".join(columns)]
+        lines.extend(" | ".join(_format_cell(value) for value in row) for row in rows[:max_rows])
+        if len(rows) > max_rows:
+            lines.append(f"(only the first {max_rows} rows are shown; aggregate, filter or add a LIMIT)")
+        elif not rows:
+            lines.append("(no rows)")
+        return "\n".join(lines)
+
+
+_engine: Optional[LocalSQLEngine] = None
+_engine_fingerprints: dict = {}
+_engine_lock = threading.Lock()
+
+
+def get_sql_engine(data_dir: Optional[os.PathLike] = None) -> LocalSQLEngine:
+    """The process-wide engine, rebuilt only when a data file or derived artifact is added, removed or modified."""
+    global _engine, _engine_fingerprints
+    data_dir = get_data_dir(data_dir)
+    fingerprints = {
+        str(path): fingerprint(path) for path in data_dir.rglob("*")
+        if path.suffix.lower() in TEXT_SUFFIXES | set(SAS_FORMATS) | COLUMNAR_SUFFIXES
+        and not path.relative_to(data_dir).parts[0].startswith(".")
+    }
+    with _engine_lock:
+        if _engine is None or fingerprints != _engine_fingerprints:
+            _engine = LocalSQLEngine(data_dir)
+            _engine_fingerprints = fingerprints
+            logger.info(f"Registered {len(_engine.views)} SQL views over {data_dir}.")
+        return _engine
@@ -0,0 +1,232 @@
+"""
+One typed, compressed table for the USGS county-level pesticide use estimates.
+
+The `usgs_pesticide/EPest*.txt` files are tab-delimited, named inconsistently and some cover several years. They are
+normalized into a Parquet dataset under `usgs_pesticide/parquet/`, partitioned by `YEAR=<year>` and written one file
+per source and year, sorted by state FIPS, county FIPS and compound so filters on them skip row groups. Compound
+names are dictionary-encoded. Adding a new year's file only writes that year's partition; sources that did not
+change are never re-read.
+"""
+import datetime
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .lfs import ensure_hydrated
+from .utils import fingerprint, get_data_dir, is_lfs_pointer, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+PESTICIDE_FOLDER = "usgs_pesticide"
+PARQUET_FOLDER = "parquet"
+# Underscore-prefixed so dataset discovery does not take it for a Parquet fragment.
+CATALOG_FILENAME = "_catalog.json"
+SOURCE_GLOB = "EPest*.txt"
+DOWNLOAD_URL = "https://water.usgs.gov/nawqa/pnsp/usage/maps/county-level/PesticideUseEstimates/EPest.county.estimates.{year}.txt"
+ROW_GROUP_SIZE = 50_000
+COMPRESSION = "zstd"
+
+SCHEMA = pa.schema([
+    pa.field("COMPOUND", pa.dictionary(pa.int32(), pa.string())),
+    pa.field("STATE_FIPS_CODE", pa.int8()),
+    pa.field("COUNTY_FIPS_CODE", pa.int16()),
+    pa.field("FIPS", pa.string()),
+    pa.field("EPEST_LOW_KG", pa.float64()),
+    pa.field("EPEST_HIGH_KG", pa.float64()),
+])
+PARTITIONING = ds.partitioning(pa.schema([pa.field("YEAR", pa.int16())]), flavor="hive")
+SORT_KEYS = [("STATE_FIPS_CODE", "ascending"), ("COUNTY_FIPS_CODE", "ascending"), ("COMPOUND", "ascending")]
+# Header spellings seen across releases, mapped onto the canonical column names.
+COLUMN_ALIASES = {
+    "STATE_FIPS": "STATE_FIPS_CODE",
+    "COUNTY_FIPS": "COUNTY_FIPS_CODE",
+    "LOW_ESTIMATE": "EPEST_LOW_KG",
+    "HIGH_ESTIMATE": "EPEST_HIGH_KG",
+}
+
+
+def get_parquet_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    return get_data_dir(data_dir) / PESTICIDE_FOLDER / PARQUET_FOLDER
+
+
+def get_catalog(data_dir: Optional[os.PathLike] = None) -> dict:
+    return read_json(get_parquet_dir(data_dir) / CATALOG_FILENAME) or {"sources": {}}
+
+
+def canonical_column(name: str) -> str:
+    name = re.sub(r"\W+", "_", name.strip().strip('"').upper()).strip("_")
+    return COLUMN_ALIASES.get(name, name)
+
+
+def _numeric(column: pa.ChunkedArray, target: pa.DataType) -> pa.ChunkedArray:
+    values = pc.utf8_trim_whitespace(column)
+    return pc.cast(pc.if_else(pc.equal(values, ""), None, values), target)
+
+
+def read_source(source: Path) -> pa.Table:
+    """Parse one EPest file into the canonical columns plus YEAR (compounds are still plain strings here)."""
+    table = pacsv.read_csv(
+        source,
+        parse_options=pacsv.ParseOptions(delimiter="\t"),
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True),
+    )
+    table = table.rename_columns([canonical_column(name) for name in table.column_names])
+    table = pa.table({name: pc.cast(table.column(name), pa.string()) for name in table.column_names})
+    if (missing := {"COMPOUND", "YEAR", "STATE_FIPS_CODE", "COUNTY_FIPS_CODE"} - set(table.column_names)):
+        raise ValueError(f"{source.name} is missing column(s) {', '.join(sorted(missing))}")
+
+    state = _numeric(table.column("STATE_FIPS_CODE"), pa.int8())
+    county = _numeric(table.column("COUNTY_FIPS_CODE"), pa.int16())
+    fips = pc.binary_join_element_wise(
+        pc.utf8_lpad(pc.cast(state, pa.string()), 2, "0"), pc.utf8_lpad(pc.cast(county, pa.string()), 3, "0"), ""
+    )
+    columns = {
+        "COMPOUND": pc.utf8_upper(pc.utf8_trim_whitespace(table.column("COMPOUND"))),
+        "STATE_FIPS_CODE": state,
+        "COUNTY_FIPS_CODE": county,
+        "FIPS": fips,
+    }
+    for measure in ["EPEST_LOW_KG", "EPEST_HIGH_KG"]:
+        columns[measure] = (
+            _numeric(table.column(measure), pa.float64()) if measure in table.column_names
+            else pa.nulls(table.num_rows, pa.float64())
+        )
+    columns["YEAR"] = _numeric(table.column("YEAR"), pa.int16())
+    return pa.table(columns)
+
+
+def _year_path(parquet_dir: Path, year: int, source: Path) -> Path:
+    return parquet_dir / f"YEAR={year}" / f"{source.stem.replace('.', '_')}.parquet"
+
+
+def _remove_source(parquet_dir: Path, entry: dict) -> None:
+    for relative_path in entry.get("files", []):
+        path = parquet_dir / relative_path
+        path.unlink(missing_ok=True)
+        if path.parent.is_dir() and not any(path.parent.iterdir()):
+            path.parent.rmdir()
+
+
+def convert_source(source: Path, parquet_dir: Path) -> dict:
+    """Write one source file's rows into the YEAR partitions. Returns its catalog entry."""
+    table = read_source(source)
+    files = []
+    years = sorted(year for year in pc.unique(table.column("YEAR")).to_pylist() if year is not None)
+    for year in years:
+        rows = table.filter(pc.equal(table.column("YEAR"), year)).drop_columns(["YEAR"])
+        # Sort before dictionary-encoding the compounds; Arrow cannot sort dictionary columns.
+        rows = rows.sort_by(SORT_KEYS).cast(SCHEMA)
+        destination = _year_path(parquet_dir, year, source)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        tmp_destination = destination.with_name(f".{destination.name}.tmp")
+        pq.write_table(rows, tmp_destination, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_destination, destination)
+        files.append(str(destination.relative_to(parquet_dir)))
+    return {
+        "source_fingerprint": fingerprint(source),
+        "years": years,
+        "rows": table.num_rows,
+        "compounds": len(pc.unique(table.column("COMPOUND"))),
+        "files": files,
+        "built": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def build(data_dir: Optional[os.PathLike] = None, force: bool = False) -> dict:
+    """
+    Append new or changed EPest files to the dataset and drop the partitions of removed ones.
+
+    Unchanged sources are left alone, so adding a year only costs parsing that year's file.
+    """
+    parquet_dir = get_parquet_dir(data_dir)
+    catalog_path = parquet_dir / CATALOG_FILENAME
+    catalog = get_catalog(data_dir)
+    entries: dict = catalog.setdefault("sources", {})
+    catalog["format"] = "parquet"
+    catalog["partitioning"] = "hive:YEAR"
+
+    sources = {path.name: path for path in sorted((get_data_dir(data_dir) / PESTICIDE_FOLDER).glob(SOURCE_GLOB))}
+    for name in [name for name in entries if name not in sources]:
+        logger.info(f"Removing USGS pesticide rows from {name}, which no longer exists.")
+        _remove_source(parquet_dir, entries.pop(name))
+        write_json(catalog_path, catalog)
+
+    for name, source in sources.items():
+        if not ensure_hydrated(source, data_dir):
+            logger.warning(f"Skipping {source}: it is a Git LFS pointer that could not be hydrated, run `git lfs pull` or set BIOME_LFS_MIRROR.")
+            continue
+        entry = entries.get(name)
+        if (
+            not force
+            and entry is not None
+            and entry.get("source_fingerprint") == fingerprint(source)
+            and all((parquet_dir / path).is_file() for path in entry.get("files", []))
+        ):
+            logger.info(f"USGS pesticide {name} is up to date.")
+            continue
+        if entry is not None:
+            _remove_source(parquet_dir, entry)
+        logger.info(f"Adding USGS pesticide estimates from {source}")
+        entries[name] = convert_source(source, parquet_dir)
+        write_json(catalog_path, catalog)
+
+    years: dict[str, list[str]] = {}
+    for name, entry in sorted(entries.items()):
+        for year in entry["years"]:
+            years.setdefault(str(year), []).append(name)
+    if (overlapping := {year: names for year, names in years.items() if len(names) > 1}):
+        logger.warning(f"USGS pesticide years provided by more than one file: {overlapping}")
+    catalog["years"] = years
+    write_json(catalog_path, catalog)
+    return catalog
+
+
+def download_years(years: list[int], data_dir: Optional[os.PathLike] = None) -> list[Path]:
+    """
+    Download more annual files from USGS into the dataset folder. Run `build` afterwards to append them.
+    """
+    import requests
+
+    folder = get_data_dir(data_dir) / PESTICIDE_FOLDER
+    downloaded = []
+    for year in years:
+        destination = folder / f"EPest.county.estimates.{year}.txt"
+        if destination.is_file() and not is_lfs_pointer(destination):
+            continue
+        response = requests.get(DOWNLOAD_URL.format(year=year), timeout=120)
+        response.raise_for_status()
+        tmp_destination = destination.with_name(f".{destination.name}.tmp")
+        tmp_destination.write_bytes(response.content)
+        os.replace(tmp_destination, destination)
+        downloaded.append(destination)
+    return downloaded
+
+
+def open_dataset(data_dir: Optional[os.PathLike] = None) -> ds.Dataset:
+    parquet_dir = get_parquet_dir(data_dir)
+    if not (parquet_dir / CATALOG_FILENAME).is_file():
+        raise FileNotFoundError(
+            f"No USGS pesticide dataset at {parquet_dir}. Build it with `python -m biome.datasets build usgs_pesticide`."
+        )
+    return ds.dataset(parquet_dir, schema=SCHEMA.append(PARTITIONING.schema.field("YEAR")), format="parquet", partitioning=PARTITIONING)
+
+
+def read_estimates(
+    columns: Optional[list[str]] = None,
+    filters: Optional[list] = None,
+    data_dir: Optional[os.PathLike] = None,
+):
+    """
+    Read pesticide estimates as a pandas DataFrame, e.g.
+    `read_estimates(filters=[("COMPOUND", "=", "GLYPHOSATE"), ("STATE_FIPS_CODE", "=", 19), ("YEAR", ">=", 2010)])`.
+    """
+    expression = pq.filters_to_expression(filters) if filters else None
+    return open_dataset(data_dir).to_table(columns=columns, filter=expression).to_pandas()
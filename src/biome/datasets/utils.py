@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+if TYPE_CHECKING:
+    import pyarrow
+
+logger = logging.getLogger(__name__)
+
+LFS_POINTER_PREFIX = b"version https://git-lfs.github.com/spec/v1"
+LFS_POINTER_MAX_SIZE = 1024
+
+
+def get_data_dir(data_dir: Optional[os.PathLike] = None) -> Path:
+    """
+    Resolve the root folder of the local datasets (`adhoc_data/data` in the repo).
+
+    Explicit arguments win, then `BIOME_DATA_DIR`, then the `data` folder under `INTEGRATION_PATH`,
+    which is what the adhoc integration provider resolves `{% file ... %}` tags against.
+    """
+    if data_dir is not None:
+        return Path(data_dir).resolve()
+    if (env_data_dir := os.environ.get("BIOME_DATA_DIR")):
+        return Path(env_data_dir).resolve()
+    return (Path(os.environ.get("INTEGRATION_PATH", "./adhoc_data")) / "data").resolve()
+
+
+def fingerprint(path: os.PathLike) -> dict[str, int]:
+    """Cheap change detector for a source file, stored alongside derived artifacts."""
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def sha256sum(path: os.PathLike, chunk_size: int = 8 * 1024 * 1024) -> str:
+    """Content checksum of a file, read in chunks. This is also the oid Git LFS records for the file."""
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while (chunk := f.read(chunk_size)):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_lfs_pointer(path: os.PathLike) -> bool:
+    """True if the file is an un-hydrated Git LFS pointer rather than the real data."""
+    path = Path(path)
+    try:
+        if path.stat().st_size > LFS_POINTER_MAX_SIZE:
+            return False
+        with path.open("rb") as f:
+            return f.read(len(LFS_POINTER_PREFIX)) == LFS_POINTER_PREFIX
+    except OSError:
+        return False
+
+
+def read_json(path: os.PathLike) -> Optional[Any]:
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: os.PathLike, data: Any) -> None:
+    """Write JSON atomically so readers never observe a half-written catalog."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(data, indent=2, sort_keys=True))
+    os.replace(tmp_path, path)
+
+
+def iter_sas_batches(
+    path: os.PathLike,
+    format: str,
+    chunksize: int,
+    encoding: str = "latin-1",
+) -> Iterator["pyarrow.RecordBatch"]:
+    """
+    Stream a SAS file (`sas7bdat` or `xport`) as Arrow record batches of at most `chunksize` rows.
+
+    The schema is fixed by the first chunk: SAS numerics are float64 and character variables are decoded strings,
+    so every batch can be written to the same Arrow/Parquet file.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    schema = None
+    with pd.read_sas(path, format=format, chunksize=chunksize, encoding=encoding) as reader:
+        for chunk in reader:
+            if schema is None:
+                schema = pa.schema([
+                    pa.field(name, pa.float64() if pd.api.types.is_numeric_dtype(dtype) else pa.string())
+                    for name, dtype in chunk.dtypes.items()
+                ])
+            yield pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
@@ -1,5 +1,316 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Optional
+
+import yaml
+from adhoc_api.tool import AdhocApi, QueryType
 from beaker_kernel.lib.integrations.adhoc import AdhocIntegrationProvider, AdhocSpecificationIntegration
 
+from biome.datasets.profiles import FILE_TAG_PATTERN
+from biome.shared.openapi import compact_attachments
+from biome.shared.profiles import profiles_section, referenced_summaries
+from biome.shared.ranking import ExampleIndex, example_limits
+from biome.shared.retrieval import DocumentIndex, RetrievingDrafter, retrieval_top_k, split_attachments
+from biome.shared.semantic_cache import SemanticCache, annotate, integration_words
+from biome.shared.spec_cache import file_digests, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+RENDER_CACHE_VERSION = 1
+# Top-level `api.yaml` fields read by Biome that beaker does not keep on the specification.
+SPEC_OPTIONS = ["compact_openapi", "retrieval"]
+
+
 class BiomeAdhocIntegrations(AdhocIntegrationProvider):
     display_name="Biome Specialist Agents"
     slug="biome"
+
+    def __init__(self, display_name: str, **config_options):
+        # the file digests of each specification folder, reused while a file's size and mtime are unchanged; set
+        # first, as the base class renders the specifications in its __init__
+        self.folder_digests: dict[str, dict] = {}
+        super().__init__(display_name, **config_options)
+
+    def profile_documentation(self, spec: AdhocSpecificationIntegration) -> str:
+        """Profile summaries of the local data files a specification references, if they have been built."""
+        return profiles_section(
+            referenced_summaries(spec.source or "", resolve=lambda relative: self.get_file("data", relative))
+        )
+
+    def spec_options(self, spec: AdhocSpecificationIntegration) -> dict:
+        """The `SPEC_OPTIONS` set in the specification's `api.yaml`."""
+        if spec.location is None:
+            return {}
+        try:
+            content = yaml.safe_load((Path(spec.location) / "api.yaml").read_text()) or {}
+        except (OSError, yaml.YAMLError):
+            return {}
+        return {option: content[option] for option in SPEC_OPTIONS if option in content}
+
+    def update_specification_file(self, spec: AdhocSpecificationIntegration, action="update"):
+        # beaker writes the specification from its fields only, which would drop the options
+        options = self.spec_options(spec)
+        super().update_specification_file(spec, action)
+        if action in ("add", "update") and options:
+            api_file = Path(spec.location) / "api.yaml"
+            api_file.write_text(yaml.safe_dump({**yaml.safe_load(api_file.read_text()), **options}))
+
+    def attachment_overrides(self, spec: AdhocSpecificationIntegration) -> dict[str, str]:
+        """With `compact_openapi: true`, the compact summaries substituted for the specification's OpenAPI attachments."""
+        if not self.spec_options(spec).get("compact_openapi"):
+            return {}
+        return compact_attachments(
+            {
+                attachment.name: Path(spec.location) / "attachments" / attachment.filepath
+                for attachment in spec.get_files() if attachment.filepath is not None
+            },
+            spec.slug,
+        )
+
+    def retrieval_overrides(self, spec: AdhocSpecificationIntegration, overrides: dict[str, str]) -> tuple[dict[str, str], list[dict]]:
+        """
+        With `retrieval` set, `overrides` with a placeholder substituted for each large attachment, and the chunks of
+        those attachments (see `biome.shared.retrieval`).
+        """
+        if not self.spec_options(spec).get("retrieval"):
+            return overrides, []
+        texts = {}
+        for attachment in spec.get_files():
+            if attachment.filepath is None:
+                continue
+            text = overrides.get(attachment.name)
+            if text is None:
+                try:
+                    text = (Path(spec.location) / "attachments" / attachment.filepath).read_text()
+                except (OSError, UnicodeDecodeError):
+                    continue
+            texts[attachment.name] = (attachment.filepath, text)
+        placeholders, chunks = split_attachments(texts)
+        return {**overrides, **placeholders}, chunks
+
+    def render_key(self, spec: AdhocSpecificationIntegration, substitutions: dict) -> str:
+        """
+        Hash of everything a render depends on: the specification fields, the files in its folder (by their digests,
+        which are only computed again when a file's size or mtime changes), the data files its `{% file %}` tags
+        resolve to, and the substitutions.
+        """
+        content = asdict(spec)
+        content.pop("location", None)
+        if spec.location is not None:
+            # the attachment contents loaded with the specification are covered by the digests of their files
+            for resource in content.get("resources", {}).values():
+                if resource.get("filepath") is not None:
+                    resource.pop("content", None)
+            location = str(spec.location)
+            digests = file_digests(Path(location), previous=self.folder_digests.get(location))
+            self.folder_digests[location] = digests
+            content["files"] = {relative: digest[2] for relative, digest in digests.items()}
+        resolved = {
+            relative: str(self.get_file("data", relative))
+            for relative in dict.fromkeys(FILE_TAG_PATTERN.findall(spec.source or ""))
+        }
+        payload = json.dumps([RENDER_CACHE_VERSION, content, resolved, substitutions], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def render_cached(self, spec: AdhocSpecificationIntegration, substitutions: dict) -> Optional[dict]:
+        """`spec.render`, deserialized from the cache when nothing the render depends on has changed."""
+        cache_path = get_cache_dir() / "kernel" / f"{spec.slug}-{spec.uuid}.json"
+        key = self.render_key(spec, substitutions)
+        try:
+            cached = json.loads(cache_path.read_text())
+            if cached.get("key") == key:
+                return cached["api"]
+        except (OSError, ValueError):
+            pass
+
+        if (api := spec.render(self, substitutions)) is None:
+            return None
+        tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps({"key": key, "api": api}))
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not cache the rendered specification of {spec.slug}: {e}")
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return api
+
+    def render_full(self, spec: AdhocSpecificationIntegration) -> Optional[dict]:
+        """
+        The rendered specification with its data file profiles, and the chunks to retrieve from if it uses
+        retrieval, or None if it fails to render.
+        """
+        started = time.perf_counter()
+        overrides, chunks = self.retrieval_overrides(spec, self.attachment_overrides(spec))
+        if (api := self.render_cached(spec, overrides)) is None:
+            return None
+        api["documentation"] += self.profile_documentation(spec)
+        if chunks:
+            # taken off the specification by `LazyAdhocApi`, adhoc-api does not accept extra fields
+            api["retrieval"] = {"chunks": chunks, "top_k": retrieval_top_k(self.spec_options(spec)["retrieval"])}
+        logger.info(f"Rendered {spec.slug} in {time.perf_counter() - started:.2f}s")
+        return api
+
+    def build_adhoc(self):
+        # Only what is needed to list the integrations is kept up front; each specification is rendered (with its
+        # attachments) the first time it is consulted.
+        if not isinstance(getattr(self, "adhoc_api", None), LazyAdhocApi):
+            self.adhoc_api = LazyAdhocApi(**self.adhoc_config_options)
+        self.sync_adhoc_api()
+
+    def sync_adhoc_api(self):
+        """
+        Bring the live `LazyAdhocApi` in line with `self.specifications`: only added or changed specifications are
+        swapped in (and rendered again on their next use), so editing one integration keeps the others' agents.
+        """
+        keys = {spec.slug: self.render_key(spec, {}) for spec in self.specifications}
+        for slug in set(self.adhoc_api.keys) - set(keys):
+            self.adhoc_api.remove(slug)
+        for spec in self.specifications:
+            if self.adhoc_api.keys.get(spec.slug) != keys[spec.slug]:
+                self.adhoc_api.replace(
+                    stub={"name": spec.name, "slug": spec.slug, "description": spec.description, "documentation": ""},
+                    loader=functools.partial(self.render_full, spec),
+                    key=keys[spec.slug],
+                )
+
+    def refresh_adhoc_specs(self):
+        self.sync_adhoc_api()
+
+
+class LazyAdhocApi(AdhocApi):
+    """
+    `AdhocApi` whose specifications are rendered by their loader the first time they are consulted, then kept.
+
+    Specifications can be replaced or removed while the kernel runs: a request that already holds a drafter agent
+    finishes with it, and the next request gets an agent for the new specification. The drafter of a specification
+    using retrieval gets the relevant chunks of its large attachments with each message, and the curator only picks
+    from the examples most relevant to the request. Rephrasings of earlier requests are answered from the
+    `SemanticCache`.
+    """
+
+    def __init__(self, **kwargs):
+        self.loaders: dict[str, Callable[[], Optional[dict]]] = {}
+        self.keys: dict[str, str] = {}
+        self.loaded: set[str] = set()
+        self.agents: dict = {}
+        self.indexes: dict[str, DocumentIndex] = {}
+        self.example_indexes: dict[str, ExampleIndex] = {}
+        # the request the examples of this thread's current curator step are ranked against
+        self.curating = threading.local()
+        self.semantic_cache = SemanticCache.from_env()
+        # the type, request, context-free form and cache match of the request this thread is answering
+        self.answering = threading.local()
+        self.lock = threading.RLock()
+        super().__init__(apis=[], **kwargs)
+
+    def replace(self, stub: dict, loader: Callable[[], Optional[dict]], key: str) -> None:
+        """Serve the specification `loader` renders under the stub's slug from the next request on."""
+        slug = stub["slug"]
+        with self.lock:
+            self.loaders[slug] = loader
+            self.keys[slug] = key
+            self.loaded.discard(slug)
+            self.agents.pop(slug, None)
+            self.indexes.pop(slug, None)
+            self.example_indexes.pop(slug, None)
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear(slug)
+            self.add_api(stub)
+
+    def remove(self, slug: str) -> None:
+        with self.lock:
+            for registry in (self.loaders, self.keys, self.agents, self.indexes, self.example_indexes, self.apis):
+                registry.pop(slug, None)
+            self.loaded.discard(slug)
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear(slug)
+
+    def _get_api(self, api: str):
+        loader = self.loaders.get(api)
+        if loader is not None and api not in self.loaded:
+            # handling None cases in failed renders keeps them editable but not usable by the agent
+            if (spec := loader()) is None:
+                raise ValueError(f"Integration {api} failed to render, see the kernel log for details.")
+            retrieval = spec.pop("retrieval", None)
+            index = DocumentIndex(**retrieval) if retrieval else None
+            example_index = ExampleIndex(spec["examples"]) if spec.get("examples") else None
+            with self.lock:
+                if self.loaders.get(api) is loader and api not in self.loaded:
+                    # add_api also picks the drafter model again, now that the documentation size is known
+                    self.add_api({**spec, "slug": api})
+                    if index is not None:
+                        self.indexes[api] = index
+                    if example_index is not None:
+                        self.example_indexes[api] = example_index
+                    self.loaded.add(api)
+        spec, config = super()._get_api(api)
+        query = getattr(self.curating, "query", None)
+        if query is not None and (example_index := self.example_indexes.get(api)) is not None:
+            spec = {**spec, "examples": example_index.select(query, *example_limits())}
+        return spec, config
+
+    def _curate(self, find: Callable, api: str, query: str):
+        """Run a curator step over only the examples most relevant to the query (see `ExampleIndex`)."""
+        self.curating.query = query
+        try:
+            return find(api, query)
+        finally:
+            self.curating.query = None
+
+    def _ignored_words(self, api: str) -> frozenset:
+        spec, _ = self.apis.get(api, ({}, None))
+        return integration_words(api, spec)
+
+    def _api_draft_helper(self, api: str, query: str, type: QueryType) -> str:
+        self.answering.type, self.answering.context_free, self.answering.matched = type, None, None
+        self.answering.request = query
+        try:
+            response = super()._api_draft_helper(api, query, type)
+            if self.answering.matched is not None:
+                return annotate(response, self.answering.matched, code=type == QueryType.WRITE_CODE)
+            if self.semantic_cache is not None and self.answering.context_free is not None:
+                self.semantic_cache.store(api, type.value, self.answering.context_free, response, self._ignored_words(api))
+            return response
+        finally:
+            self.answering.type = self.answering.request = self.answering.context_free = None
+
+    def _answered_request(self) -> Optional[str]:
+        """The request this thread is answering, context-free once the contextualizer has run."""
+        return getattr(self.answering, "context_free", None) or getattr(self.answering, "request", None)
+
+    def _find_perfect_example(self, api: str, query: str):
+        # the first step given the context-free request; a cached answer is returned the way a perfect example is
+        self.answering.context_free = query
+        type = getattr(self.answering, "type", None)
+        if self.semantic_cache is not None and type is not None:
+            if (cached := self.semantic_cache.lookup(api, type.value, query, self._ignored_words(api))) is not None:
+                self.answering.matched = cached.query
+                self.logger.info(f'Reusing the answer to the similar request "{cached.query}" for "{query}"')
+                return cached.response
+        return self._curate(super()._find_perfect_example, api, query)
+
+    def _find_relevant_examples(self, api: str, query: str):
+        return self._curate(super()._find_relevant_examples, api, query)
+
+    def _get_agent(self, api: str):
+        # per instance and per integration (instead of `@cache`), so a replaced integration gets a new agent
+        if (agent := self.agents.get(api)) is not None:
+            return agent
+        loader = self.loaders.get(api)
+        agent = AdhocApi._get_agent.__wrapped__(self, api)
+        if (index := self.indexes.get(api)) is not None:
+            agent = RetrievingDrafter(agent, index, request=self._answered_request)
+        with self.lock:
+            if self.loaders.get(api) is not loader:
+                # replaced while the agent was being made; this request still gets it, but it is not kept
+                return agent
+            return self.agents.setdefault(api, agent)
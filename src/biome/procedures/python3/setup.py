@@ -20,6 +20,31 @@ for key, value in _api_keys.items():
     if value and value != "None":
         os.environ.setdefault(key, value)
 
+# Replace Git LFS pointer files with their content from the configured mirror the first time they are read.
+_lfs_mirror = "{{lfs_mirror}}"
+if _lfs_mirror and _lfs_mirror != "None":
+    os.environ.setdefault("BIOME_LFS_MIRROR", _lfs_mirror)
+try:
+    from biome.datasets.lfs import install_lfs_hydration
+    install_lfs_hydration()
+except ImportError:
+    pass
+
+# Keep DataFrames read from local dataset files in memory, so re-reading the same file is instant.
+_dataset_cache_mb = "{{dataset_cache_mb}}"
+if _dataset_cache_mb.lower() not in ("false", "0"):
+    try:
+        from biome.datasets.cache import install_dataset_cache
+        dataset_cache = install_dataset_cache(_dataset_cache_mb)
+    except ImportError:
+        pass
+
+# Cached, pre-simplified county/state geometries keyed by FIPS for choropleth maps (built on first use).
+try:
+    from biome.datasets.geo import choropleth, county_geometries, state_geometries
+except ImportError:
+    pass
+
 formatter = IPython.get_ipython().display_formatter.formatters['text/plain']
 formatter.max_seq_length = 0
 warnings.filterwarnings('ignore', category=FutureWarning)
@@ -0,0 +1,6 @@
+"""
+Code shared by the Biome kernel and the REST API.
+
+The REST API can't depend on `biome`, so it vendors this package as `biome_rest.shared` (a symlink to this folder).
+Modules here may only use the standard library, PyYAML (a dependency of both) and relative imports.
+"""
@@ -0,0 +1,279 @@
+"""
+Compact, prompt-sized summaries of OpenAPI 3 and Swagger 2 documents.
+
+Integrations that set `compact_openapi: true` in their `api.yaml` get every OpenAPI attachment substituted into
+their documentation as a dense endpoint summary instead of the raw document: one line per operation with its
+parameters, request body and response type, followed by the fields of every schema. `$ref`s are resolved to schema
+names, and examples, vendor extensions, non-2xx responses and long descriptions are dropped.
+
+The summary is cached as `<attachment>-<path hash>.compact.md` under `compact/` in the specification cache folder (see
+`spec_cache.py`), and rebuilt when the attachment changes. It is not written next to the attachment, where it would
+change the content key of the specification folder. Both the kernel and the REST API compact the attachments of these
+integrations.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+from .spec_cache import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+COMPACT_SUFFIX = ".compact.md"
+COMPACT_VERSION = 1
+HTTP_METHODS = ["get", "put", "post", "delete", "patch", "head", "options"]
+MAX_DESCRIPTION_LENGTH = 160
+MAX_ENUM_VALUES = 12
+MAX_INLINE_DEPTH = 2
+HEADER_PATTERN = re.compile(r"^<!-- compacted from (?P<name>.+?) \(sha256 (?P<digest>[0-9a-f]{64}), v(?P<version>\d+)\) -->\n")
+
+
+def compact_path(path: Path) -> Path:
+    # the attachment's full path is part of the name, so same-named attachments of two specifications never clash
+    suffix = hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:12]
+    return get_cache_dir() / "compact" / f"{path.name}-{suffix}{COMPACT_SUFFIX}"
+
+
+def parse_document(text: str) -> Optional[dict]:
+    """The parsed document if the text is an OpenAPI or Swagger document (JSON or YAML), else None."""
+    try:
+        document = json.loads(text)
+    except ValueError:
+        try:
+            document = yaml.safe_load(text)
+        except yaml.YAMLError:
+            # hand-edited JSON with stray commas (`{ ,`, `, ,` or `, }`), as in some published specs
+            text = re.sub(r",(\s*,)+", ",", text)
+            text = re.sub(r"([{\[])\s*,", r"\1", re.sub(r",(\s*[}\]])", r"\1", text))
+            try:
+                document = json.loads(text)
+            except ValueError:
+                return None
+    if isinstance(document, dict) and ("openapi" in document or "swagger" in document):
+        return document
+    return None
+
+
+def _short(text: Optional[str], limit: int = MAX_DESCRIPTION_LENGTH) -> str:
+    """First sentence of a description, without markup, on one line."""
+    if not text:
+        return ""
+    text = re.sub(r"<[^>]+>", "", str(text))
+    text = " ".join(text.split())
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+
+def _ref_name(ref: str) -> str:
+    return ref.rsplit("/", 1)[-1].replace("~1", "/").replace("~0", "~")
+
+
+def resolve(document: dict, item):
+    """Follow a local `$ref` (`#/components/...`) to what it points to; other items are returned as is."""
+    seen = set()
+    while isinstance(item, dict) and isinstance(item.get("$ref"), str) and item["$ref"].startswith("#/"):
+        ref = item["$ref"]
+        if ref in seen:
+            break
+        seen.add(ref)
+        target = document
+        for part in ref[2:].split("/"):
+            target = target.get(part.replace("~1", "/").replace("~0", "~"), {}) if isinstance(target, dict) else {}
+        item = target
+    return item
+
+
+def schemas(document: dict) -> dict:
+    if "components" in document:
+        return document["components"].get("schemas", {}) or {}
+    return document.get("definitions", {}) or {}
+
+
+def type_name(schema, depth: int = 0) -> str:
+    """A short type expression for a schema: named schemas by name, arrays, maps, enums and small inline objects."""
+    if not isinstance(schema, dict):
+        return "any"
+    if "$ref" in schema:
+        return _ref_name(schema["$ref"])
+    for combinator, separator in (("allOf", " & "), ("oneOf", " | "), ("anyOf", " | ")):
+        if combinator in schema:
+            return separator.join(type_name(part, depth) for part in schema[combinator])
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = "|".join(str(t) for t in schema_type if t != "null") or "null"
+    if schema_type == "array" or "items" in schema:
+        return f"array[{type_name(schema.get('items', {}), depth)}]"
+    if "enum" in schema:
+        values = [str(value) for value in schema["enum"]]
+        if len(values) > MAX_ENUM_VALUES:
+            values = values[:MAX_ENUM_VALUES] + ["..."]
+        return f"{schema_type or 'string'}({'|'.join(values)})"
+    if schema_type == "object" or "properties" in schema:
+        properties = schema.get("properties") or {}
+        if properties and depth < MAX_INLINE_DEPTH:
+            return "{" + ", ".join(_field(name, value, schema, depth + 1) for name, value in properties.items()) + "}"
+        additional = schema.get("additionalProperties")
+        if isinstance(additional, dict):
+            return f"map[string, {type_name(additional, depth)}]"
+        return "object"
+    if schema_type is None:
+        return "any"
+    if "format" in schema:
+        return f"{schema_type}<{schema['format']}>"
+    return str(schema_type)
+
+
+def _field(name: str, schema, parent: dict, depth: int = 0) -> str:
+    required = "*" if name in (parent.get("required") or []) else ""
+    return f"{name}{required}: {type_name(schema, depth)}"
+
+
+def _parameters(document: dict, path_item: dict, operation: dict) -> tuple[list[str], Optional[str]]:
+    """Non-body parameters as `name*: type (in)`, and the Swagger 2 body parameter type if there is one."""
+    parameters = {}
+    for parameter in (path_item.get("parameters") or []) + (operation.get("parameters") or []):
+        parameter = resolve(document, parameter)
+        if isinstance(parameter, dict) and "name" in parameter:
+            parameters[(parameter["name"], parameter.get("in"))] = parameter
+    rendered, body = [], None
+    for (name, location), parameter in parameters.items():
+        if location == "body":
+            body = type_name(parameter.get("schema", {}))
+            continue
+        schema = parameter.get("schema", parameter)
+        required = "*" if parameter.get("required") else ""
+        rendered.append(f"{name}{required}: {type_name(schema)} ({location})")
+    return rendered, body
+
+
+def _content_type(document: dict, item: dict) -> Optional[str]:
+    """The schema type of an OpenAPI 3 request body or response, preferring JSON content."""
+    item = resolve(document, item)
+    if not isinstance(item, dict):
+        return None
+    if "schema" in item:
+        return type_name(item["schema"])
+    content = item.get("content") or {}
+    if not content:
+        return None
+    media_type = next((media for media in content if "json" in media), next(iter(content)))
+    schema = (content[media_type] or {}).get("schema")
+    return type_name(schema) if schema else media_type
+
+
+def _response(document: dict, operation: dict) -> Optional[str]:
+    responses = operation.get("responses") or {}
+    for status in sorted(responses, key=str):
+        if str(status).startswith("2"):
+            response_type = _content_type(document, responses[status])
+            return f"{status} {response_type}" if response_type else str(status)
+    return None
+
+
+def summarize(document: dict) -> str:
+    """The compact Markdown summary of a parsed OpenAPI or Swagger document."""
+    info = document.get("info") or {}
+    lines = [f"# {info.get('title', 'API')} {info.get('version', '')}".rstrip()]
+    if description := _short(info.get("description"), 400):
+        lines.append(description)
+    if "servers" in document:
+        servers = [server.get("url", "") for server in document.get("servers") or [] if isinstance(server, dict)]
+    else:
+        scheme = (document.get("schemes") or ["https"])[0]
+        servers = [f"{scheme}://{document.get('host', '')}{document.get('basePath', '')}"] if document.get("host") else []
+    if servers:
+        lines.append("Base URL: " + ", ".join(servers))
+    security = (document.get("components") or {}).get("securitySchemes") or document.get("securityDefinitions") or {}
+    if security:
+        lines.append("Auth: " + "; ".join(
+            f"{name} ({scheme.get('type')}{', ' + scheme['name'] + ' in ' + scheme.get('in', '') if scheme.get('name') else ''})"
+            for name, scheme in security.items() if isinstance(scheme, dict)
+        ))
+    lines.append("Conventions: `name*` is required; types in `{}` are inline objects; other types are the schemas listed at the end.")
+
+    lines.append("\n## Endpoints")
+    for path, path_item in (document.get("paths") or {}).items():
+        path_item = resolve(document, path_item)
+        for method in HTTP_METHODS:
+            if not isinstance(path_item, dict) or method not in path_item:
+                continue
+            operation = path_item[method] or {}
+            if operation.get("deprecated"):
+                continue
+            parameters, body = _parameters(document, path_item, operation)
+            if "requestBody" in operation:
+                body = _content_type(document, operation["requestBody"])
+            line = f"- {method.upper()} {path}"
+            if summary := _short(operation.get("summary") or operation.get("description")):
+                line += f" - {summary}"
+            details = []
+            if parameters:
+                details.append("params: " + ", ".join(parameters))
+            if body:
+                details.append(f"body: {body}")
+            if response := _response(document, operation):
+                details.append(f"returns: {response}")
+            lines.append(line + ("\n  " + "; ".join(details) if details else ""))
+
+    if (named := schemas(document)):
+        lines.append("\n## Schemas")
+        for name, schema in named.items():
+            schema = resolve(document, schema)
+            if not isinstance(schema, dict):
+                continue
+            properties = schema.get("properties") or {}
+            if properties:
+                fields = ", ".join(_field(field, value, schema, MAX_INLINE_DEPTH) for field, value in properties.items())
+                lines.append(f"- {name}: {fields}")
+            else:
+                lines.append(f"- {name}: {type_name(schema, MAX_INLINE_DEPTH)}")
+    return "\n".join(lines) + "\n"
+
+
+def compact_attachment(path: os.PathLike) -> Optional[str]:
+    """
+    The compact summary of an OpenAPI attachment, from its cached summary when it is up to date,
+    or None if the attachment is not an OpenAPI or Swagger document.
+    """
+    path = Path(path)
+    text = path.read_text()
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    cached = compact_path(path)
+    if cached.is_file():
+        content = cached.read_text()
+        if (match := HEADER_PATTERN.match(content)) and match["digest"] == digest and int(match["version"]) == COMPACT_VERSION:
+            return content[match.end():]
+
+    if (document := parse_document(text)) is None:
+        return None
+    summary = summarize(document)
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cached.with_name(f".{cached.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(f"<!-- compacted from {path.name} (sha256 {digest}, v{COMPACT_VERSION}) -->\n{summary}")
+        os.replace(tmp_path, cached)
+    except OSError as e:
+        # e.g. an unwritable cache folder; the summary is still used, just not kept
+        logger.warning(f"Could not cache the compact summary of {path}: {e}")
+    logger.info(f"Compacted {path.name}: {len(text)} -> {len(summary)} characters")
+    return summary
+
+
+def compact_attachments(attachments: dict[str, Path], slug: str) -> dict[str, str]:
+    """The compact summaries of those `attachments` (substitution name to file) that are OpenAPI documents."""
+    summaries = {}
+    for name, path in attachments.items():
+        try:
+            summary = compact_attachment(path)
+        except Exception as e:
+            logger.warning(f"Could not compact {path.name} of {slug}, using it as is: {e}")
+            continue
+        if summary is not None:
+            summaries[name] = summary
+    return summaries
@@ -0,0 +1,49 @@
+"""
+Data file profile summaries (`<file>.profile.md`, written by `python -m biome.datasets build profiles`), as appended
+to the documentation of the specifications referencing the files.
+"""
+import re
+from pathlib import Path
+from typing import Callable, Optional
+
+SUMMARY_SUFFIX = ".profile.md"
+FILE_TAG_PATTERN = re.compile(r"{%\s*file\s+(\S+?)\s*%}")
+PROFILES_HEADER = "\n\n# Data file profiles\nPrecomputed profiles of the data files above; use them instead of loading a file just to inspect it.\n\n"
+
+
+def summary_path(path: Path) -> Path:
+    return path.with_name(path.name + SUMMARY_SUFFIX)
+
+
+def summaries_of(target: Path) -> list[Path]:
+    """The profile summary of a data file, or those of every profiled file in a folder."""
+    if target.is_file():
+        candidates = [summary_path(target)]
+    elif target.is_dir():
+        candidates = sorted(
+            path for path in target.rglob(f"*{SUMMARY_SUFFIX}")
+            if not any(part.startswith((".", "_")) for part in path.relative_to(target).parts)
+        )
+    else:
+        candidates = []
+    return [path for path in candidates if path.is_file()]
+
+
+def referenced_summaries(source: str, resolve: Callable[[str], Optional[Path]]) -> list[Path]:
+    """
+    Profile summaries of the data files (or folders of files) a specification references with `{% file %}`.
+
+    `resolve` maps a `{% file %}` argument to a path, or None if it can't be found.
+    """
+    summaries: list[Path] = []
+    for relative in dict.fromkeys(FILE_TAG_PATTERN.findall(source)):
+        if (target := resolve(relative)) is not None:
+            summaries.extend(path for path in summaries_of(target) if path not in summaries)
+    return summaries
+
+
+def profiles_section(summaries: list[Path]) -> str:
+    """The documentation section listing the summaries, empty if there are none."""
+    if not summaries:
+        return ""
+    return PROFILES_HEADER + "\n".join(summary.read_text() for summary in summaries)
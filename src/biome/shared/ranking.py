@@ -0,0 +1,99 @@
+"""
+BM25 ranking, and the relevance-ranked selection of examples built on it.
+
+Before drafting, the curator is asked which of an integration's examples solve or relate to the request. Instead of
+listing every example in that prompt, the examples are ranked against the request and the curator only picks from the
+best ones: up to `BIOME_MAX_EXAMPLES` examples and about `BIOME_EXAMPLES_MAX_TOKENS` tokens. The retrieved sections of
+large attachments are ranked with `BM25` too (see `retrieval.py`).
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Iterable
+
+DEFAULT_MAX_EXAMPLES = 12
+DEFAULT_EXAMPLES_MAX_TOKENS = 4000
+CHARS_PER_TOKEN = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i in is it me my of on or show that the this to what which with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    # camelCase and snake_case identifiers match their words
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text).lower()
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+
+
+class BM25:
+    """Okapi BM25 ranking of a fixed list of documents."""
+
+    def __init__(self, documents: Iterable[str]):
+        self.term_counts = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths) if self.lengths else 0) or 1
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(self.term_counts)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query: str) -> list[float]:
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            normalization = BM25_K1 * (1 - BM25_B + BM25_B * length / self.average_length)
+            for term in terms:
+                if frequency := counts.get(term):
+                    score += self.idf[term] * frequency * (BM25_K1 + 1) / (frequency + normalization)
+            scores.append(score)
+        return scores
+
+    def search(self, query: str) -> list[int]:
+        """Indices of the documents matching any term of the query, best first."""
+        scores = self.scores(query)
+        return sorted((index for index, score in enumerate(scores) if score > 0), key=lambda index: -scores[index])
+
+
+def example_limits() -> tuple[int, int]:
+    """How many examples, and about how many tokens of them, the curator is given per request."""
+    return (
+        max(1, int(os.environ.get("BIOME_MAX_EXAMPLES") or DEFAULT_MAX_EXAMPLES)),
+        max(1, int(os.environ.get("BIOME_EXAMPLES_MAX_TOKENS") or DEFAULT_EXAMPLES_MAX_TOKENS)),
+    )
+
+
+class ExampleIndex:
+    """BM25 ranking of an integration's examples against the requests they may solve."""
+
+    def __init__(self, examples: list[dict]):
+        self.examples = examples
+        self.bm25 = BM25(
+            f"{example.get('query') or ''}\n{example.get('notes') or ''}\n{example.get('code') or ''}" for example in examples
+        )
+
+    def rank(self, query: str) -> list[int]:
+        """Indices of every example, those matching the query best first, then the others in their original order."""
+        ranked = self.bm25.search(query)
+        matched = set(ranked)
+        return ranked + [index for index in range(len(self.examples)) if index not in matched]
+
+    def select(self, query: str, max_examples: int, max_tokens: int) -> list[dict]:
+        """The best examples for the query, up to `max_examples` and about `max_tokens` in total; at least one."""
+        selected: list[dict] = []
+        tokens = 0.0
+        for index in self.rank(query)[:max_examples]:
+            example = self.examples[index]
+            size = sum(len(example.get(field) or "") for field in ("query", "notes", "code")) / CHARS_PER_TOKEN
+            if selected and tokens + size > max_tokens:
+                break
+            selected.append(example)
+            tokens += size
+        return selected
@@ -0,0 +1,153 @@
+"""
+Retrieval over the large attachments of a specification.
+
+Specifications that set `retrieval: true` in their `api.yaml` keep only a fixed core in the drafter's system prompt:
+their own text (the `source` template) with the small attachments inlined. Each large attachment is split into
+chunks at Markdown headings, then blank lines, then lines, and the chunks are indexed with BM25. The chunks most
+relevant to each question or task are attached to it when it is sent to the drafter, skipping those already sent
+earlier in the same conversation.
+
+`retrieval: {top_k: 12}` changes how many chunks are attached per message (default `DEFAULT_TOP_K`).
+
+Examples are ranked the same way, for every specification (see `ranking.py`). The kernel and the REST API both
+retrieve this way.
+"""
+import re
+from typing import Callable, Iterable, Optional
+
+from .ranking import BM25
+
+CHUNK_CHARS = 2000
+DEFAULT_TOP_K = 8
+# Attachments up to this size stay inline in the core.
+INLINE_MAX_CHARS = 4000
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$")
+RETRIEVED_PLACEHOLDER = "(Only the sections of `{filepath}` most relevant to each request are included, attached to the request.)"
+
+
+def _split(text: str, max_chars: int) -> list[str]:
+    """Pieces of at most `max_chars`, split at blank lines, then at lines, then anywhere."""
+    if len(text) <= max_chars:
+        return [text]
+    for separator in ("\n\n", "\n"):
+        parts = text.split(separator)
+        if len(parts) > 1:
+            break
+    else:
+        return [text[start:start + max_chars] for start in range(0, len(text), max_chars)]
+
+    pieces, current = [], ""
+    for part in parts:
+        candidate = f"{current}{separator}{part}" if current else part
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if len(part) > max_chars:
+            pieces.extend(_split(part, max_chars))
+            current = ""
+        else:
+            current = part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text: str, source: str, max_chars: int = CHUNK_CHARS) -> list[dict]:
+    """Chunks of a document as `{"source", "heading", "text"}`, each under the Markdown heading it falls in."""
+    sections: list[tuple[str, str]] = []
+    lines: list[str] = []
+    heading = ""
+    in_fence = False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_PATTERN.match(line)
+        if match and lines:
+            sections.append((heading, "\n".join(lines)))
+            lines = []
+        if match:
+            heading = match[1]
+        lines.append(line)
+    if lines:
+        sections.append((heading, "\n".join(lines)))
+
+    return [
+        {"source": source, "heading": heading, "text": piece}
+        for heading, section in sections
+        for piece in _split(section, max_chars)
+        if piece.strip()
+    ]
+
+
+def split_attachments(attachments: dict[str, tuple[str, str]]) -> tuple[dict[str, str], list[dict]]:
+    """
+    For attachments given as `{name: (filepath, text)}`: the placeholder substituted for each one larger than
+    `INLINE_MAX_CHARS`, by name, and the chunks of those.
+    """
+    placeholders: dict[str, str] = {}
+    chunks: list[dict] = []
+    for name, (filepath, text) in attachments.items():
+        if len(text) <= INLINE_MAX_CHARS:
+            continue
+        chunks.extend(chunk_text(text, filepath))
+        placeholders[name] = RETRIEVED_PLACEHOLDER.format(filepath=filepath)
+    return placeholders, chunks
+
+
+def retrieval_top_k(options) -> int:
+    """The number of chunks to attach per message, from the `retrieval` option of an `api.yaml`."""
+    return options.get("top_k", DEFAULT_TOP_K) if isinstance(options, dict) else DEFAULT_TOP_K
+
+
+class DocumentIndex:
+    """The chunks of a specification's retrieved attachments and their BM25 index."""
+
+    def __init__(self, chunks: list[dict], top_k: int = DEFAULT_TOP_K):
+        self.chunks = chunks
+        self.top_k = top_k
+        self.bm25 = BM25(f"{chunk['source']} {chunk['heading']}\n{chunk['text']}" for chunk in chunks)
+
+    def relevant(self, query: str, exclude: Iterable[int] = ()) -> list[int]:
+        """The `top_k` chunks most relevant to the query, not counting `exclude`, in document order."""
+        exclude = set(exclude)
+        ranked = [index for index in self.bm25.search(query) if index not in exclude]
+        return sorted(ranked[:self.top_k])
+
+    def format(self, indices: Iterable[int]) -> str:
+        sections = []
+        for index in indices:
+            chunk = self.chunks[index]
+            title = f"{chunk['source']} > {chunk['heading']}" if chunk["heading"] else chunk["source"]
+            sections.append(f"### {title}\n{chunk['text']}")
+        return "\n\n".join(sections)
+
+
+class RetrievingDrafter:
+    """
+    A drafter agent that attaches the documentation chunks relevant to each message it is sent. Chunks are ranked
+    against `request()` when it returns the request being answered (its context-free form, without the tags and
+    examples added to the message), else against the message itself.
+    """
+
+    def __init__(self, agent, index: DocumentIndex, request: Optional[Callable[[], Optional[str]]] = None):
+        self.agent = agent
+        self.index = index
+        self.request = request
+        # chunks already in the conversation
+        self.sent: set[int] = set()
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    def message(self, query: str, *args, **kwargs) -> str:
+        indices = self.index.relevant((self.request and self.request()) or query, exclude=self.sent)
+        if indices:
+            self.sent.update(indices)
+            query = (
+                f"{query}\n\n(system note: The following documentation sections were retrieved as the most relevant to "
+                f"the above. Sections retrieved for earlier messages still apply.\n\n{self.index.format(indices)}\n)"
+            )
+        return self.agent.message(query, *args, **kwargs)
@@ -0,0 +1,218 @@
+"""
+Near-duplicate request cache for the specialist agents.
+
+Requests are often rephrasings of earlier ones ("find colorectal studies", "list colorectal cancer studies in
+cBioPortal"). Each answered request is kept per integration and request type (question or code), as the set of its
+meaningful words: stopwords and request verbs are dropped, plurals folded ("studies" is "study"), and so are the words
+every request to the integration implies, its name and what its description is about ("cancer" for cBioPortal, see
+`integration_words`). A new request whose set has a Jaccard similarity of at least `BIOME_SEMANTIC_CACHE_THRESHOLD`
+(default 0.8) with a cached one gets the cached answer instead of a drafter call. Its key words must match the cached
+request's exactly: numbers, identifiers (words with digits or several capitals, such as gene symbols, `TCGA-BRCA` or
+`HbA1c`) and negations, so "BRAF mutations" never gets the answer to "KRAS mutations", nor "samples without mutation
+data" the answer to "samples with mutation data". Candidates are found with a MinHash LSH index, then compared exactly.
+
+The comparison uses the context-free form of the request (see adhoc-api's contextualizer), so a follow-up that
+depends on the conversation is matched on what it means in that conversation. The cache lives in memory, and an
+integration's entries are dropped when it is replaced. It is off unless `BIOME_SEMANTIC_CACHE=true`.
+
+Shared by the kernel and the REST API, which also reports the matched request in its response (`matched_query`).
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .ranking import STOPWORDS, tokenize
+
+DEFAULT_THRESHOLD = 0.8
+MAX_ENTRIES_PER_INTEGRATION = 1000
+# How often, and at least which share of its words, a word must make up of an integration's description for every
+# request to the integration to imply it
+IMPLIED_WORD_MIN_COUNT = 4
+IMPLIED_WORD_MIN_SHARE = 0.05
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS = NUM_PERMUTATIONS // BANDS
+GENERIC_WORDS = frozenset(
+    "all any api display fetch find get give like list need please provide retrieve return search some tell using via"
+    " want would".split()
+)
+NEGATIONS = frozenset("except exclude excluded excluding excludes lacking neither never no non nor not without".split())
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+")
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(0)
+_PERMUTATIONS = [(_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def semantic_cache_enabled() -> bool:
+    return os.environ.get("BIOME_SEMANTIC_CACHE", "false").lower() in ("true", "1", "yes")
+
+
+def semantic_cache_threshold() -> float:
+    return float(os.environ.get("BIOME_SEMANTIC_CACHE_THRESHOLD") or DEFAULT_THRESHOLD)
+
+
+def singular(word: str) -> str:
+    """The singular of a lowercase plural ("studies", "classes", "matches", "genes"); other words as they are."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _is_identifier(word: str) -> bool:
+    return any(character.isdigit() for character in word) or sum(character.isupper() for character in word) >= 2
+
+
+def integration_words(slug: str, spec: dict) -> frozenset:
+    """
+    The words every request to an integration implies: its slug and name, and the words (not identifiers) of the
+    first sentence of its description, which says what the integration is about, that the description keeps coming
+    back to (at least `IMPLIED_WORD_MIN_COUNT` times and `IMPLIED_WORD_MIN_SHARE` of its words). Plurals folded.
+    """
+    def words_of(text: str) -> list[str]:
+        return [
+            singular(token) for word in WORD_PATTERN.findall(text) if not _is_identifier(word)
+            for token in tokenize(word) if len(token) > 2
+        ]
+
+    description = spec.get("description") or ""
+    counts = Counter(words_of(description))
+    implied = set(words_of(re.split(r"(?<=[.!?])\s", description, maxsplit=1)[0]))
+    words = {slug.casefold(), (spec.get("name") or "").casefold(), *tokenize(slug), *tokenize(spec.get("name") or "")}
+    minimum = max(IMPLIED_WORD_MIN_COUNT, IMPLIED_WORD_MIN_SHARE * sum(counts.values()))
+    words.update(word for word in implied if counts[word] >= minimum and word not in STOPWORDS)
+    return frozenset(words - {""})
+
+
+def terms(query: str, ignore: frozenset = frozenset()) -> frozenset:
+    """The meaningful words of a request, plurals folded."""
+    words = set()
+    for word in WORD_PATTERN.findall(query):
+        if word.casefold() in ignore:
+            continue
+        for token in tokenize(word):
+            if token in GENERIC_WORDS or token in ignore or singular(token) in ignore:
+                continue
+            words.add(singular(token))
+    return frozenset(words)
+
+
+def key_terms(query: str, ignore: frozenset = frozenset()) -> frozenset:
+    """
+    The words of a request that another must share exactly to reuse its answer: numbers and identifiers (words with
+    a digit or at least two capitals, casefolded) other than the integration's name, and negations.
+    """
+    keys = {token for token in tokenize(query) if token in NEGATIONS}
+    for word in WORD_PATTERN.findall(query):
+        if not _is_identifier(word):
+            continue
+        if word.casefold() in ignore or set(tokenize(word)) <= ignore | GENERIC_WORDS:
+            continue
+        keys.add(word.casefold())
+    return frozenset(keys)
+
+
+def minhash(words: frozenset) -> tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big") for word in words]
+    return tuple(min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS)
+
+
+def annotate(response: str, matched: str, code: bool) -> str:
+    """The cached response, noting the request it was the answer to."""
+    note = f'Reused the answer to the similar earlier request "{matched}".'
+    if not code:
+        return f"({note})\n\n{response}"
+    annotated, replaced = re.subn(r"(```[\w+-]*\n)", lambda match: f"{match[1]}# {note}\n", response, count=1)
+    return annotated if replaced else f"# {note}\n{response}"
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    words: frozenset
+    keys: frozenset
+    response: str
+
+
+@dataclass
+class _Group:
+    """The cached answers of one integration and request type, with their LSH buckets."""
+    entries: OrderedDict = field(default_factory=OrderedDict)
+    buckets: dict = field(default_factory=dict)
+
+    def bands(self, signature: tuple[int, ...]) -> list[tuple]:
+        return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_entries: int = MAX_ENTRIES_PER_INTEGRATION):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.groups: dict[tuple[str, str], _Group] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        return cls(threshold=semantic_cache_threshold()) if semantic_cache_enabled() else None
+
+    def lookup(self, api: str, kind: str, query: str, ignore: frozenset = frozenset()) -> Optional[CachedAnswer]:
+        """The cached answer to the most similar earlier request, if it is similar enough."""
+        words, keys = terms(query, ignore), key_terms(query, ignore)
+        exact = " ".join(query.split()).casefold()
+        with self.lock:
+            group = self.groups.get((api, kind))
+            if group is None:
+                return None
+            if exact in group.entries:
+                group.entries.move_to_end(exact)
+                return group.entries[exact]
+            if not words:
+                return None
+            candidates = set()
+            for band in group.bands(minhash(words)):
+                candidates.update(group.buckets.get(band, ()))
+            best, best_similarity = None, 0.0
+            for key in candidates:
+                entry = group.entries[key]
+                if entry.keys != keys:
+                    continue
+                similarity = len(entry.words & words) / len(entry.words | words)
+                if similarity > best_similarity:
+                    best, best_similarity = key, similarity
+            if best is None or best_similarity < self.threshold:
+                return None
+            group.entries.move_to_end(best)
+            return group.entries[best]
+
+    def store(self, api: str, kind: str, query: str, response: str, ignore: frozenset = frozenset()) -> None:
+        words, keys = terms(query, ignore), key_terms(query, ignore)
+        exact = " ".join(query.split()).casefold()
+        with self.lock:
+            group = self.groups.setdefault((api, kind), _Group())
+            if exact in group.entries:
+                self._unindex(group, exact)
+            group.entries[exact] = CachedAnswer(query=query, words=words, keys=keys, response=response)
+            if words:
+                for band in group.bands(minhash(words)):
+                    group.buckets.setdefault(band, set()).add(exact)
+            while len(group.entries) > self.max_entries:
+                self._unindex(group, next(iter(group.entries)))
+
+    def _unindex(self, group: _Group, key: str) -> None:
+        entry = group.entries.pop(key)
+        if entry.words:
+            for band in group.bands(minhash(entry.words)):
+                group.buckets.get(band, set()).discard(key)
+
+    def clear(self, api: str) -> None:
+        with self.lock:
+            for group_key in [group_key for group_key in self.groups if group_key[0] == api]:
+                del self.groups[group_key]
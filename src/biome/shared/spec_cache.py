@@ -0,0 +1,146 @@
+"""
+Compiled cache of the loaded integration specs.
+
+Loading a spec parses its `api.yaml`, inlines its attachments and substitutes the dataset paths, which for the large
+integrations (OpenAPI documents, mappings, ...) dominates startup. The result is stored per integration directory
+in `BIOME_SPEC_CACHE_DIR` (default `~/.cache/biome/specs`), keyed by a sha256 over the content of every file in the
+directory plus a salt for everything else the result depends on (loader version, data folder). A directory whose
+files did not change is deserialized from its entry; a changed directory is loaded again and only its entry is
+replaced.
+
+Each entry also holds the spec's name, slug and description, so integrations can be listed without deserializing
+their documentation (see `load_summary`). File digests are reused from the previous entry while a file's size and
+modification time are unchanged, so an unchanged directory is not re-read either. The kernel keys its own cache of
+rendered specifications (under `kernel/` in the same folder) on the same file digests.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+# Spec fields kept in the entry itself, enough to list an integration without reading its spec.
+SUMMARY_FIELDS = ("name", "slug", "description")
+
+
+def get_cache_dir() -> Path:
+    if cache_dir := os.environ.get("BIOME_SPEC_CACHE_DIR"):
+        return Path(cache_dir)
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "biome" / "specs"
+
+
+def entry_path(directory: Path, cache_dir: Optional[Path] = None) -> Path:
+    # the directory's full path is part of the name, so two integration roots never share entries
+    suffix = hashlib.sha256(str(directory.resolve()).encode()).hexdigest()[:12]
+    return (cache_dir or get_cache_dir()) / f"{directory.name}-{suffix}.json"
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digests(directory: Path, previous: Optional[dict] = None) -> dict[str, list]:
+    """`[size, mtime_ns, sha256]` of every file in the directory, reusing unchanged digests from `previous`."""
+    previous = previous or {}
+    digests = {}
+    for path in sorted(directory.rglob("*")):
+        relative = path.relative_to(directory)
+        if not path.is_file() or any(part.startswith(".") for part in relative.parts):
+            continue
+        stat = path.stat()
+        known = previous.get(relative.as_posix())
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            digests[relative.as_posix()] = known
+        else:
+            digests[relative.as_posix()] = [stat.st_size, stat.st_mtime_ns, _sha256(path)]
+    return digests
+
+
+def content_key(digests: dict[str, list], salt: str = "") -> str:
+    content = {relative: digest[2] for relative, digest in digests.items()}
+    return hashlib.sha256(json.dumps([CACHE_VERSION, salt, content], sort_keys=True).encode()).hexdigest()
+
+
+def _read_json(path: Path) -> Optional[dict]:
+    try:
+        with path.open() as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: Path, content: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("w") as f:
+            json.dump(content, f)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def spec_path(path: Path) -> Path:
+    """The (large) spec stored for an entry, kept apart so reading the entry's summary stays cheap."""
+    return path.with_name(path.name.removesuffix(".json") + ".spec.json")
+
+
+def _refresh(directory: Path, load: Callable[[Path], dict], salt: str, cache_dir: Optional[Path]) -> tuple[dict, Optional[dict]]:
+    """The up to date entry of a directory; the spec is only returned if it had to be loaded."""
+    path = entry_path(directory, cache_dir)
+    entry = _read_json(path) or {}
+    digests = file_digests(directory, previous=entry.get("files"))
+    key = content_key(digests, salt)
+    if entry.get("key") == key and spec_path(path).is_file():
+        return entry, None
+
+    spec = load(directory)
+    entry = {
+        "key": key,
+        "directory": str(directory),
+        "files": digests,
+        "summary": {field: spec.get(field) for field in SUMMARY_FIELDS},
+    }
+    try:
+        _write_json(spec_path(path), {"key": key, "spec": spec})
+        _write_json(path, entry)
+    except (OSError, TypeError, ValueError) as e:
+        # an unwritable cache folder or a value JSON cannot hold only costs the next start a reload
+        logger.warning(f"Could not cache the spec of {directory}: {e}")
+    return entry, spec
+
+
+def load_cached(
+    directory: Path, load: Callable[[Path], dict], salt: str = "", cache_dir: Optional[Path] = None,
+) -> tuple[dict, bool]:
+    """
+    The spec `load(directory)` returns, from the cache when no file in the directory changed since it was stored.
+    The second value is True if it came from the cache.
+    """
+    entry, spec = _refresh(directory, load, salt, cache_dir)
+    if spec is not None:
+        return spec, False
+    stored = _read_json(spec_path(entry_path(directory, cache_dir))) or {}
+    if stored.get("key") != entry["key"]:
+        # replaced by another process in between, load it ourselves
+        return load(directory), False
+    return stored["spec"], True
+
+
+def load_summary(
+    directory: Path, load: Callable[[Path], dict], salt: str = "", cache_dir: Optional[Path] = None,
+) -> tuple[dict, str, bool]:
+    """
+    Only the name, slug and description of the spec, which is loaded and cached first if the directory changed,
+    with the directory's content key. The last value is True if the spec was already cached.
+    """
+    entry, spec = _refresh(directory, load, salt, cache_dir)
+    return entry["summary"], entry["key"], spec is None
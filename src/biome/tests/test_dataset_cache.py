@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from biome.datasets.cache import DatasetCache
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "table.csv"
+    pd.DataFrame({"a": [1, 2], "b": [3, 4], "c": [5, 6], "d": [7, 8]}).to_csv(path, index=False)
+    return path
+
+
+def test_literal_arguments_are_cached(csv_path):
+    cache = DatasetCache()
+    cache.load(pd.read_csv, csv_path, usecols=["a"])
+    frame = cache.load(pd.read_csv, csv_path, usecols=["a"])
+    assert list(frame.columns) == ["a"]
+    assert (cache.hits, cache.misses, len(cache.entries)) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("usecols", [
+    lambda columns: lambda column: column in columns,
+    lambda columns: np.array(columns),
+])
+def test_other_arguments_are_not_cached(csv_path, usecols):
+    cache = DatasetCache()
+    read = [list(cache.load(pd.read_csv, csv_path, usecols=usecols(columns)).columns) for columns in (["a"], ["b"], ["c", "d"])]
+    assert read == [["a"], ["b"], ["c", "d"]]
+    assert not cache.entries
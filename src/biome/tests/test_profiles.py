@@ -0,0 +1,29 @@
+import pytest
+
+from biome.datasets.profiles import profile_file
+
+TRI_ROWS = (
+    "Year,TRI Facility ID,State,Releases (lb)\n"
+    '2014,F1,TX,"1,200",\n'
+    "2015,F2,CA,30,\n"
+)
+
+
+@pytest.mark.parametrize("name, text", [
+    ("tri.csv", TRI_ROWS),
+    ("tri.tsv", TRI_ROWS.replace('"1,200"', "1200").replace(",", "\t")),
+], ids=["csv", "tsv"])
+def test_trailing_delimiter(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    profile = profile_file(path)
+    assert profile["rows"] == 2
+    assert list(profile["columns"]) == ["Year", "TRI Facility ID", "State", "Releases (lb)"]
+
+
+def test_without_trailing_delimiter(tmp_path):
+    path = tmp_path / "table.csv"
+    path.write_text("a,b\n1,x\n2,y\n")
+    profile = profile_file(path)
+    assert profile["rows"] == 2
+    assert profile["columns"]["a"]["type"] == "int64"
@@ -0,0 +1,23 @@
+import pyarrow.parquet as pq
+
+from biome.datasets import profiles
+from biome.datasets.samples import write_samples
+
+
+def test_tri_file(tmp_path, monkeypatch):
+    # small blocks, so the thousands separators further down contradict the type inferred from the first block
+    monkeypatch.setattr(profiles, "CSV_BLOCK_SIZE", 1024)
+    path = tmp_path / "tri.csv"
+    rows = [f"2014,F{index % 50},S{index % 5},{index}," for index in range(1000)]
+    rows[-1] = '2023,F1,S1,"1,200",'
+    path.write_text("Year,TRI Facility ID,State,Releases (lb)\n" + "\n".join(rows) + "\n")
+    destinations = {"10pct": tmp_path / "tri.10pct.parquet", "1pct": tmp_path / "tri.1pct.parquet"}
+    counts = write_samples(path, destinations, ["TRI Facility ID"], ["State"])
+    assert counts == {"rows": 1000, "sample_rows": {"10pct": 100, "1pct": 100}}
+    sample = pq.read_table(destinations["10pct"]).to_pandas()
+    assert list(sample.columns) == ["Year", "TRI Facility ID", "State", "Releases (lb)"]
+    # one of the ten facilities of each state, with all their rows
+    assert sample.groupby("State")["TRI Facility ID"].nunique().to_dict() == {f"S{state}": 1 for state in range(5)}
+    assert (sample["TRI Facility ID"].value_counts() == 20).all()
+    smaller = pq.read_table(destinations["1pct"]).to_pandas()
+    assert set(smaller["TRI Facility ID"]) <= set(sample["TRI Facility ID"])
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+from biome.shared.semantic_cache import SemanticCache, integration_words, singular
+
+CBIOPORTAL = Path(__file__).parents[3] / "adhoc_data" / "specifications" / "cbioportal" / "api.yaml"
+IGNORE = integration_words("cbioportal", yaml.safe_load(CBIOPORTAL.read_text()))
+
+
+def reused(cached: str, query: str) -> bool:
+    cache = SemanticCache()
+    cache.store("cbioportal", "ask", cached, "answer", IGNORE)
+    return cache.lookup("cbioportal", "ask", query, IGNORE) is not None
+
+
+@pytest.mark.parametrize("cached, query", [
+    ("find colorectal studies", "list colorectal cancer studies in cBioPortal"),
+    ("colorectal cancer studies", "show me the colorectal cancer studies"),
+])
+def test_rephrasing(cached, query):
+    assert reused(cached, query)
+
+
+@pytest.mark.parametrize("cached, query", [
+    ("How many samples have BRAF mutations?", "How many samples have KRAS mutations?"),
+    ("list samples with mutation data", "list samples without mutation data"),
+    ("BRAF mutations in 2020", "BRAF mutations in 2021"),
+    ("find colorectal studies", "find colorectal studies with methylation data"),
+])
+def test_different_requests(cached, query):
+    assert not reused(cached, query)
+
+
+@pytest.mark.parametrize("plural, word", [
+    ("studies", "study"), ("classes", "class"), ("matches", "match"), ("genes", "gene"), ("status", "status"),
+])
+def test_singular(plural, word):
+    assert singular(plural) == word
+
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("BIOME_SEMANTIC_CACHE", raising=False)
+    assert SemanticCache.from_env() is None
+    monkeypatch.setenv("BIOME_SEMANTIC_CACHE", "true")
+    assert SemanticCache.from_env() is not None
@@ -0,0 +1,59 @@
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from biome.datasets.sql import LocalSQLEngine
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / "data"
+    (data_dir / "census_ahs").mkdir(parents=True)
+    (data_dir / "census_ahs" / "survey.csv").write_text("CONTROL,YEAR,COST\na,2019x,10\nb,2021x,20\n")
+    for year, columns in [
+        (2019, {"CONTROL": ["a"], "YEAR": ["2019x"]}),
+        (2021, {"CONTROL": ["b"], "YEAR": ["2021x"], "COST": [20]}),
+    ]:
+        partition = data_dir / "census_ahs" / "harmonized" / f"year={year}"
+        partition.mkdir(parents=True)
+        pq.write_table(pa.table(columns), partition / "part-0.parquet")
+    return data_dir
+
+
+@pytest.fixture
+def engine(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setenv("BIOME_SQL_TEMP_DIR", str(tmp_path / "spill"))
+    return LocalSQLEngine(data_dir)
+
+
+def test_query(engine):
+    assert engine.query("SELECT SUM(COST) AS total FROM census_ahs.survey").splitlines() == ["total", "30"]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1; COPY (SELECT 1) TO '{target}'",
+    "COPY (SELECT 1) TO '{target}'",
+    "EXPLAIN ANALYZE COPY (SELECT 1) TO '{target}'",
+    "SELECT 1; ATTACH '{target}' AS other",
+])
+def test_rejects_writes(engine, tmp_path, sql):
+    target = tmp_path / "written.csv"
+    assert engine.query(sql.format(target=target)).startswith("Only a single read-only statement")
+    assert not target.exists()
+
+
+def test_cannot_write_outside_data_dir(engine, tmp_path):
+    target = tmp_path / "written.csv"
+    with pytest.raises(duckdb.Error):
+        engine.connection.execute(f"COPY (SELECT 1) TO '{target}'")
+    with pytest.raises(duckdb.Error):
+        engine.connection.execute("SET enable_external_access = true")
+    assert not target.exists()
+
+
+def test_hive_table(engine):
+    rows = engine.query(
+        "SELECT CONTROL, YEAR, COST, year_partition FROM census_ahs.harmonized ORDER BY CONTROL"
+    ).splitlines()
+    assert rows == ["CONTROL | YEAR | COST | year_partition", "a | 2019x |  | 2019", "b | 2021x | 20 | 2021"]